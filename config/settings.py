@@ -16,6 +16,11 @@ USE_GEMINI_PRIMARY = os.environ.get("USE_GEMINI_PRIMARY", "true").lower() == "tr
 
 # Embedding tiếng Việt mạnh (768-d)
 EMBEDDING_MODEL_NAME = "sentence-transformers/paraphrase-multilingual-mpnet-base-v2"
+# Backend embedding: "torch" (mặc định, fp32), "onnx" (ONNX Runtime fp32), "onnx-int8" (lượng tử hóa động int8),
+# "remote" (gọi servers.embedding_service: mọi process dùng chung một bản mô hình)
+EMBEDDING_BACKEND = os.environ.get("EMBEDDING_BACKEND", "torch").lower()
+# Số thread CPU cho ONNX Runtime (0 = để ORT tự chọn)
+EMBEDDING_NUM_THREADS = int(os.environ.get("EMBEDDING_NUM_THREADS", "0"))
 
 # Gemini model (nếu có internet + API key)
 LLM_MODEL_NAME = os.environ.get("LLM_MODEL_NAME", "gemini-2.5-flash")
@@ -23,21 +28,134 @@ LLM_MODEL_NAME = os.environ.get("LLM_MODEL_NAME", "gemini-2.5-flash")
 # Ollama local model (cài ngoài ổ D:, nhưng API mặc định 11434)
 OLLAMA_BASE_URL = os.environ.get("OLLAMA_BASE_URL", "http://localhost:11434")
 OLLAMA_MODEL_NAME = os.environ.get("OLLAMA_MODEL_NAME", "qwen2.5:7b")
+# Dùng API gốc /api/chat (có keep_alive, options, tách tin nhắn system) thay cho /v1/chat/completions
+OLLAMA_NATIVE_API = os.environ.get("OLLAMA_NATIVE_API", "true").lower() == "true"
+# Giữ model trong RAM/VRAM bao lâu sau request cuối (vd "30m", "-1" = mãi mãi)
+OLLAMA_KEEP_ALIVE = os.environ.get("OLLAMA_KEEP_ALIVE", "30m")
+# Độ dài ngữ cảnh, số token trả lời tối đa, số thread CPU (0 = để Ollama tự chọn)
+OLLAMA_NUM_CTX = int(os.environ.get("OLLAMA_NUM_CTX", "4096"))
+OLLAMA_NUM_PREDICT = int(os.environ.get("OLLAMA_NUM_PREDICT", "512"))
+OLLAMA_NUM_THREAD = int(os.environ.get("OLLAMA_NUM_THREAD", "0"))
+# Ping nạp sẵn model mỗi chừng này giây khi không có request (0 = tắt)
+OLLAMA_WARM_PING_INTERVAL = float(os.environ.get("OLLAMA_WARM_PING_INTERVAL", "240"))
+
+# Định tuyến LLM: "priority" (Gemini rồi Ollama) hoặc "latency" (backend có p50 gần đây thấp hơn đi trước)
+LLM_ROUTING = os.environ.get("LLM_ROUTING", "priority").lower()
+# Số lần gọi gần nhất dùng để tính p50/p95 và tỉ lệ lỗi của mỗi backend
+LLM_LATENCY_WINDOW = int(os.environ.get("LLM_LATENCY_WINDOW", "50"))
+# Circuit breaker: lỗi liên tiếp chừng này lần thì bỏ qua backend trong LLM_BREAKER_COOLDOWN giây
+LLM_BREAKER_FAILURES = int(os.environ.get("LLM_BREAKER_FAILURES", "3"))
+LLM_BREAKER_COOLDOWN = float(os.environ.get("LLM_BREAKER_COOLDOWN", "30"))
+# Hedging: backend đầu chưa trả chữ nào sau chừng này giây thì gọi thêm backend kế, lấy bên nào trả trước (0 = tắt)
+LLM_HEDGE_AFTER_S = float(os.environ.get("LLM_HEDGE_AFTER_S", "0"))
+# Hedging cho lời gọi không streaming (generate_answer): chữ đầu tiên chỉ có khi xong cả câu trả lời,
+# nên cần hạn dài hơn LLM_HEDGE_AFTER_S (0 = tắt)
+LLM_HEDGE_AFTER_BLOCKING_S = float(os.environ.get("LLM_HEDGE_AFTER_BLOCKING_S", "0"))
 
 # --- Paths (phải định nghĩa trước khi dùng) ---
 BASE_DIR = os.path.dirname(os.path.dirname(__file__))
 DATA_DIR = os.path.join(BASE_DIR, "data")
 LOG_DIR = os.path.join(BASE_DIR, "logs")
 
+# Thư mục chứa mô hình embedding đã export sang ONNX (tạo bởi scripts/check_onnx_embedding.py --export)
+EMBEDDING_ONNX_DIR = os.environ.get("EMBEDDING_ONNX_DIR", os.path.join(DATA_DIR, "models", "embedding_onnx"))
+
+# --- Embedding service dùng chung (EMBEDDING_BACKEND=remote) ---
+EMBEDDING_SERVICE_HOST = os.environ.get("EMBEDDING_SERVICE_HOST", "0.0.0.0")
+EMBEDDING_SERVICE_PORT = int(os.environ.get("EMBEDDING_SERVICE_PORT", "8003"))
+# Để trống thì suy ra từ HOST/PORT ở trên
+EMBEDDING_SERVICE_URL = os.environ.get("EMBEDDING_SERVICE_URL", "")
+# Backend mà chính service dùng để nạp mô hình ("torch" | "onnx" | "onnx-int8")
+EMBEDDING_SERVICE_BACKEND = os.environ.get("EMBEDDING_SERVICE_BACKEND", "torch").lower()
+EMBEDDING_SERVICE_TIMEOUT = float(os.environ.get("EMBEDDING_SERVICE_TIMEOUT", "60"))
+# Client chờ service sẵn sàng tối đa chừng này giây, sau đó tự nạp mô hình tại chỗ
+EMBEDDING_SERVICE_WAIT = float(os.environ.get("EMBEDDING_SERVICE_WAIT", "60"))
+# Gộp các request đến trong cửa sổ này thành một forward pass (tối đa EMBEDDING_MAX_BATCH văn bản)
+EMBEDDING_BATCH_WINDOW_MS = int(os.environ.get("EMBEDDING_BATCH_WINDOW_MS", "5"))
+EMBEDDING_MAX_BATCH = int(os.environ.get("EMBEDDING_MAX_BATCH", "64"))
+
 # --- Vector DB ---
 # Mặc định: data/vector_db (cấu trúc mới)
 # Nếu muốn dùng chroma_db_csv cũ, set PERSIST_DIRECTORY=chroma_db_csv trong .env
 PERSIST_DIRECTORY = os.environ.get("PERSIST_DIRECTORY", os.path.join(DATA_DIR, "vector_db"))
+# File đánh dấu phiên bản DB, được ghi lại mỗi lần nạp dữ liệu (dùng để xóa cache câu trả lời)
+VECTOR_DB_VERSION_FILE = os.path.join(PERSIST_DIRECTORY, "db_version.txt")
+# Chỉ mục BM25 (từ khóa) lưu cạnh Chroma, được cập nhật mỗi lần nạp dữ liệu
+BM25_INDEX_PATH = os.path.join(PERSIST_DIRECTORY, "bm25_index.json")
+
+# --- Retrieval ---
+# "hybrid": BM25 + vector, gộp bằng reciprocal rank fusion; "dense": chỉ vector
+RETRIEVAL_MODE = os.environ.get("RETRIEVAL_MODE", "hybrid").lower()
+RETRIEVAL_K = int(os.environ.get("RETRIEVAL_K", "5"))
+# Số ứng viên lấy từ mỗi nguồn trước khi gộp (chế độ hybrid)
+RETRIEVAL_FETCH_K = int(os.environ.get("RETRIEVAL_FETCH_K", "20"))
+RRF_K = int(os.environ.get("RRF_K", "60"))
+# Nhận diện tên hiện vật / thời kỳ trong câu hỏi để lọc metadata trước khi tìm kiếm
+QUERY_FILTER_ENABLED = os.environ.get("QUERY_FILTER_ENABLED", "true").lower() == "true"
+
+# --- Ingestion embedding (scripts/store_data_from_csv.py) ---
+INGEST_BATCH_SIZE = int(os.environ.get("INGEST_BATCH_SIZE", "64"))
+# > 1: dùng process pool, mỗi worker một bản sao mô hình embedding
+INGEST_NUM_WORKERS = int(os.environ.get("INGEST_NUM_WORKERS", "1"))
+INGEST_WRITE_BATCH_SIZE = int(os.environ.get("INGEST_WRITE_BATCH_SIZE", "256"))
+# Số cửa sổ/batch tối đa chờ trong mỗi hàng đợi của pipeline đọc -> embed -> ghi
+INGEST_QUEUE_SIZE = int(os.environ.get("INGEST_QUEUE_SIZE", "4"))
+# Cột "Đặc Điểm" dài hơn ngưỡng này được chia thành các đoạn con chồng lấn (0 = không chia)
+INGEST_CHUNK_MAX_CHARS = int(os.environ.get("INGEST_CHUNK_MAX_CHARS", "800"))
+INGEST_CHUNK_OVERLAP = int(os.environ.get("INGEST_CHUNK_OVERLAP", "150"))
+
+# --- Nén ngữ cảnh RAG (src/core/context_builder.py) ---
+# Gộp đoạn cùng hiện vật, bỏ phần template lặp lại, chọn câu liên quan nhất trong ngân sách token
+CONTEXT_COMPRESSION = os.environ.get("CONTEXT_COMPRESSION", "true").lower() == "true"
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", "600"))
+# Ước lượng số token trên mỗi từ/dấu câu (không nạp tokenizer của LLM)
+CONTEXT_TOKENS_PER_WORD = float(os.environ.get("CONTEXT_TOKENS_PER_WORD", "1.6"))
+
+# --- Answer cache (trước RAGEngine.get_answer) ---
+ANSWER_CACHE_ENABLED = os.environ.get("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+ANSWER_CACHE_MAX_ENTRIES = int(os.environ.get("ANSWER_CACHE_MAX_ENTRIES", "500"))
+ANSWER_CACHE_TTL = float(os.environ.get("ANSWER_CACHE_TTL", str(24 * 3600)))
+# Ngưỡng cosine để coi hai câu hỏi là giống nhau (0 < x <= 1); hai câu còn phải nhắc cùng hiện vật / thời kỳ
+# (nhận diện bằng QUERY_FILTER_ENABLED)
+ANSWER_CACHE_SIMILARITY = float(os.environ.get("ANSWER_CACHE_SIMILARITY", "0.95"))
+# Ngưỡng chặt hơn cho câu hỏi không nhắc hiện vật / thời kỳ nào (mọi câu hỏi khi tắt QUERY_FILTER_ENABLED);
+# > 1 để chỉ dùng khớp chính xác cho các câu này
+ANSWER_CACHE_SIMILARITY_NO_HINTS = float(os.environ.get("ANSWER_CACHE_SIMILARITY_NO_HINTS", "0.97"))
+
+# --- Prefetch truy xuất theo phụ đề tạm (voice loop / POST /api/prefetch) ---
+PREFETCH_ENABLED = os.environ.get("PREFETCH_ENABLED", "true").lower() == "true"
+# Kết quả prefetch sống bao lâu; câu hỏi cuối phải giống câu tạm tới mức này (cosine) mới dùng lại
+PREFETCH_TTL = float(os.environ.get("PREFETCH_TTL", "30"))
+PREFETCH_SIMILARITY = float(os.environ.get("PREFETCH_SIMILARITY", "0.9"))
+PREFETCH_MIN_CHARS = int(os.environ.get("PREFETCH_MIN_CHARS", "8"))
+PREFETCH_WORKERS = int(os.environ.get("PREFETCH_WORKERS", "2"))
 
 # --- STT (Faster-Whisper) ---
 STT_MODEL_NAME = os.environ.get("STT_MODEL_NAME", "medium")
 STT_DEVICE = os.environ.get("STT_DEVICE", "cuda" if os.environ.get("USE_CUDA", "false").lower() == "true" else "cpu")
 STT_COMPUTE_TYPE = os.environ.get("STT_COMPUTE_TYPE", "float16" if STT_DEVICE == "cuda" else "int8")
+# Phân tầng model: clip ngắn / rõ tiếng nói dùng model nhỏ, chuyển lên STT_MODEL_NAME khi avg_logprob thấp
+# (để trống STT_FAST_MODEL_NAME để chỉ dùng một model)
+STT_FAST_MODEL_NAME = os.environ.get("STT_FAST_MODEL_NAME", "small")
+STT_FAST_MAX_SECONDS = float(os.environ.get("STT_FAST_MAX_SECONDS", "5"))
+# Tỉ lệ khung có tiếng nói (VAD năng lượng) từ mức này trở lên cũng đi model nhỏ
+STT_FAST_MIN_SPEECH_RATIO = float(os.environ.get("STT_FAST_MIN_SPEECH_RATIO", "0.6"))
+STT_ESCALATE_LOGPROB = float(os.environ.get("STT_ESCALATE_LOGPROB", "-0.7"))
+# Chạy một lần suy luận giả cho mỗi model lúc khởi động
+STT_WARMUP = os.environ.get("STT_WARMUP", "true").lower() == "true"
+# Worker pool: số bản sao model, số luồng song song mỗi bản sao (num_workers của CTranslate2),
+# số thread CPU mỗi bản sao (0 = mặc định), độ dài hàng đợi (đầy -> 429)
+STT_REPLICAS = int(os.environ.get("STT_REPLICAS", "1"))
+STT_WORKERS_PER_REPLICA = int(os.environ.get("STT_WORKERS_PER_REPLICA", "2"))
+STT_CPU_THREADS = int(os.environ.get("STT_CPU_THREADS", "0"))
+STT_QUEUE_SIZE = int(os.environ.get("STT_QUEUE_SIZE", "32"))
+# Micro-batching: gom các clip ngắn (<= STT_BATCH_MAX_SECONDS) đến trong cửa sổ này thành một batch
+STT_BATCH_WINDOW_MS = int(os.environ.get("STT_BATCH_WINDOW_MS", "20"))
+STT_MAX_BATCH = int(os.environ.get("STT_MAX_BATCH", "8"))
+STT_BATCH_MAX_SECONDS = float(os.environ.get("STT_BATCH_MAX_SECONDS", "15"))
+# STT streaming (/ws/transcribe): giải mã lại tối đa chừng này giây cuối, sau mỗi bước audio mới
+STT_STREAM_WINDOW_S = float(os.environ.get("STT_STREAM_WINDOW_S", "10"))
+STT_STREAM_STEP_MS = int(os.environ.get("STT_STREAM_STEP_MS", "500"))
 STT_HOST = os.environ.get("STT_HOST", "0.0.0.0")
 STT_PORT = int(os.environ.get("STT_PORT", "8001"))
 
@@ -45,10 +163,68 @@ STT_PORT = int(os.environ.get("STT_PORT", "8001"))
 TTS_HOST = os.environ.get("TTS_HOST", "0.0.0.0")
 TTS_PORT = int(os.environ.get("TTS_PORT", "8002"))
 TTS_VI_VOICE = os.environ.get("TTS_VI_VOICE", "vi-VN-HoaiMyNeural")
+TTS_RATE = os.environ.get("TTS_RATE", "+0%")
+# Pipelined TTS: số câu được tổng hợp song song tối đa
+TTS_MAX_PARALLEL = int(os.environ.get("TTS_MAX_PARALLEL", "3"))
+# Câu ngắn hơn ngưỡng này sẽ được gộp với câu sau (tránh request TTS quá nhỏ)
+TTS_SENTENCE_MIN_CHARS = int(os.environ.get("TTS_SENTENCE_MIN_CHARS", "20"))
 
 # --- Web (Flask) ---
 WEB_HOST = os.environ.get("WEB_HOST", "0.0.0.0")
 WEB_PORT = int(os.environ.get("WEB_PORT", "8080"))
+# "flask" (web/app_server.py) hoặc "asgi" (web/asgi_server.py, FastAPI bất đồng bộ)
+WEB_SERVER = os.environ.get("WEB_SERVER", "flask").lower()
+# ASGI: số thread chạy RAG, số request xử lý đồng thời, số request được chờ; vượt quá -> 429
+WEB_RAG_WORKERS = int(os.environ.get("WEB_RAG_WORKERS", "4"))
+WEB_MAX_CONCURRENT = int(os.environ.get("WEB_MAX_CONCURRENT", "8"))
+WEB_MAX_QUEUE = int(os.environ.get("WEB_MAX_QUEUE", "16"))
+WEB_RETRY_AFTER = int(os.environ.get("WEB_RETRY_AFTER", "5"))
+
+# --- run_system.py: giám sát các service ---
+# Service bị crash được khởi động lại tối đa chừng này lần, chờ BACKOFF x 2^n giây trước lần thứ n+1
+SUPERVISOR_MAX_RESTARTS = int(os.environ.get("SUPERVISOR_MAX_RESTARTS", "5"))
+SUPERVISOR_RESTART_BACKOFF = float(os.environ.get("SUPERVISOR_RESTART_BACKOFF", "2"))
+# Chu kỳ hỏi /health và kiểm tra tiến trình con
+SUPERVISOR_POLL_INTERVAL = float(os.environ.get("SUPERVISOR_POLL_INTERVAL", "0.5"))
+
+# --- Voice loop qua WebSocket (/ws, chỉ có trên server ASGI) ---
+# Client gửi PCM 16-bit mono little-endian ở tần số này
+VOICE_SAMPLE_RATE = int(os.environ.get("VOICE_SAMPLE_RATE", "16000"))
+# VAD năng lượng: khung là tiếng nói khi RMS > ngưỡng x nền nhiễu
+VOICE_VAD_THRESHOLD = float(os.environ.get("VOICE_VAD_THRESHOLD", "3.0"))
+VOICE_VAD_MIN_RMS = float(os.environ.get("VOICE_VAD_MIN_RMS", "0.01"))
+# Im lặng bao lâu thì coi là hết câu hỏi; độ dài tối đa một câu
+VOICE_ENDPOINT_SILENCE_MS = int(os.environ.get("VOICE_ENDPOINT_SILENCE_MS", "700"))
+VOICE_MAX_UTTERANCE_S = float(os.environ.get("VOICE_MAX_UTTERANCE_S", "15"))
+# Chu kỳ gửi audio sang STT /ws/transcribe để lấy phụ đề tạm trong lúc khách đang nói, 0 = tắt
+# (khi tắt, câu hỏi được giải mã một lần sau khi nói xong)
+VOICE_PARTIAL_INTERVAL_MS = int(os.environ.get("VOICE_PARTIAL_INTERVAL_MS", "800"))
+
+# --- HTTP client dùng chung giữa các service (TTS, Ollama) ---
+# Số kết nối keep-alive tối đa cho mỗi host; request vượt quá phải chờ tối đa HTTP_POOL_TIMEOUT giây
+HTTP_POOL_MAXSIZE = int(os.environ.get("HTTP_POOL_MAXSIZE", "10"))
+HTTP_POOL_TIMEOUT = float(os.environ.get("HTTP_POOL_TIMEOUT", "10"))
+HTTP_CONNECT_TIMEOUT = float(os.environ.get("HTTP_CONNECT_TIMEOUT", "3"))
+HTTP_READ_TIMEOUT = float(os.environ.get("HTTP_READ_TIMEOUT", "120"))
+# Thời gian giữ kết nối rảnh (giây, client aiohttp)
+HTTP_KEEPALIVE = float(os.environ.get("HTTP_KEEPALIVE", "60"))
+
+# --- Tracing & /metrics (src/utils/tracing.py) ---
+# Đo thời gian từng công đoạn (STT, embed, truy xuất, LLM, TTS...) và xuất histogram tại /metrics
+TRACING_ENABLED = os.environ.get("TRACING_ENABLED", "true").lower() == "true"
+# Ghi một dòng log tóm tắt các công đoạn cho mỗi request (kèm X-Request-ID)
+TRACE_LOG_REQUESTS = os.environ.get("TRACE_LOG_REQUESTS", "true").lower() == "true"
+# Các mốc (giây) của histogram độ trễ
+TRACE_HISTOGRAM_BUCKETS = [
+    float(b) for b in os.environ.get(
+        "TRACE_HISTOGRAM_BUCKETS", "0.005,0.01,0.025,0.05,0.1,0.25,0.5,1,2.5,5,10,30"
+    ).split(",") if b.strip()
+]
 
 AUDIO_TEMP_DIR = os.environ.get("AUDIO_TEMP_DIR", os.path.join(DATA_DIR, "audio_temp"))
 TTS_OUTPUT_DIR = os.environ.get("TTS_OUTPUT_DIR", os.path.join("web", "static", "audio_cache"))
+# Giới hạn cache audio TTS (LRU), 0 = không giới hạn
+TTS_CACHE_MAX_BYTES = int(os.environ.get("TTS_CACHE_MAX_BYTES", str(200 * 1024 * 1024)))
+TTS_CACHE_MAX_ENTRIES = int(os.environ.get("TTS_CACHE_MAX_ENTRIES", "2000"))
+# File vừa trả về (audio_path) không bị xóa trong chừng này giây, để client kịp tải về
+TTS_CACHE_GRACE_SECONDS = float(os.environ.get("TTS_CACHE_GRACE_SECONDS", "60"))
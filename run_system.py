@@ -2,47 +2,151 @@
 One-click runner for BrainV2.
 
 This script will:
+- Start the shared embedding service first when EMBEDDING_BACKEND=remote
 - Start STT service (FastAPI + Faster-Whisper)
 - Start TTS service (FastAPI + Edge-TTS)
-- Start Web server (Flask)
+- Start Web server (Flask, or FastAPI/ASGI when WEB_SERVER=asgi)
+
+All services start in parallel and load their models in the background; the
+runner polls each service's /health readiness probe, prints how long each one
+took (with the per-phase timings the service reports), and restarts a service
+that crashes (up to SUPERVISOR_MAX_RESTARTS times, with exponential backoff).
 
 All services run on local machine, optimized for Vietnamese realtime.
 """
 
+import json
 import subprocess
 import sys
+import time
+import urllib.error
+import urllib.request
 from pathlib import Path
+from typing import Optional
 
+from config import settings
+
+# Không đi qua proxy khi gọi localhost
+_opener = urllib.request.build_opener(urllib.request.ProxyHandler({}))
+
+
+def _health_url(host: str, port: int) -> str:
+    host = "localhost" if host == "0.0.0.0" else host
+    return f"http://{host}:{port}/health"
+
+
+class Service:
+    def __init__(self, name: str, module: str, health_url: str):
+        self.name = name
+        self.cmd = [sys.executable, "-m", module]
+        self.health_url = health_url
+        self.process: Optional[subprocess.Popen] = None
+        self.started_at = 0.0
+        self.ready_at: Optional[float] = None
+        self.restarts = 0
+        self.restart_at: Optional[float] = None  # restart scheduled (backoff)
+        self.gave_up = False
+
+    def start(self, cwd: str) -> None:
+        print(f"Starting {self.name}:", " ".join(self.cmd))
+        self.process = subprocess.Popen(self.cmd, cwd=cwd)
+        self.started_at = time.monotonic()
+        self.ready_at = None
+        self.restart_at = None
+
+    def probe(self) -> Optional[dict]:
+        """The /health payload if the service reports ready, else None."""
+        try:
+            with _opener.open(self.health_url, timeout=1) as r:
+                payload = json.loads(r.read() or b"{}")
+        except (urllib.error.URLError, OSError, ValueError):
+            return None  # chưa lắng nghe, còn đang nạp (503), hoặc lỗi
+        return payload if payload.get("status") == "ready" else None
+
+    def stop(self) -> None:
+        if self.process is None or self.process.poll() is not None:
+            return
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
 
-def main():
-    root = Path(__file__).resolve().parent
 
-    cmds = [
-        [sys.executable, "-m", "servers.stt_service"],
-        [sys.executable, "-m", "servers.tts_service"],
-        [sys.executable, "-m", "web.app_server"],
+def _format_phases(phases: dict) -> str:
+    return ", ".join(f"{name} {seconds:.2f}s" for name, seconds in phases.items())
+
+
+def main():
+    root = str(Path(__file__).resolve().parent)
+    web_module = "web.asgi_server" if settings.WEB_SERVER == "asgi" else "web.app_server"
+    services = []
+    if settings.EMBEDDING_BACKEND == "remote":
+        services.append(Service(
+            "embedding",
+            "servers.embedding_service",
+            _health_url(settings.EMBEDDING_SERVICE_HOST, settings.EMBEDDING_SERVICE_PORT),
+        ))
+    services += [
+        Service("stt", "servers.stt_service", _health_url(settings.STT_HOST, settings.STT_PORT)),
+        Service("tts", "servers.tts_service", _health_url(settings.TTS_HOST, settings.TTS_PORT)),
+        Service("web", web_module, _health_url(settings.WEB_HOST, settings.WEB_PORT)),
     ]
 
-    processes = []
+    launched_at = time.monotonic()
+    all_ready_reported = False
     try:
-        for cmd in cmds:
-            print("Starting:", " ".join(cmd))
-            p = subprocess.Popen(cmd, cwd=str(root))
-            processes.append(p)
-
-        print("All services started. Press Ctrl+C to stop.")
-        for p in processes:
-            p.wait()
+        for service in services:
+            service.start(root)
+
+        while True:
+            now = time.monotonic()
+            for service in services:
+                if service.gave_up:
+                    continue
+
+                if service.restart_at is not None:
+                    if now >= service.restart_at:
+                        service.start(root)
+                    continue
+
+                code = service.process.poll()
+                if code is not None:
+                    if service.restarts >= settings.SUPERVISOR_MAX_RESTARTS:
+                        print(f"{service.name} exited with code {code}; giving up after {service.restarts} restart(s).")
+                        service.gave_up = True
+                        continue
+                    backoff = settings.SUPERVISOR_RESTART_BACKOFF * (2 ** service.restarts)
+                    service.restarts += 1
+                    service.restart_at = now + backoff
+                    print(f"{service.name} exited with code {code}; restarting in {backoff:.1f}s "
+                          f"({service.restarts}/{settings.SUPERVISOR_MAX_RESTARTS}).")
+                    continue
+
+                if service.ready_at is None:
+                    payload = service.probe()
+                    if payload is not None:
+                        service.ready_at = time.monotonic()
+                        phases = _format_phases(payload.get("phases") or {})
+                        print(f"{service.name} ready in {service.ready_at - service.started_at:.1f}s"
+                              + (f" ({phases})" if phases else ""))
+
+            if all(service.gave_up for service in services):
+                print("All services have stopped.")
+                break
+            if not all_ready_reported and all(service.ready_at is not None for service in services):
+                all_ready_reported = True
+                print(f"All services ready in {time.monotonic() - launched_at:.1f}s. Press Ctrl+C to stop.")
+            time.sleep(settings.SUPERVISOR_POLL_INTERVAL)
     except KeyboardInterrupt:
         print("Stopping all services...")
-        for p in processes:
+    finally:
+        for service in services:
             try:
-                p.terminate()
+                service.stop()
             except Exception:
                 pass
 
 
 if __name__ == "__main__":
     main()
-
-
@@ -0,0 +1,201 @@
+"""
+Local stand-ins for the remote parts of the pipeline, used by scripts/benchmark.py
+so a benchmark run is offline and deterministic:
+
+- llm: an Ollama-compatible server (/api/chat, /api/generate, /v1/chat/completions,
+  streaming or not). The answer is built from the prompt itself (the first
+  sentence of the context) and emitted word by word after --ttft-ms, then
+  every --token-ms, so the LLM stage costs the same on every run.
+- tts: the real `servers.tts_service` app (cache, file write, sentence
+  pipelining) with Edge-TTS replaced by a fake that sleeps
+  --synth-ms + --per-char-ms x len(text) and returns fixed pseudo-MP3 bytes.
+
+Chạy: python -m scripts.bench_stubs all   (hoặc llm / tts)
+rồi:  python -m scripts.benchmark rag tts --offline
+"""
+
+import sys
+import os
+# Thêm dòng này để chạy script từ thư mục gốc
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import asyncio
+import hashlib
+import json
+import re
+import tempfile
+import time
+import types
+
+STUB_LLM_PORT = 11435
+
+_QUESTION_RE = re.compile(r"Câu hỏi:\s*(.*?)\s*(?:Câu trả lời hữu ích:|$)", re.S)
+_CONTEXT_RE = re.compile(r"Ngữ cảnh:\s*(.*?)\s*Câu hỏi:", re.S)
+
+
+def stub_answer(prompt: str, max_words: int) -> str:
+    """Deterministic answer: the first context sentence, cut to `max_words` words."""
+    context = _CONTEXT_RE.search(prompt)
+    question = _QUESTION_RE.search(prompt)
+    lines = [line for line in (context.group(1) if context else "").splitlines() if line.strip()]
+    # Bỏ dòng tiêu đề "[Tên] (thời kỳ: ...)" của ContextBuilder nếu có
+    body = next((line for line in lines if not line.startswith("[")), lines[0] if lines else "")
+    sentence = re.split(r"(?<=[.!?])\s+", body.strip())[0] if body.strip() else ""
+    if not sentence:
+        sentence = f"Tôi chưa có thông tin về {question.group(1) if question else 'câu hỏi này'}."
+    words = f"Theo tư liệu của bảo tàng, {sentence}".split()
+    return " ".join(words[:max_words])
+
+
+def _words(text: str):
+    words = text.split(" ")
+    return [w + (" " if i < len(words) - 1 else "") for i, w in enumerate(words)]
+
+
+def make_llm_app(ttft_ms: float, token_ms: float, max_words: int):
+    from fastapi import FastAPI, Request
+    from fastapi.responses import StreamingResponse
+
+    app = FastAPI(title="BrainV2 benchmark LLM stub")
+
+    def prompt_of(messages) -> str:
+        return "\n\n".join(m.get("content") or "" for m in messages if m.get("role") != "system")
+
+    def counts(messages, answer: str) -> dict:
+        prompt_words = sum(len((m.get("content") or "").split()) for m in messages)
+        return {"prompt_eval_count": prompt_words, "eval_count": len(answer.split())}
+
+    async def tokens(answer: str):
+        await asyncio.sleep(ttft_ms / 1000)
+        for i, word in enumerate(_words(answer)):
+            if i:
+                await asyncio.sleep(token_ms / 1000)
+            yield word
+
+    @app.post("/api/generate")
+    async def generate(request: Request):
+        # Warm-ping của LLMManager: prompt rỗng, không sinh gì
+        data = await request.json()
+        return {"model": data.get("model"), "response": "", "done": True}
+
+    @app.post("/api/chat")
+    async def chat(request: Request):
+        data = await request.json()
+        messages = data.get("messages") or []
+        answer = stub_answer(prompt_of(messages), max_words)
+        model = data.get("model")
+        if not data.get("stream", True):
+            await asyncio.sleep((ttft_ms + token_ms * max(0, len(answer.split()) - 1)) / 1000)
+            return {"model": model, "message": {"role": "assistant", "content": answer}, "done": True,
+                    **counts(messages, answer)}
+
+        async def ndjson():
+            async for word in tokens(answer):
+                yield json.dumps({"model": model, "message": {"role": "assistant", "content": word}, "done": False},
+                                 ensure_ascii=False) + "\n"
+            yield json.dumps({"model": model, "message": {"role": "assistant", "content": ""}, "done": True,
+                              **counts(messages, answer)}) + "\n"
+
+        return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        data = await request.json()
+        answer = stub_answer(prompt_of(data.get("messages") or []), max_words)
+        if not data.get("stream"):
+            await asyncio.sleep((ttft_ms + token_ms * max(0, len(answer.split()) - 1)) / 1000)
+            return {"choices": [{"index": 0, "message": {"role": "assistant", "content": answer}}]}
+
+        async def sse():
+            async for word in tokens(answer):
+                yield "data: " + json.dumps({"choices": [{"index": 0, "delta": {"content": word}}]},
+                                            ensure_ascii=False) + "\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(sse(), media_type="text/event-stream")
+
+    return app
+
+
+def fake_edge_tts(synth_ms: float, per_char_ms: float, bytes_per_char: int = 64) -> types.ModuleType:
+    """Module with the parts of `edge_tts` that servers.tts_service uses."""
+
+    def audio_for(text: str) -> bytes:
+        # Byte giả cố định theo nội dung, độ dài tỉ lệ với số ký tự (như MP3 thật)
+        seed = hashlib.sha256(text.encode("utf-8")).digest()
+        size = max(256, bytes_per_char * len(text))
+        return b"ID3" + (seed * (size // len(seed) + 1))[:size]
+
+    class Communicate:
+        def __init__(self, text: str, voice: str = "", rate: str = "+0%", **kwargs):
+            self.text = text
+
+        async def stream(self):
+            await asyncio.sleep((synth_ms + per_char_ms * len(self.text)) / 1000)
+            audio = audio_for(self.text)
+            for start in range(0, len(audio), 4096):
+                yield {"type": "audio", "data": audio[start:start + 4096]}
+
+        async def save(self, path: str) -> None:
+            with open(path, "wb") as f:
+                async for chunk in self.stream():
+                    f.write(chunk["data"])
+
+    module = types.ModuleType("edge_tts")
+    module.Communicate = Communicate
+    return module
+
+
+def make_tts_app(synth_ms: float, per_char_ms: float, output_dir: str):
+    # settings đọc env lúc import: đặt thư mục cache trước khi nạp service
+    os.environ["TTS_OUTPUT_DIR"] = output_dir
+    sys.modules["edge_tts"] = fake_edge_tts(synth_ms, per_char_ms)
+    from servers import tts_service
+    return tts_service.app
+
+
+async def serve(apps) -> None:
+    import uvicorn
+
+    servers = [
+        uvicorn.Server(uvicorn.Config(app, host=host, port=port, log_level="warning"))
+        for app, host, port in apps
+    ]
+    await asyncio.gather(*(server.serve() for server in servers))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Server giả lập LLM (Ollama) và Edge-TTS cho benchmark offline.")
+    parser.add_argument("stub", choices=["llm", "tts", "all"], help="Server cần chạy.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--llm-port", type=int, default=STUB_LLM_PORT, help="Cổng của LLM giả.")
+    parser.add_argument("--tts-port", type=int, default=None, help="Cổng của TTS (mặc định TTS_PORT).")
+    parser.add_argument("--ttft-ms", type=float, default=300, help="Độ trễ tới token đầu tiên.")
+    parser.add_argument("--token-ms", type=float, default=20, help="Độ trễ giữa hai token.")
+    parser.add_argument("--answer-words", type=int, default=60, help="Số từ tối đa của câu trả lời giả.")
+    parser.add_argument("--synth-ms", type=float, default=150, help="Độ trễ cố định mỗi lần tổng hợp TTS.")
+    parser.add_argument("--per-char-ms", type=float, default=2, help="Độ trễ TTS thêm cho mỗi ký tự.")
+    parser.add_argument("--output-dir", default=None, help="Thư mục cache audio của TTS (mặc định: thư mục tạm).")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    apps = []
+    if args.stub in ("llm", "all"):
+        apps.append((make_llm_app(args.ttft_ms, args.token_ms, args.answer_words), args.host, args.llm_port))
+        print(f"LLM giả (Ollama API) tại http://{args.host}:{args.llm_port}")
+    if args.stub in ("tts", "all"):
+        output_dir = args.output_dir or tempfile.mkdtemp(prefix="brainv2-bench-tts-")
+        app = make_tts_app(args.synth_ms, args.per_char_ms, output_dir)
+        from config import settings
+        port = args.tts_port or settings.TTS_PORT
+        apps.append((app, args.host, port))
+        print(f"TTS service với Edge-TTS giả tại http://{args.host}:{port} (audio: {output_dir})")
+    started = time.perf_counter()
+    try:
+        asyncio.run(serve(apps))
+    except KeyboardInterrupt:
+        pass
+    print(f"Đã dừng sau {time.perf_counter() - started:.0f}s.")
@@ -0,0 +1,474 @@
+"""
+Reproducible benchmark of the serving path: replays a query corpus against
+RAGEngine, the STT service and the TTS service at a fixed concurrency and
+reports throughput, p50/p95/p99 latency and retrieval recall@k / MRR.
+
+Targets:
+- retrieval: RAGEngine's retriever only (embedding + vector/BM25 search).
+- rag: RAGEngine.stream_answer end to end (time to first text and full answer),
+  with recall@k of the documents it retrieved.
+- stt: POST /transcribe/pcm with deterministic synthetic clips, or every file
+  of --audio-dir through POST /transcribe.
+- tts: GET /speak (or /speak/stream with --tts-stream) with sentences from the dataset.
+
+Queries come from dataset.csv (artifact names through QUERY_TEMPLATES, each with
+its expected item_id), or from --queries (one question per line, optionally
+"question<TAB>item_id", or JSONL with "question" and "item_id").
+
+With --offline, RAG answers come from the stub LLM of scripts/bench_stubs.py
+(Gemini off). `python -m scripts.bench_stubs all` starts that stub and the TTS
+service with a fake Edge-TTS, so nothing leaves the machine. The answer cache
+is off unless --answer-cache.
+--output saves the report as JSON; --baseline compares with a saved report.
+
+Chạy: python -m scripts.benchmark retrieval rag stt tts --offline -c 4 --output bench.json
+"""
+
+import sys
+import os
+# Thêm dòng này để chạy script từ thư mục gốc
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import csv
+import glob
+import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from scripts.bench_stubs import STUB_LLM_PORT
+
+TARGETS = ("retrieval", "rag", "stt", "tts")
+
+# Câu hỏi thử được sinh từ tên hiện vật trong dataset
+QUERY_TEMPLATES = ("{ten}", "{ten} là gì?", "Ý nghĩa lịch sử của {ten}", "{ten} thuộc thời kỳ nào?")
+
+# Cấu hình để RAG dùng LLM giả và kết quả không phụ thuộc lần chạy trước (đặt trước khi nạp settings)
+OFFLINE_ENV = {
+    "USE_GEMINI_PRIMARY": "false",
+    "OLLAMA_BASE_URL": f"http://127.0.0.1:{STUB_LLM_PORT}",
+    "OLLAMA_WARM_PING_INTERVAL": "0",
+    "LLM_HEDGE_AFTER_S": "0",
+}
+BENCH_ENV = {
+    "ANSWER_CACHE_ENABLED": "false",
+    "PREFETCH_ENABLED": "false",
+    "TRACE_LOG_REQUESTS": "false",
+}
+
+_RAG_ERROR_PREFIX = "Đã xảy ra lỗi"
+
+
+class Rejected(Exception):
+    """The service refused the request (429): counted apart from errors."""
+
+
+# --- Corpus ---
+
+def load_items(csv_path):
+    """[{item_id, ten, thoi_ky, cong_dung}] from the dataset CSV (same columns as ingestion)."""
+    items = []
+    with open(csv_path, encoding="utf-8-sig") as f:
+        reader = csv.reader(f)
+        next(reader, None)
+        for line in reader:
+            if len(line) >= 5 and line[1].strip():
+                items.append({"item_id": line[0], "ten": line[1].strip(), "thoi_ky": line[3], "cong_dung": line[4]})
+    return items
+
+
+def build_queries(items):
+    return [(template.format(ten=item["ten"]), item["item_id"]) for item in items for template in QUERY_TEMPLATES]
+
+
+def load_query_file(path):
+    """[(question, expected item_id or None)] from a text or JSONL file."""
+    queries = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if path.endswith(".jsonl"):
+                row = json.loads(line)
+                question = row.get("question") or row.get("text") or row.get("title")
+                expected = row.get("item_id")
+            else:
+                question, _, expected = line.partition("\t")
+            if question:
+                queries.append((question.strip(), str(expected).strip() if expected else None))
+    return queries
+
+
+def tts_sentences(items, max_chars=200):
+    sentences = []
+    for item in items:
+        text = " ".join(item["cong_dung"].split())
+        sentence = text.split(". ")[0].strip()
+        if sentence:
+            sentences.append(sentence[:max_chars])
+    return sentences
+
+
+def synthetic_clip(seconds, seed, sample_rate=16000):
+    """Deterministic 16-bit PCM 'speech-like' clip: harmonics with syllable-rate amplitude bursts."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    pitch = 110 + 60 * rng.random()
+    voiced = sum(np.sin(2 * np.pi * pitch * h * t + rng.random() * 6.28) / h for h in range(1, 6))
+    envelope = np.clip(np.sin(2 * np.pi * (3 + rng.random()) * t), 0, None) ** 2
+    signal = 0.3 * voiced * envelope + 0.01 * rng.standard_normal(t.size)
+    return (np.clip(signal, -1, 1) * 32767).astype("<i2").tobytes()
+
+
+# --- Load generation ---
+
+def run_load(fn, inputs, concurrency, warmup=0):
+    """
+    Call fn(input) for every input with `concurrency` threads.
+    Returns ([(seconds, status, value)], wall seconds); the first `warmup` inputs
+    run sequentially beforehand and are not counted.
+    """
+    for item in inputs[:warmup]:
+        try:
+            fn(item)
+        except Exception:
+            pass
+
+    def call(item):
+        started = time.perf_counter()
+        try:
+            value = fn(item)
+            status = "ok"
+        except Rejected:
+            value, status = None, "rejected"
+        except Exception as e:
+            value, status = str(e), "error"
+        return time.perf_counter() - started, status, value
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        results = list(pool.map(call, inputs))
+    return results, time.perf_counter() - started
+
+
+def _percentiles(seconds):
+    if not seconds:
+        return {"p50": None, "p95": None, "p99": None, "mean": None, "max": None}
+    ms = np.asarray(seconds) * 1000
+    return {
+        "p50": round(float(np.percentile(ms, 50)), 1),
+        "p95": round(float(np.percentile(ms, 95)), 1),
+        "p99": round(float(np.percentile(ms, 99)), 1),
+        "mean": round(float(ms.mean()), 1),
+        "max": round(float(ms.max()), 1),
+    }
+
+
+def summarize(results, wall, concurrency):
+    ok = [seconds for seconds, status, _ in results if status == "ok"]
+    errors = [value for _, status, value in results if status == "error"]
+    report = {
+        "requests": len(results),
+        "ok": len(ok),
+        "errors": len(errors),
+        "rejected": sum(1 for _, status, _ in results if status == "rejected"),
+        "concurrency": concurrency,
+        "wall_s": round(wall, 3),
+        "throughput_rps": round(len(ok) / wall, 2) if wall else 0.0,
+        "latency_ms": _percentiles(ok),
+    }
+    if errors:
+        report["first_error"] = errors[0][:200]
+    return report
+
+
+def retrieval_scores(retrieved, expected, k):
+    """recall@k (expected item among the first k) and MRR over the queries that have an expected item."""
+    hits, reciprocal = [], []
+    for ids, item_id in zip(retrieved, expected):
+        if item_id is None or ids is None:
+            continue
+        ranked = list(dict.fromkeys(ids))  # nhiều đoạn con cùng hiện vật chỉ tính một lần
+        hits.append(item_id in ranked[:k])
+        reciprocal.append(1 / (ranked.index(item_id) + 1) if item_id in ranked else 0.0)
+    if not hits:
+        return {}
+    return {"k": k, "recall_at_k": round(float(np.mean(hits)), 3), "mrr": round(float(np.mean(reciprocal)), 3),
+            "scored_queries": len(hits)}
+
+
+# --- Targets ---
+
+class _RecordingRetriever:
+    """Forwards to the real retriever and remembers, per thread, the documents it returned."""
+
+    def __init__(self, inner):
+        self.inner = inner
+        self.local = threading.local()
+
+    def invoke(self, question, *args, **kwargs):
+        docs = self.inner.invoke(question, *args, **kwargs)
+        self.local.docs = docs
+        return docs
+
+
+def _item_ids(docs):
+    return [str(doc.metadata.get("item_id")) for doc in docs]
+
+
+def bench_retrieval(queries, args):
+    from src.core.rag_engine import rag_engine
+
+    rag_engine.warm_up()
+    results, wall = run_load(lambda q: _item_ids(rag_engine.retriever.invoke(q[0])), queries, args.concurrency,
+                             args.warmup)
+    report = summarize(results, wall, args.concurrency)
+    retrieved = [value if status == "ok" else None for _, status, value in results]
+    report.update(retrieval_scores(retrieved, [expected for _, expected in queries], args.k))
+    return report
+
+
+def bench_rag(queries, args):
+    from src.core.rag_engine import rag_engine
+
+    rag_engine.warm_up()
+    recorder = _RecordingRetriever(rag_engine.retriever)
+    rag_engine.retriever = recorder
+
+    def ask(query):
+        recorder.local.docs = None
+        started = time.perf_counter()
+        first, parts = None, []
+        for text in rag_engine.stream_answer(query[0]):
+            if first is None:
+                first = time.perf_counter() - started
+            parts.append(text)
+        answer = "".join(parts)
+        if answer.startswith(_RAG_ERROR_PREFIX):
+            raise RuntimeError(answer)
+        docs = recorder.local.docs
+        return first, _item_ids(docs) if docs is not None else None, len(answer)
+
+    try:
+        results, wall = run_load(ask, queries, args.concurrency, args.warmup)
+    finally:
+        rag_engine.retriever = recorder.inner
+    report = summarize(results, wall, args.concurrency)
+    ok = [value for _, status, value in results if status == "ok"]
+    report["first_text_ms"] = _percentiles([first for first, _, _ in ok if first is not None])
+    report["answer_chars_avg"] = round(float(np.mean([n for _, _, n in ok])), 1) if ok else 0.0
+    retrieved = [value[1] if status == "ok" else None for _, status, value in results]
+    report.update(retrieval_scores(retrieved, [expected for _, expected in queries], args.k))
+    return report
+
+
+def _http_client(concurrency):
+    from src.utils.http_client import PooledHTTPClient
+    from config import settings
+
+    # Pool riêng đủ lớn cho mức đồng thời của benchmark
+    return PooledHTTPClient(pool_maxsize=concurrency, connect_timeout=settings.HTTP_CONNECT_TIMEOUT,
+                            read_timeout=settings.HTTP_READ_TIMEOUT, pool_timeout=60)
+
+
+def _service_url(host, port):
+    host = "localhost" if host == "0.0.0.0" else host
+    return f"http://{host}:{port}"
+
+
+def _check(response):
+    if response.status_code in (429, 503):
+        raise Rejected()
+    response.raise_for_status()
+    return response
+
+
+def bench_stt(args):
+    from config import settings
+
+    client = _http_client(args.concurrency)
+    base = (args.stt_url or _service_url(settings.STT_HOST, settings.STT_PORT)).rstrip("/")
+    if args.audio_dir:
+        paths = sorted(p for p in glob.glob(os.path.join(args.audio_dir, "*")) if os.path.isfile(p))
+        clips = []
+        for path in paths:
+            with open(path, "rb") as f:
+                clips.append((os.path.basename(path), f.read(), None))
+        clips *= args.rounds
+
+        def transcribe(clip):
+            name, content, _ = clip
+            return _check(client.post(f"{base}/transcribe", files={"file": (name, content)})).json().get("text")
+    else:
+        lengths = [float(s) for s in args.clip_seconds.split(",")]
+        count = args.limit or 24
+        clips = [(None, synthetic_clip(lengths[i % len(lengths)], args.seed + i), lengths[i % len(lengths)])
+                 for i in range(count)]
+
+        def transcribe(clip):
+            _, pcm, _ = clip
+            return _check(client.post(
+                f"{base}/transcribe/pcm", data=pcm, params={"sample_rate": "16000"},
+                headers={"Content-Type": "application/octet-stream"},
+            )).json().get("text")
+
+    results, wall = run_load(transcribe, clips, args.concurrency, args.warmup)
+    report = summarize(results, wall, args.concurrency)
+    audio_seconds = sum(c[2] for c, (_, status, _) in zip(clips, results) if status == "ok" and c[2])
+    if audio_seconds:
+        # Bao nhiêu giây audio được xử lý trong mỗi giây thực
+        report["audio_s_per_s"] = round(audio_seconds / wall, 2)
+    return report
+
+
+def bench_tts(items, args):
+    from config import settings
+
+    client = _http_client(args.concurrency)
+    base = (args.tts_url or _service_url(settings.TTS_HOST, settings.TTS_PORT)).rstrip("/")
+    sentences = tts_sentences(items)
+    if args.limit:
+        sentences = sentences[:args.limit]
+    # Vòng thứ hai trở đi trúng cache audio của TTS service
+    sentences = sentences * args.rounds
+
+    def speak(text):
+        if args.tts_stream:
+            return len(_check(client.get(f"{base}/speak/stream", params={"text": text})).content)
+        return _check(client.get(f"{base}/speak", params={"text": text})).json().get("audio_path")
+
+    results, wall = run_load(speak, sentences, args.concurrency, args.warmup)
+    report = summarize(results, wall, args.concurrency)
+    report["endpoint"] = "/speak/stream" if args.tts_stream else "/speak"
+    return report
+
+
+# --- Report ---
+
+def log_report(logger, name, report):
+    latency = report["latency_ms"]
+    line = (
+        f"[{name}] {report['ok']}/{report['requests']} ok, {report['errors']} lỗi, {report['rejected']} bị từ chối | "
+        f"{report['throughput_rps']} req/s @ c={report['concurrency']} | "
+        f"p50 {latency['p50']} ms, p95 {latency['p95']} ms, p99 {latency['p99']} ms"
+    )
+    if "first_text_ms" in report:
+        line += f" | chữ đầu tiên p50 {report['first_text_ms']['p50']} ms, p95 {report['first_text_ms']['p95']} ms"
+    if "recall_at_k" in report:
+        line += f" | recall@{report['k']} {report['recall_at_k']}, MRR {report['mrr']}"
+    if "audio_s_per_s" in report:
+        line += f" | {report['audio_s_per_s']} s audio/s"
+    logger.info(line)
+    if "first_error" in report:
+        logger.warning(f"[{name}] lỗi đầu tiên: {report['first_error']}")
+
+
+def compare(logger, report, baseline):
+    """Log the change of the main numbers against a saved report (negative latency delta = faster)."""
+
+    def delta(new, old):
+        if new is None or old is None:
+            return "n/a"
+        change = new - old
+        return f"{old} -> {new} ({'+' if change >= 0 else ''}{round(change, 3)}" + (
+            f", {change / old * 100:+.1f}%)" if old else ")"
+        )
+
+    for name, current in report["targets"].items():
+        old = baseline.get("targets", {}).get(name)
+        if not old:
+            continue
+        parts = [f"thông lượng {delta(current['throughput_rps'], old['throughput_rps'])}"]
+        for q in ("p50", "p95", "p99"):
+            parts.append(f"{q} {delta(current['latency_ms'][q], old['latency_ms'][q])}")
+        if "recall_at_k" in current and "recall_at_k" in old:
+            parts.append(f"recall@k {delta(current['recall_at_k'], old['recall_at_k'])}")
+        logger.info(f"[{name}] so với baseline: " + ", ".join(parts))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark RAG / STT / TTS với mức đồng thời cố định.")
+    parser.add_argument("targets", nargs="+", choices=TARGETS, help="Các phần cần đo.")
+    parser.add_argument("-c", "--concurrency", type=int, default=4, help="Số request chạy song song.")
+    parser.add_argument("--csv", default="dataset.csv", help="Dataset dùng để sinh câu hỏi và câu TTS.")
+    parser.add_argument("--queries", default=None, help="Tệp câu hỏi (.txt: 'câu hỏi<TAB>item_id', hoặc .jsonl).")
+    parser.add_argument("--limit", type=int, default=0, help="Chỉ dùng N mục đầu (sau khi xáo trộn), 0 = tất cả.")
+    parser.add_argument("--seed", type=int, default=42, help="Seed xáo trộn câu hỏi và sinh audio.")
+    parser.add_argument("--warmup", type=int, default=2, help="Số request chạy trước, không tính vào kết quả.")
+    parser.add_argument("--rounds", type=int, default=1, help="Lặp lại corpus TTS/audio-dir chừng này lần.")
+    parser.add_argument("-k", type=int, default=None, help="k cho recall@k (mặc định RETRIEVAL_K).")
+    parser.add_argument("--offline", action="store_true", help="RAG dùng LLM giả của scripts.bench_stubs.")
+    parser.add_argument("--answer-cache", action="store_true", help="Giữ answer cache (mặc định tắt).")
+    parser.add_argument("--stt-url", default=None, help="URL STT service (mặc định theo STT_HOST/STT_PORT).")
+    parser.add_argument("--tts-url", default=None, help="URL TTS service (mặc định theo TTS_HOST/TTS_PORT).")
+    parser.add_argument("--audio-dir", default=None, help="Thư mục audio thật cho STT (thay cho clip tổng hợp).")
+    parser.add_argument("--clip-seconds", default="2,4,8", help="Độ dài các clip tổng hợp cho STT.")
+    parser.add_argument("--tts-stream", action="store_true", help="Đo /speak/stream thay cho /speak.")
+    parser.add_argument("--output", default=None, help="Lưu kết quả ra tệp JSON.")
+    parser.add_argument("--baseline", default=None, help="So sánh với kết quả JSON đã lưu.")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    bench_env = dict(BENCH_ENV)
+    if args.answer_cache:
+        bench_env.pop("ANSWER_CACHE_ENABLED")
+    if args.offline:
+        bench_env.update(OFFLINE_ENV)
+    # settings đọc env lúc import: phải đặt trước khi nạp bất kỳ module nào của dự án
+    os.environ.update(bench_env)
+
+    from config import settings
+    from utils.logger import get_logger
+
+    logger = get_logger("benchmark")
+    args.k = args.k or settings.RETRIEVAL_K
+
+    items = load_items(args.csv)
+    queries = load_query_file(args.queries) if args.queries else build_queries(items)
+    random.Random(args.seed).shuffle(queries)
+    if args.limit:
+        queries = queries[:args.limit]
+    logger.info(f"--- BENCHMARK: {', '.join(args.targets)} | {len(queries)} câu hỏi, c={args.concurrency} ---")
+
+    report = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {
+            "concurrency": args.concurrency, "seed": args.seed, "limit": args.limit, "offline": args.offline,
+            "queries": args.queries or args.csv, "k": args.k,
+            "retrieval_mode": settings.RETRIEVAL_MODE, "embedding_backend": settings.EMBEDDING_BACKEND,
+        },
+        "targets": {},
+    }
+    runners = {
+        "retrieval": lambda: bench_retrieval(queries, args),
+        "rag": lambda: bench_rag(queries, args),
+        "stt": lambda: bench_stt(args),
+        "tts": lambda: bench_tts(items, args),
+    }
+    for name in args.targets:
+        try:
+            result = runners[name]()
+        except Exception as e:
+            logger.error(f"[{name}] không chạy được: {e}", exc_info=True)
+            continue
+        report["targets"][name] = result
+        log_report(logger, name, result)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        logger.info(f"Đã lưu kết quả vào {args.output}")
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            compare(logger, report, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
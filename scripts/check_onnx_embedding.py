@@ -0,0 +1,102 @@
+import sys
+import os
+# Thêm dòng này để chạy script từ thư mục gốc
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import time
+
+import numpy as np
+
+from src.helper import download_hugging_face_embeddings
+from src.onnx_embeddings import export_onnx_model
+from scripts.store_data_from_csv import load_data_from_csv
+from config import settings
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Câu hỏi thử được sinh từ tên hiện vật trong dataset
+QUERY_TEMPLATES = ("{ten}", "{ten} là gì?", "Ý nghĩa lịch sử của {ten}")
+
+def _normalize(m):
+    m = np.asarray(m, dtype=np.float32)
+    return m / np.clip(np.linalg.norm(m, axis=1, keepdims=True), 1e-9, None)
+
+def _top_k(queries, docs, k):
+    return np.argsort(-(queries @ docs.T), axis=1)[:, :k]
+
+def _embed_queries(embeddings, queries):
+    """Embed từng câu như lúc chạy thật (embed_query), trả về (ma trận, ms/câu)."""
+    start = time.perf_counter()
+    vectors = [embeddings.embed_query(q) for q in queries]
+    elapsed_ms = (time.perf_counter() - start) * 1000 / max(1, len(queries))
+    return _normalize(vectors), elapsed_ms
+
+def check_onnx_embedding(csv_path, backends, k):
+    logger.info("--- BẮT ĐẦU SO SÁNH EMBEDDING ONNX VỚI FP32 ---")
+
+    documents = load_data_from_csv(csv_path)
+    if not documents:
+        logger.error("Không có dữ liệu để so sánh.")
+        return
+
+    queries, expected = [], []
+    seen = set()
+    for doc in documents:
+        # Hiện vật có nhiều đoạn con chỉ sinh câu hỏi một lần
+        if doc.metadata["item_id"] in seen:
+            continue
+        seen.add(doc.metadata["item_id"])
+        for template in QUERY_TEMPLATES:
+            queries.append(template.format(ten=doc.metadata["ten"]))
+            expected.append(doc.metadata["item_id"])
+    item_ids = np.array([doc.metadata["item_id"] for doc in documents])
+    expected = np.array(expected)
+
+    # Vector tài liệu luôn là fp32 (giống DB được nạp bằng torch), chỉ thay backend cho câu hỏi
+    reference = download_hugging_face_embeddings("torch")
+    doc_vectors = _normalize(reference.embed_documents([doc.page_content for doc in documents]))
+    ref_queries, ref_ms = _embed_queries(reference, queries)
+    ref_top = _top_k(ref_queries, doc_vectors, k)
+    ref_hit = np.mean([exp in item_ids[row] for exp, row in zip(expected, ref_top)])
+
+    logger.info(f"{len(documents)} tài liệu, {len(queries)} câu hỏi, k={k}")
+    logger.info(f"[torch fp32] {ref_ms:.1f} ms/câu, hit@{k} (đúng hiện vật) = {ref_hit:.3f}")
+
+    for backend in backends:
+        embeddings = download_hugging_face_embeddings(backend)
+        if type(embeddings) is type(reference):
+            logger.error(f"Backend '{backend}' không tải được (đã quay về torch), bỏ qua.")
+            continue
+
+        vectors, ms = _embed_queries(embeddings, queries)
+        cosine = np.sum(vectors * ref_queries, axis=1)
+        top = _top_k(vectors, doc_vectors, k)
+        # recall@k so với fp32: tỉ lệ kết quả top-k của fp32 vẫn còn trong top-k của backend mới
+        recall = np.mean([len(set(a) & set(b)) / k for a, b in zip(top, ref_top)])
+        top1_same = np.mean(top[:, 0] == ref_top[:, 0])
+        hit = np.mean([exp in item_ids[row] for exp, row in zip(expected, top)])
+
+        logger.info(
+            f"[{backend}] {ms:.1f} ms/câu (x{ref_ms / ms if ms else 0:.2f}), "
+            f"cosine với fp32: mean={cosine.mean():.4f} min={cosine.min():.4f}, "
+            f"recall@{k} so với fp32 = {recall:.3f}, top-1 giống fp32 = {top1_same:.3f}, "
+            f"hit@{k} (đúng hiện vật) = {hit:.3f} (fp32: {ref_hit:.3f})"
+        )
+
+    logger.info("--- KIỂM TRA HOÀN TẤT ---")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Export và kiểm tra độ lệch của embedding ONNX/int8 so với fp32.")
+    parser.add_argument("--csv", default="dataset.csv", help="Tệp CSV dùng làm dữ liệu kiểm tra.")
+    parser.add_argument("--export", action="store_true", help="Export mô hình sang ONNX (+ int8) trước khi kiểm tra (cần requirements-dev.txt).")
+    parser.add_argument("--backends", nargs="+", default=["onnx", "onnx-int8"], help="Các backend cần so sánh.")
+    parser.add_argument("-k", type=int, default=5, help="k cho recall@k.")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.export:
+        export_onnx_model(settings.EMBEDDING_MODEL_NAME, settings.EMBEDDING_ONNX_DIR, quantize=True)
+    check_onnx_embedding(args.csv, args.backends, args.k)
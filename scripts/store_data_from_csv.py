@@ -3,56 +3,134 @@ import os
 # Thêm dòng này để chạy script từ thư mục gốc
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+import argparse
 import csv
+import hashlib
+import itertools
 from langchain_chroma import Chroma
 from langchain.schema import Document
-from src.helper import download_hugging_face_embeddings
+from src.ingestion.embedding_engine import IngestionEmbedder
+from src.core.answer_cache import write_db_version
+from src.core.hybrid_retriever import BM25Index, document_id as metadata_document_id
 from config import settings
 from utils.logger import get_logger
 import shutil
 
 logger = get_logger(__name__)
 
-def load_data_from_csv(filepath="dataset.csv"):
+# Thứ tự cột trong CSV -> tên trường dùng trong template
+ROW_FIELDS = ("item_id", "ten", "dac_diem", "thoi_ky", "cong_dung")
+
+# Template mặc định ghép các cột làm nội dung (content); có thể thay bằng --template-file
+DEFAULT_CONTENT_TEMPLATE = (
+    "Thông tin hiện vật: {ten}. "
+    "Đặc điểm chi tiết: {dac_diem}. "
+    "Hiện vật thuộc thời kỳ lịch sử: {thoi_ky}. "
+    "Công dụng chính hoặc ý nghĩa lịch sử là: {cong_dung}."
+)
+
+def compute_content_hash(content, metadata):
     """
-    Đọc dữ liệu từ tệp CSV và tạo danh sách Documents cho LangChain.
+    Hash nội dung + metadata của một hàng, dùng để phát hiện hàng đã thay đổi.
+    """
+    parts = [content] + [f"{k}={metadata[k]}" for k in sorted(metadata) if k not in ("source", "content_hash")]
+    return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+def document_id(doc):
+    """
+    ID ổn định trong Chroma và chỉ mục BM25 (xem src.core.hybrid_retriever.document_id).
+    """
+    return metadata_document_id(doc.metadata)
+
+def split_overlapping(text, max_chars, overlap):
+    """
+    Chia văn bản dài thành các đoạn <= max_chars, chồng lấn nhau khoảng `overlap` ký tự,
+    cắt tại khoảng trắng để không làm đứt từ.
+    """
+    if max_chars <= 0 or len(text) <= max_chars:
+        return [text]
+    overlap = min(overlap, max_chars // 2)
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = min(start + max_chars, len(text))
+        if end < len(text):
+            space = text.rfind(" ", start + overlap + 1, end)
+            if space != -1:
+                end = space
+        chunks.append(text[start:end].strip())
+        if end >= len(text):
+            break
+        next_start = max(end - overlap, start + 1)
+        # Bắt đầu đoạn tiếp theo ở đầu một từ
+        space = text.find(" ", next_start, end)
+        start = space + 1 if space != -1 else next_start
+    return [c for c in chunks if c]
+
+def make_row_renderer(template=DEFAULT_CONTENT_TEMPLATE):
+    """
+    Trả về hàm row(dict) -> content. `template` là chuỗi format với các trường
+    trong ROW_FIELDS, hoặc một hàm nhận dict hàng và trả về content.
+    """
+    if callable(template):
+        return template
+    return lambda row: template.format(**row)
+
+def iter_documents_from_csv(filepath="dataset.csv", template=DEFAULT_CONTENT_TEMPLATE,
+                            chunk_max_chars=settings.INGEST_CHUNK_MAX_CHARS,
+                            chunk_overlap=settings.INGEST_CHUNK_OVERLAP):
+    """
+    Đọc CSV theo kiểu streaming và yield từng Document, không giữ toàn bộ tệp trong RAM.
+    Cột "Đặc Điểm" dài được chia thành các đoạn con chồng lấn, mỗi đoạn là một Document.
+    Hàng có item_id đã gặp bị bỏ nguyên hàng (giữ hàng đầu tiên): Chroma từ chối một batch
+    chứa cùng ID hai lần, và đoạn con thừa của hàng trùng không được lẫn vào DB.
     """
-    documents = []
+    render = make_row_renderer(template)
     logger.info(f"Đang đọc tệp {filepath}...")
-    
-    try:
-        with open(filepath, encoding="utf-8") as file:
-            reader = csv.reader(file)
-            header = next(reader) # Bỏ qua dòng tiêu đề
-            
-            count = 0
-            for i, line in enumerate(reader):
-                if len(line) < 5: 
-                    logger.warning(f"Bỏ qua dòng {i+2}: không đủ cột.")
-                    continue
-                
-                # Ghép các thông tin làm nội dung (content)
-                content = (
-                    f"Thông tin hiện vật: {line[1]}. "
-                    f"Đặc điểm chi tiết: {line[2]}. "
-                    f"Hiện vật thuộc thời kỳ lịch sử: {line[3]}. "
-                    f"Công dụng chính hoặc ý nghĩa lịch sử là: {line[4]}."
-                )
+
+    with open(filepath, encoding="utf-8") as file:
+        reader = csv.reader(file)
+        header = next(reader) # Bỏ qua dòng tiêu đề
+        
+        count = 0
+        seen_items = set()  # chỉ giữ item_id, không giữ nội dung hàng
+        for i, line in enumerate(reader):
+            if len(line) < 5: 
+                logger.warning(f"Bỏ qua dòng {i+2}: không đủ cột.")
+                continue
+
+            row = dict(zip(ROW_FIELDS, line))
+            if row["item_id"] in seen_items:
+                logger.warning(f"Bỏ qua dòng {i+2}: item_id trùng lặp '{row['item_id']}', giữ hàng xuất hiện trước.")
+                continue
+            seen_items.add(row["item_id"])
+            pieces = split_overlapping(row["dac_diem"], chunk_max_chars, chunk_overlap)
+
+            for chunk_index, piece in enumerate(pieces):
+                content = render({**row, "dac_diem": piece})
                 
                 # Tạo metadata
                 metadata = {
-                    "item_id": line[0],
-                    "ten": line[1],
-                    "thoi_ky": line[3],
+                    "item_id": row["item_id"],
+                    "ten": row["ten"],
+                    "thoi_ky": row["thoi_ky"],
                     "source": filepath
                 }
+                if len(pieces) > 1:
+                    metadata["chunk"] = chunk_index
+                metadata["content_hash"] = compute_content_hash(content, metadata)
                 
-                documents.append(Document(page_content=content, metadata=metadata))
-                count += 1
-                
-        logger.info(f"Đã đọc thành công {count} tài liệu từ CSV.")
-        return documents
-        
+                yield Document(page_content=content, metadata=metadata)
+            count += 1
+            
+    logger.info(f"Đã đọc thành công {count} hàng từ CSV.")
+
+def load_data_from_csv(filepath="dataset.csv", template=DEFAULT_CONTENT_TEMPLATE):
+    """
+    Đọc dữ liệu từ tệp CSV và tạo danh sách Documents cho LangChain.
+    """
+    try:
+        return list(iter_documents_from_csv(filepath, template))
     except FileNotFoundError:
         logger.error(f"LỖI: Không tìm thấy tệp {filepath}. Vui lòng kiểm tra lại.")
         return []
@@ -60,30 +138,147 @@ def load_data_from_csv(filepath="dataset.csv"):
         logger.error(f"Lỗi khi đọc CSV: {e}", exc_info=True)
         return []
 
+def full_rebuild(documents, embedder):
+    """
+    Xóa toàn bộ thư mục DB và nạp lại từ đầu (chế độ cũ, dùng khi muốn làm sạch hoàn toàn).
+    `documents` có thể là generator: việc đọc, embed và ghi chạy song song.
+    """
+    documents = iter(documents)
+    first = next(documents, None)
+    if first is None:
+        logger.error("Không có dữ liệu để xử lý. Giữ nguyên DB hiện tại.")
+        return False
+
+    if os.path.exists(settings.PERSIST_DIRECTORY):
+        logger.warning(f"Phát hiện thư mục cũ. Đang xóa: '{settings.PERSIST_DIRECTORY}'")
+        shutil.rmtree(settings.PERSIST_DIRECTORY)
+
+    bm25 = BM25Index()
+
+    def indexed(docs):
+        for doc in docs:
+            bm25.upsert(document_id(doc), doc.page_content, doc.metadata)
+            yield doc
+
+    vectordb = Chroma(persist_directory=settings.PERSIST_DIRECTORY)
+    written = embedder.embed_and_write(
+        indexed(itertools.chain([first], documents)), document_id, vectordb._collection
+    )
+    bm25.save(settings.BM25_INDEX_PATH)
+    logger.info(f"Đã lưu thành công {written} vector vào ChromaDB, {len(bm25)} tài liệu vào chỉ mục BM25.")
+    return True
+
+def incremental_sync(documents, embedder):
+    """
+    Đồng bộ tăng dần: dùng item_id làm ID ổn định, chỉ embed lại các hàng mới/thay đổi
+    (so sánh content_hash) và xóa các hàng không còn trong CSV.
+    DB không bị xóa nên service đang chạy vẫn đọc được trong lúc đồng bộ.
+    Trả về True nếu DB có thay đổi.
+    """
+    # Vector được tính sẵn bởi embedder nên không cần embedding_function ở đây
+    vectordb = Chroma(persist_directory=settings.PERSIST_DIRECTORY)
+    existing = vectordb.get(include=["metadatas"])
+    existing_hashes = {
+        doc_id: (meta or {}).get("content_hash")
+        for doc_id, meta in zip(existing["ids"], existing["metadatas"])
+    }
+
+    # Chỉ mục BM25 được cập nhật cùng lúc; nếu chưa có (DB cũ) thì được dựng đầy đủ ở lần chạy này
+    bm25 = BM25Index.load_or_empty(settings.BM25_INDEX_PATH)
+    bm25_changed = False
+    seen_ids = set()
+
+    def changed_documents():
+        nonlocal bm25_changed
+        for doc in documents:
+            doc_id = document_id(doc)
+            if doc_id in seen_ids:
+                # iter_documents_from_csv đã bỏ hàng trùng; chặn thêm ở đây vì một batch upsert
+                # chứa cùng ID hai lần sẽ bị Chroma từ chối
+                logger.warning(f"ID trùng lặp '{doc_id}', bỏ qua document xuất hiện sau.")
+                continue
+            seen_ids.add(doc_id)
+            if bm25.content_hash(doc_id) != doc.metadata["content_hash"]:
+                bm25.upsert(doc_id, doc.page_content, doc.metadata)
+                bm25_changed = True
+            if existing_hashes.get(doc_id) != doc.metadata["content_hash"]:
+                yield doc
+
+    # upsert với ID đã tồn tại sẽ ghi đè vector cũ
+    upserted = embedder.embed_and_write(changed_documents(), document_id, vectordb._collection)
+
+    if not seen_ids:
+        logger.error("CSV không có dữ liệu, bỏ qua bước xóa để tránh làm rỗng DB.")
+        return bool(upserted)
+
+    # Bao gồm cả các ID ngẫu nhiên từ DB cũ (trước khi dùng item_id làm ID)
+    to_delete = [doc_id for doc_id in existing_hashes if doc_id not in seen_ids]
+    if to_delete:
+        vectordb.delete(ids=to_delete)
+
+    bm25_deleted = [doc_id for doc_id in list(bm25.docs) if doc_id not in seen_ids]
+    if bm25_deleted:
+        bm25.delete(bm25_deleted)
+    if bm25_changed or bm25_deleted or not os.path.exists(settings.BM25_INDEX_PATH):
+        bm25.save(settings.BM25_INDEX_PATH)
+        logger.info(f"Đã cập nhật chỉ mục BM25: {len(bm25)} tài liệu.")
+
+    logger.info(
+        f"Đồng bộ tăng dần: {len(seen_ids)} document trong CSV, {len(existing_hashes)} vector trước đó, "
+        f"{upserted} đã embed lại, {len(to_delete)} đã xóa."
+    )
+    return bool(upserted or to_delete or bm25_changed or bm25_deleted)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Nạp dữ liệu CSV vào ChromaDB.")
+    parser.add_argument("--csv", default="dataset.csv", help="Đường dẫn tệp CSV.")
+    parser.add_argument(
+        "--full", action="store_true",
+        help="Xóa DB và nạp lại toàn bộ thay vì đồng bộ tăng dần."
+    )
+    parser.add_argument("--batch-size", type=int, default=settings.INGEST_BATCH_SIZE, help="Số văn bản mỗi batch embedding.")
+    parser.add_argument(
+        "--workers", type=int, default=settings.INGEST_NUM_WORKERS,
+        help="Số process embedding song song (mỗi process một bản sao mô hình)."
+    )
+    parser.add_argument(
+        "--template-file",
+        help="Tệp chứa template nội dung (chuỗi format với các trường: " + ", ".join(ROW_FIELDS) + ")."
+    )
+    return parser.parse_args()
+
 def main():
+    args = parse_args()
     logger.info("--- BẮT ĐẦU QUÁ TRÌNH NẠP DỮ LIỆU ---")
     
-    documents = load_data_from_csv("dataset.csv")
-    
-    if not documents:
-        logger.error("Không có dữ liệu để xử lý. Dừng lại.")
+    if not os.path.exists(args.csv):
+        logger.error(f"LỖI: Không tìm thấy tệp {args.csv}. Vui lòng kiểm tra lại.")
         return
 
-    embeddings = download_hugging_face_embeddings()
+    template = DEFAULT_CONTENT_TEMPLATE
+    if args.template_file:
+        with open(args.template_file, encoding="utf-8") as f:
+            template = f.read().strip()
+
+    # Generator: các hàng được đọc dần trong lúc embed/ghi, không nạp toàn bộ CSV vào RAM
+    documents = iter_documents_from_csv(args.csv, template)
+
+    embedder = IngestionEmbedder(batch_size=args.batch_size, num_workers=args.workers)
 
     logger.info(f"Đang tạo/lưu trữ vector vào thư mục: '{settings.PERSIST_DIRECTORY}'...")
-    
-    if os.path.exists(settings.PERSIST_DIRECTORY):
-        logger.warning(f"Phát hiện thư mục cũ. Đang xóa: '{settings.PERSIST_DIRECTORY}'")
-        shutil.rmtree(settings.PERSIST_DIRECTORY)
 
     try:
-        vectordb = Chroma.from_documents(
-            documents=documents,
-            embedding=embeddings,
-            persist_directory=settings.PERSIST_DIRECTORY
-        )
-        logger.info(f"Đã lưu thành công {len(documents)} vector vào ChromaDB.")
+        if args.full:
+            changed = full_rebuild(documents, embedder)
+        else:
+            changed = incremental_sync(documents, embedder)
+
+        if changed:
+            # Báo cho RAGEngine biết DB đã thay đổi để xóa cache câu trả lời
+            version = write_db_version(settings.VECTOR_DB_VERSION_FILE)
+            logger.info(f"Đã cập nhật phiên bản DB: {version}")
+        else:
+            logger.info("Không có thay đổi nào so với DB hiện tại.")
         logger.info("--- HOÀN TẤT NẠP DỮ LIỆU VÀO CHROMA ---")
     except Exception as e:
         logger.error(f"Lỗi khi nạp vào ChromaDB: {e}", exc_info=True)
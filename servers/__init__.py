@@ -1,6 +1,10 @@
 """
 Servers package:
+- embedding_service: shared embedding model with request coalescing (EMBEDDING_BACKEND=remote)
 - stt_service: Speech-to-Text microservice (Faster-Whisper)
+- stt_pool: STT worker pool with a bounded queue and micro-batching
+- stt_streaming: sliding-window incremental transcription (stable/unstable text)
+- stt_tiering: small/large Whisper routing with escalation on low confidence, start-up warm-up
 - tts_service: Text-to-Speech microservice (Edge-TTS)
 """
 
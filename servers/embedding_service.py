@@ -0,0 +1,243 @@
+"""
+Embedding microservice: one copy of the embedding model shared by every process.
+
+The web server(s), ingestion and the check scripts use it through
+`src.remote_embeddings.RemoteEmbeddings` when EMBEDDING_BACKEND=remote, instead
+of each loading its own copy of the model. Requests that arrive within
+EMBEDDING_BATCH_WINDOW_MS of each other are coalesced into a single
+`embed_documents` call (one forward pass, up to EMBEDDING_MAX_BATCH texts);
+the model itself runs on one thread, off the event loop.
+
+Endpoints: POST /embed {"texts": [...]} -> {"embeddings": [[...], ...]}, or raw
+little-endian float32 rows (header X-Embedding-Dim) with
+`Accept: application/octet-stream`; /health; /stats; /metrics (latency of each
+request and of each coalesced forward pass).
+"""
+
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import List, Optional
+
+import numpy as np
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, Response
+
+from src.helper import download_hugging_face_embeddings
+from src.utils import tracing
+from utils.logger import get_logger
+from config import settings
+
+logger = get_logger(__name__)
+
+
+class _Request:
+    __slots__ = ("texts", "future")
+
+    def __init__(self, texts: List[str], future: asyncio.Future):
+        self.texts = texts
+        self.future = future
+
+
+class EmbeddingBatcher:
+    def __init__(self, embeddings, batch_window_ms: int = 5, max_batch: int = 64):
+        self.embeddings = embeddings
+        self.batch_window = batch_window_ms / 1000
+        self.max_batch = max(1, max_batch)
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        # Một thread: các forward pass không tranh nhau CPU
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embed")
+
+        self.requests = 0
+        self.texts = 0
+        self.batches = 0
+        self.busy_seconds_total = 0.0
+
+    def start(self) -> None:
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        request = _Request(texts, asyncio.get_running_loop().create_future())
+        self._queue.put_nowait(request)
+        return await request.future
+
+    async def _collect(self, first: _Request) -> List[_Request]:
+        batch, size = [first], len(first.texts)
+        deadline = time.perf_counter() + self.batch_window
+        while size < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            try:
+                request = self._queue.get_nowait() if remaining <= 0 else await asyncio.wait_for(
+                    self._queue.get(), remaining
+                )
+            except (asyncio.QueueEmpty, asyncio.TimeoutError):
+                break
+            batch.append(request)
+            size += len(request.texts)
+        return batch
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect(await self._queue.get())
+            batch = [request for request in batch if not request.future.cancelled()]
+            if not batch:
+                continue
+            texts = [text for request in batch for text in request.texts]
+
+            start = time.perf_counter()
+            try:
+                vectors = await loop.run_in_executor(self._executor, self.embeddings.embed_documents, texts)
+            except Exception as e:
+                tracing.observe("embed_batch", time.perf_counter() - start, error=True)
+                logger.error(f"Embedding batch failed: {e}", exc_info=True)
+                for request in batch:
+                    if not request.future.done():
+                        request.future.set_exception(e)
+                continue
+            finally:
+                self.busy_seconds_total += time.perf_counter() - start
+
+            tracing.observe("embed_batch", time.perf_counter() - start)
+            self.requests += len(batch)
+            self.texts += len(texts)
+            self.batches += 1
+            offset = 0
+            for request in batch:
+                n = len(request.texts)
+                if not request.future.done():
+                    request.future.set_result(vectors[offset:offset + n])
+                offset += n
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "texts": self.texts,
+            "batches": self.batches,
+            "avg_requests_per_batch": round(self.requests / self.batches, 2) if self.batches else 0.0,
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "busy_seconds": round(self.busy_seconds_total, 2),
+        }
+
+
+batcher: Optional[EmbeddingBatcher] = None
+startup_timings: dict = {}
+_startup: Optional[asyncio.Task] = None
+
+
+async def _load() -> None:
+    global batcher
+    loop = asyncio.get_running_loop()
+    started = time.perf_counter()
+    # Dịch vụ tự nạp model tại chỗ, không bao giờ gọi lại chính nó
+    embeddings = await loop.run_in_executor(None, download_hugging_face_embeddings, settings.EMBEDDING_SERVICE_BACKEND)
+    startup_timings["load_model"] = round(time.perf_counter() - started, 3)
+    started = time.perf_counter()
+    await loop.run_in_executor(None, embeddings.embed_query, "xin chào")
+    startup_timings["warmup"] = round(time.perf_counter() - started, 3)
+
+    ready = EmbeddingBatcher(
+        embeddings,
+        batch_window_ms=settings.EMBEDDING_BATCH_WINDOW_MS,
+        max_batch=settings.EMBEDDING_MAX_BATCH,
+    )
+    ready.start()
+    batcher = ready
+    logger.info("Embedding service is ready.")
+
+
+def _on_loaded(task: asyncio.Task) -> None:
+    if not task.cancelled() and task.exception() is not None:
+        logger.error(f"Embedding model loading failed: {task.exception()}", exc_info=task.exception())
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Lifespan context manager for FastAPI startup/shutdown."""
+    global batcher, _startup
+    # Nạp model nền: service nhận kết nối ngay, /health báo 503 cho tới khi sẵn sàng
+    _startup = asyncio.create_task(_load())
+    _startup.add_done_callback(_on_loaded)
+    yield
+    if not _startup.done():
+        _startup.cancel()
+    if batcher is not None:
+        await batcher.stop()
+    batcher = None
+
+
+app = FastAPI(title="BrainV2 Embedding Service", version="0.1.0", lifespan=lifespan)
+app.add_middleware(tracing.TraceMiddleware)
+
+
+@app.post("/embed")
+async def embed(request: Request):
+    """Embed a list of texts (documents or queries, the model treats them the same)."""
+    if batcher is None:
+        raise HTTPException(status_code=503, detail="Model is not loaded yet")
+    try:
+        data = await request.json()
+    except ValueError:
+        data = None
+    texts = data.get("texts") if isinstance(data, dict) else None
+    if not isinstance(texts, list) or not all(isinstance(t, str) for t in texts):
+        raise HTTPException(status_code=400, detail='expected {"texts": ["...", ...]}')
+    if len(texts) > settings.EMBEDDING_MAX_BATCH:
+        raise HTTPException(status_code=413, detail=f"at most {settings.EMBEDDING_MAX_BATCH} texts per request")
+    if not texts:
+        return {"embeddings": []}
+
+    with tracing.span("embed"):
+        vectors = await batcher.embed(texts)
+    if "application/octet-stream" in request.headers.get("accept", ""):
+        matrix = np.asarray(vectors, dtype="<f4")
+        return Response(
+            matrix.tobytes(),
+            media_type="application/octet-stream",
+            headers={"X-Embedding-Dim": str(matrix.shape[1])},
+        )
+    return {"embeddings": vectors}
+
+
+@app.get("/health")
+async def health():
+    """Readiness probe: 200 once the model is loaded and warmed up, 503 before (or if loading failed)."""
+    if batcher is not None:
+        return {"status": "ready", "phases": startup_timings}
+    payload = {"status": "starting", "phases": startup_timings}
+    if _startup is not None and _startup.done() and not _startup.cancelled() and _startup.exception():
+        payload.update(status="error", error=str(_startup.exception()))
+    return JSONResponse(payload, status_code=503)
+
+
+@app.get("/metrics")
+async def metrics():
+    """Per-stage latency histograms in the Prometheus text format."""
+    return Response(tracing.render_metrics(), media_type=tracing.METRICS_CONTENT_TYPE)
+
+
+@app.get("/stats")
+async def stats():
+    """Request coalescing counters."""
+    return batcher.stats() if batcher is not None else {}
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run(
+        "servers.embedding_service:app",
+        host=settings.EMBEDDING_SERVICE_HOST,
+        port=settings.EMBEDDING_SERVICE_PORT,
+        reload=False,
+    )
@@ -0,0 +1,356 @@
+"""
+Worker pool for the STT service.
+
+Transcription jobs go into a bounded asyncio queue and are executed on a thread
+pool, so the FastAPI event loop never blocks on Whisper. The pool runs
+STT_REPLICAS model copies with STT_WORKERS_PER_REPLICA dispatchers each
+(CTranslate2 `num_workers` lets calls on one model run in parallel).
+
+Short clips arriving within STT_BATCH_WINDOW_MS of each other are micro-batched:
+their features are stacked and go through one encoder pass and one batched
+`generate` call. Anything else (long clips, file paths, segment/streaming jobs)
+is transcribed alone.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+
+from src.utils.audio_handler import WHISPER_SAMPLE_RATE
+from src.utils.tracing import observe
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+Audio = Union[str, np.ndarray]
+Segment = Tuple[float, float, str]  # (start, end, text), seconds from the start of the clip
+
+# Giống quy tắc mặc định của faster-whisper: đoạn bị bỏ khi xác suất "không có tiếng nói" cao
+# VÀ độ tin cậy thấp (câu giải mã chắc chắn thì vẫn giữ dù no_speech_prob cao)
+NO_SPEECH_THRESHOLD = 0.6
+LOG_PROB_THRESHOLD = -1.0
+
+
+def iter_segments(model, audio: Audio) -> Iterator[Segment]:
+    """Yield Whisper segments as they are decoded (faster-whisper decodes lazily)."""
+    segments, _ = model.transcribe(
+        audio,
+        language="vi",
+        beam_size=1,
+        vad_filter=True,
+        condition_on_previous_text=False,
+    )
+    for segment in segments:
+        text = segment.text.strip()
+        if text:
+            yield segment.start, segment.end, text
+
+
+def transcribe_one(model, audio: Audio) -> str:
+    """Run Whisper on a file path or a float32 16 kHz array and join the segments."""
+    return " ".join(text for _, _, text in iter_segments(model, audio)).strip()
+
+
+def transcribe_batch(model, audios: List[np.ndarray], with_logprob: bool = False) -> list:
+    """
+    Transcribe several clips (each <= 30 s) in one batched encoder/decoder
+    pass, as faster-whisper's BatchedInferencePipeline does for chunks of a
+    single file. Greedy decoding, no timestamps. With `with_logprob`, returns
+    (text, avg_logprob) pairs instead of texts.
+    """
+    from faster_whisper.audio import pad_or_trim
+    from faster_whisper.tokenizer import Tokenizer
+    from faster_whisper.transcribe import get_suppressed_tokens
+
+    tokenizer = Tokenizer(model.hf_tokenizer, model.model.is_multilingual, task="transcribe", language="vi")
+    features = np.stack([pad_or_trim(model.feature_extractor(audio)) for audio in audios])
+    encoder_output = model.encode(features)
+    prompt = model.get_prompt(tokenizer, previous_tokens=[], without_timestamps=True)
+
+    results = model.model.generate(
+        encoder_output,
+        [list(prompt) for _ in audios],
+        beam_size=1,
+        max_length=model.max_length,
+        suppress_blank=True,
+        suppress_tokens=get_suppressed_tokens(tokenizer, [-1]),
+        return_no_speech_prob=True,
+        return_scores=True,
+    )
+
+    texts = []
+    for result in results:
+        # Cùng công thức avg_logprob của faster-whisper (length_penalty = 1)
+        seq_len = len(result.sequences_ids[0])
+        avg_logprob = result.scores[0] * seq_len / (seq_len + 1)
+        if result.no_speech_prob > NO_SPEECH_THRESHOLD and avg_logprob < LOG_PROB_THRESHOLD:
+            texts.append(("", 0.0) if with_logprob else "")
+            continue
+        tokens = [t for t in result.sequences_ids[0] if t < tokenizer.eot]
+        text = tokenizer.decode(tokens).strip()
+        texts.append((text, avg_logprob) if with_logprob else text)
+    return texts
+
+
+class QueueFull(Exception):
+    """The STT queue is at capacity; the caller should retry later."""
+
+
+# Loại job: văn bản gộp (có thể batch), danh sách segment, hoặc stream segment qua `sink`
+TEXT, SEGMENTS, STREAM = "text", "segments", "stream"
+
+
+class _Job:
+    __slots__ = ("audio", "future", "enqueued_at", "kind", "sink")
+
+    def __init__(self, audio: Audio, future: asyncio.Future, kind: str = TEXT, sink=None):
+        self.audio = audio
+        self.future = future
+        self.enqueued_at = time.perf_counter()
+        self.kind = kind
+        self.sink = sink
+
+
+class STTWorkerPool:
+    def __init__(
+        self,
+        model_factory: Callable[[], Any],
+        replicas: int = 1,
+        workers_per_replica: int = 1,
+        queue_size: int = 32,
+        batch_window_ms: int = 20,
+        max_batch: int = 8,
+        batch_max_seconds: float = 15.0,
+        warmup: Optional[Callable[[Any], None]] = None,
+    ):
+        self.model_factory = model_factory
+        self.warmup = warmup
+        self.replicas = max(1, replicas)
+        self.workers_per_replica = max(1, workers_per_replica)
+        self.queue_size = max(1, queue_size)
+        self.batch_window = batch_window_ms / 1000
+        self.max_batch = max(1, max_batch)
+        self.batch_max_samples = int(min(batch_max_seconds, 30.0) * WHISPER_SAMPLE_RATE)
+
+        self.models: List[Any] = []
+        self._queue: Optional[asyncio.Queue] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._dispatchers: List[asyncio.Task] = []
+        self._batching_supported = True
+        self.startup_timings: dict = {}
+
+        # Metrics
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.batches = 0
+        self.batched_jobs = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.busy_seconds_total = 0.0
+
+    # --- Lifecycle ---
+
+    async def start(self) -> None:
+        loop = asyncio.get_running_loop()
+        for i in range(self.replicas):
+            logger.info(f"Loading STT model replica {i + 1}/{self.replicas}...")
+            # Tải model ngoài event loop
+            started = time.perf_counter()
+            model = await loop.run_in_executor(None, self.model_factory)
+            self.startup_timings[f"load_replica_{i + 1}"] = round(time.perf_counter() - started, 3)
+            if self.warmup is not None:
+                # Lần suy luận đầu tiên khởi tạo lười rất nhiều thứ: trả giá lúc khởi động, không phải ở request đầu
+                started = time.perf_counter()
+                await loop.run_in_executor(None, self.warmup, model)
+                self.startup_timings[f"warmup_replica_{i + 1}"] = round(time.perf_counter() - started, 3)
+                logger.info(f"STT replica {i + 1} warmed up in {time.perf_counter() - started:.2f}s")
+            self.models.append(model)
+
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.replicas * self.workers_per_replica, thread_name_prefix="stt"
+        )
+        for model in self.models:
+            for _ in range(self.workers_per_replica):
+                self._dispatchers.append(asyncio.create_task(self._dispatch(model)))
+        logger.info(
+            f"STT pool ready: {self.replicas} replica(s) x {self.workers_per_replica} worker(s), "
+            f"queue {self.queue_size}, batch <= {self.max_batch} within {self.batch_window * 1000:.0f} ms"
+        )
+
+    async def stop(self) -> None:
+        for task in self._dispatchers:
+            task.cancel()
+        await asyncio.gather(*self._dispatchers, return_exceptions=True)
+        self._dispatchers = []
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+        self.models = []
+
+    @property
+    def ready(self) -> bool:
+        return bool(self._dispatchers)
+
+    # --- Submitting ---
+
+    def _submit(self, audio: Audio, kind: str = TEXT, sink=None) -> _Job:
+        job = _Job(audio, asyncio.get_running_loop().create_future(), kind, sink)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise QueueFull(f"STT queue is full ({self.queue_size} jobs waiting)")
+        return job
+
+    async def transcribe(self, audio: Audio) -> str:
+        """Queue one clip and wait for its text. Raises QueueFull when the queue is at capacity."""
+        return await self._submit(audio).future
+
+    async def segments(self, audio: Audio) -> List[Segment]:
+        """Queue one clip and wait for its timestamped segments."""
+        return await self._submit(audio, SEGMENTS).future
+
+    async def stream(self, audio: Audio) -> AsyncIterator[Segment]:
+        """Queue one clip and yield each segment as soon as Whisper produces it."""
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+
+        def sink(item) -> None:
+            loop.call_soon_threadsafe(queue.put_nowait, item)
+
+        job = self._submit(audio, STREAM, sink)
+        try:
+            while True:
+                item = await queue.get()
+                if item is None:  # worker finished (or failed)
+                    break
+                yield item
+            await job.future
+        finally:
+            # Người nhận bỏ đi giữa chừng: worker dừng ở segment kế tiếp
+            job.future.cancel()
+
+    # --- Workers ---
+
+    def _batchable(self, job: _Job) -> bool:
+        return (
+            self._batching_supported
+            and job.kind == TEXT
+            and isinstance(job.audio, np.ndarray)
+            and job.audio.size <= self.batch_max_samples
+        )
+
+    async def _collect(self, first: _Job) -> tuple:
+        """Gather more short clips that arrive within the batch window."""
+        batch, single = [first], []
+        if self.max_batch == 1 or not self._batchable(first):
+            return batch, single
+        deadline = time.perf_counter() + self.batch_window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            try:
+                job = self._queue.get_nowait() if remaining <= 0 else await asyncio.wait_for(
+                    self._queue.get(), remaining
+                )
+            except (asyncio.QueueEmpty, asyncio.TimeoutError):
+                break
+            (batch if self._batchable(job) else single).append(job)
+        return batch, single
+
+    async def _dispatch(self, model) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            first = await self._queue.get()
+            batch, single = await self._collect(first)
+            groups = [batch] + [[job] for job in single]
+            for group in groups:
+                group = [job for job in group if not job.future.cancelled()]
+                if group:
+                    await self._run(loop, model, group)
+
+    async def _run(self, loop, model, jobs: List[_Job]) -> None:
+        start = time.perf_counter()
+        for job in jobs:
+            wait = start - job.enqueued_at
+            self.wait_seconds_total += wait
+            self.wait_seconds_max = max(self.wait_seconds_max, wait)
+            observe("stt_queue_wait", wait)
+
+        failed = False
+        try:
+            if len(jobs) == 1:
+                texts = [await loop.run_in_executor(self._executor, self._execute, model, jobs[0])]
+            else:
+                texts = await loop.run_in_executor(self._executor, self._transcribe_many, model, jobs)
+                self.batches += 1
+                self.batched_jobs += len(jobs)
+        except Exception as e:
+            failed = True
+            logger.error(f"STT job failed: {e}", exc_info=True)
+            self.failed += len(jobs)
+            for job in jobs:
+                if not job.future.done():
+                    job.future.set_exception(e)
+            return
+        finally:
+            self.busy_seconds_total += time.perf_counter() - start
+            observe("stt_inference", time.perf_counter() - start, error=failed)
+
+        self.completed += len(jobs)
+        for job, text in zip(jobs, texts):
+            if not job.future.done():
+                job.future.set_result(text)
+
+    def _execute(self, model, job: _Job):
+        if job.kind == SEGMENTS:
+            return list(iter_segments(model, job.audio))
+        if job.kind == STREAM:
+            # Model phân tầng: stream thẳng từ model chính xác, không chờ giải mã hết để xét nâng cấp
+            model = getattr(model, "streaming_model", model)
+            try:
+                for segment in iter_segments(model, job.audio):
+                    if job.future.cancelled():
+                        break
+                    job.sink(segment)
+            finally:
+                job.sink(None)
+            return None
+        return transcribe_one(model, job.audio)
+
+    def _transcribe_many(self, model, jobs: List[_Job]) -> List[str]:
+        # Model phân tầng (servers/stt_tiering.py) tự định tuyến các clip trong batch
+        batch = getattr(model, "transcribe_batch", None) or (lambda audios: transcribe_batch(model, audios))
+        try:
+            return batch([job.audio for job in jobs])
+        except (ImportError, AttributeError, TypeError) as e:
+            # Phiên bản faster-whisper khác API nội bộ: tắt hẳn batching
+            logger.warning(f"Batched STT unavailable ({e}), transcribing one clip at a time from now on.")
+            self._batching_supported = False
+        except Exception as e:
+            logger.warning(f"Batched STT failed ({e}), retrying clips one by one.")
+        return [transcribe_one(model, job.audio) for job in jobs]
+
+    # --- Metrics ---
+
+    def stats(self) -> dict:
+        started = self.completed + self.failed
+        return {
+            "replicas": self.replicas,
+            "workers_per_replica": self.workers_per_replica,
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "queue_size": self.queue_size,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "batches": self.batches,
+            "avg_batch_size": round(self.batched_jobs / self.batches, 2) if self.batches else 0.0,
+            "wait_ms_avg": round(1000 * self.wait_seconds_total / started, 2) if started else 0.0,
+            "wait_ms_max": round(1000 * self.wait_seconds_max, 2),
+            "busy_seconds": round(self.busy_seconds_total, 2),
+        }
@@ -3,53 +3,127 @@ STT microservice using Faster-Whisper.
 
 Expose a simple HTTP API (FastAPI) for audio transcription.
 Optimized for Vietnamese realtime transcription (short chunks).
+Whisper runs on a worker pool (`servers/stt_pool.py`), never on the event loop.
+
+Endpoints: /transcribe (upload, full text), /transcribe/pcm (raw PCM body),
+/transcribe/stream (upload, NDJSON segments as they are decoded) and
+/ws/transcribe (chunked PCM in, stable/unstable interim hypotheses out).
+Requests are traced under the caller's X-Request-ID; /metrics exports the
+decode / queue-wait / inference / transcribe latency histograms.
 """
 
+import asyncio
+import json
 import os
+import uuid
 import warnings
 from contextlib import asynccontextmanager
-from typing import Optional
+from typing import AsyncIterator, Optional, Union
 
 # Suppress known warnings BEFORE importing faster_whisper (which imports ctranslate2)
 warnings.filterwarnings("ignore", message=".*pkg_resources is deprecated.*")
 warnings.filterwarnings("ignore", category=UserWarning, module="ctranslate2")
 
-from fastapi import FastAPI, File, UploadFile
+import numpy as np
+from fastapi import FastAPI, File, HTTPException, Request, UploadFile, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from faster_whisper import WhisperModel
 
+from servers.stt_pool import QueueFull, STTWorkerPool
+from servers.stt_streaming import StreamingTranscriber
+from servers.stt_tiering import TieredWhisper, warm_up
+from src.utils.audio_handler import PcmResampler, decode_audio_bytes, get_temp_audio_dir, pcm16_to_float32
+from src.utils import tracing
 from utils.logger import get_logger
 from config import settings
 
 logger = get_logger(__name__)
 
 
-def load_whisper_model() -> WhisperModel:
-    """Load Faster-Whisper model with config from settings."""
-    model_size = settings.STT_MODEL_NAME
+def _load_model(model_size: str) -> WhisperModel:
     device = settings.STT_DEVICE
     compute_type = settings.STT_COMPUTE_TYPE
 
     logger.info(
         f"Loading Faster-Whisper model: size={model_size}, device={device}, compute_type={compute_type}"
     )
-    model = WhisperModel(model_size, device=device, compute_type=compute_type)
-    return model
+    return WhisperModel(
+        model_size,
+        device=device,
+        compute_type=compute_type,
+        cpu_threads=settings.STT_CPU_THREADS,
+        num_workers=settings.STT_WORKERS_PER_REPLICA,
+    )
+
+
+def load_whisper_model() -> Union[WhisperModel, TieredWhisper]:
+    """
+    Load Faster-Whisper with config from settings: STT_MODEL_NAME alone, or
+    paired with STT_FAST_MODEL_NAME as a `TieredWhisper` when that is set.
+    """
+    accurate = _load_model(settings.STT_MODEL_NAME)
+    fast_size = settings.STT_FAST_MODEL_NAME
+    if not fast_size or fast_size == settings.STT_MODEL_NAME:
+        return accurate
+    return TieredWhisper(
+        _load_model(fast_size),
+        accurate,
+        fast_max_seconds=settings.STT_FAST_MAX_SECONDS,
+        fast_min_speech_ratio=settings.STT_FAST_MIN_SPEECH_RATIO,
+        escalate_logprob=settings.STT_ESCALATE_LOGPROB,
+    )
 
 
-whisper_model: Optional[WhisperModel] = None
+stt_pool: Optional[STTWorkerPool] = None
+_pool_startup: Optional[asyncio.Task] = None
+
+
+async def _transcribe(audio: Union[str, np.ndarray]) -> str:
+    """Queue a clip on the worker pool; a full queue becomes 429 + Retry-After."""
+    if stt_pool is None or not stt_pool.ready:
+        raise HTTPException(status_code=503, detail="Model is not loaded yet")
+    try:
+        with tracing.span("transcribe"):
+            return await stt_pool.transcribe(audio)
+    except QueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "1"})
+
+
+def _on_pool_started(task: asyncio.Task) -> None:
+    if task.cancelled():
+        return
+    if task.exception() is not None:
+        logger.error(f"STT model loading failed: {task.exception()}", exc_info=task.exception())
+    else:
+        logger.info("STT service is ready.")
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Lifespan context manager for FastAPI startup/shutdown."""
     # Startup
-    global whisper_model
-    whisper_model = load_whisper_model()
-    logger.info("STT service is ready.")
+    global stt_pool, _pool_startup
+    stt_pool = STTWorkerPool(
+        load_whisper_model,
+        replicas=settings.STT_REPLICAS,
+        workers_per_replica=settings.STT_WORKERS_PER_REPLICA,
+        queue_size=settings.STT_QUEUE_SIZE,
+        batch_window_ms=settings.STT_BATCH_WINDOW_MS,
+        max_batch=settings.STT_MAX_BATCH,
+        batch_max_seconds=settings.STT_BATCH_MAX_SECONDS,
+        warmup=warm_up if settings.STT_WARMUP else None,
+    )
+    # Nạp model nền: service nhận kết nối ngay, /health báo 503 cho tới khi sẵn sàng
+    _pool_startup = asyncio.create_task(stt_pool.start())
+    _pool_startup.add_done_callback(_on_pool_started)
     yield
-    # Shutdown (if needed)
-    whisper_model = None
+    # Shutdown
+    if not _pool_startup.done():
+        _pool_startup.cancel()
+    await stt_pool.stop()
+    stt_pool = None
+    _pool_startup = None
 
 
 app = FastAPI(
@@ -65,6 +139,41 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(tracing.TraceMiddleware)
+
+
+@asynccontextmanager
+async def _decoded_upload(content: bytes, filename: Optional[str]) -> AsyncIterator[Union[str, np.ndarray]]:
+    """
+    Decode an upload in memory; only if that fails, write it to a uniquely
+    named temp file (removed on exit) and let Whisper read the file.
+    """
+    try:
+        with tracing.span("decode"):
+            audio = decode_audio_bytes(content)
+    except Exception as e:
+        logger.warning(f"In-memory decode failed ({e}), falling back to a temp file.")
+        audio = None
+    if audio is not None:
+        yield audio
+        return
+
+    # Tên file duy nhất: nhiều trình duyệt cùng gửi "blob.webm" sẽ không ghi đè nhau
+    ext = os.path.splitext(filename or "")[1]
+    tmp_path = os.path.join(get_temp_audio_dir(), f"{uuid.uuid4().hex}{ext}")
+    with open(tmp_path, "wb") as f:
+        f.write(content)
+    try:
+        yield tmp_path
+    finally:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+
+
+def _ndjson(payload: dict) -> str:
+    return json.dumps(payload, ensure_ascii=False) + "\n"
 
 
 @app.post("/transcribe")
@@ -73,40 +182,156 @@ async def transcribe_audio(file: UploadFile = File(...)):
     Transcribe an uploaded audio file (e.g., wav, mp3).
     This is designed for short audio chunks to keep latency low.
     """
-    if whisper_model is None:
+    if stt_pool is None or not stt_pool.ready:
         return {"error": "Model is not loaded yet"}
 
-    # Save to temp file
-    tmp_dir = settings.AUDIO_TEMP_DIR
-    os.makedirs(tmp_dir, exist_ok=True)
-    tmp_path = os.path.join(tmp_dir, file.filename)
+    content = await file.read()
+    logger.info(f"Received audio file for STT: {file.filename} ({len(content)} bytes)")
 
-    with open(tmp_path, "wb") as f:
-        content = await file.read()
-        f.write(content)
+    async with _decoded_upload(content, file.filename) as audio:
+        text = await _transcribe(audio)
 
-    logger.info(f"Received audio file for STT: {tmp_path}")
+    logger.info(f"Transcription result: {text}")
 
-    segments, _ = whisper_model.transcribe(
-        tmp_path,
-        language="vi",
-        beam_size=1,
-        vad_filter=True,
-        condition_on_previous_text=False,
-    )
+    return {"text": text}
 
-    text_parts = [segment.text.strip() for segment in segments]
-    text = " ".join(text_parts).strip()
 
-    logger.info(f"Transcription result: {text}")
+@app.post("/transcribe/pcm")
+async def transcribe_pcm(request: Request, sample_rate: int = 16000):
+    """
+    Transcribe raw 16-bit little-endian mono PCM sent as the request body
+    (used by the WebSocket voice loop for interim and final decodes).
+    Decoded in memory and run off the event loop.
+    """
+    body = await request.body()
+    with tracing.span("decode"):
+        audio = pcm16_to_float32(body, sample_rate)
+    if audio.size == 0:
+        return {"text": ""}
+
+    text = await _transcribe(audio)
+    logger.info(f"PCM transcription ({audio.size / 16000:.1f}s): {text}")
+    return {"text": text}
+
+
+@app.post("/transcribe/stream")
+async def transcribe_stream(file: UploadFile = File(...)):
+    """
+    Like /transcribe, but streams newline-delimited JSON: one
+    {"type": "segment", "start", "end", "text"} line per Whisper segment as soon
+    as it is decoded, then {"type": "final", "text"} (or {"type": "error"}).
+    """
+    if stt_pool is None or not stt_pool.ready:
+        raise HTTPException(status_code=503, detail="Model is not loaded yet")
+
+    content = await file.read()
+    filename = file.filename
+    logger.info(f"Received audio file for streaming STT: {filename} ({len(content)} bytes)")
+
+    async def generate():
+        parts = []
+        try:
+            async with _decoded_upload(content, filename) as audio:
+                async for start, end, text in stt_pool.stream(audio):
+                    parts.append(text)
+                    yield _ndjson({"type": "segment", "start": round(start, 2), "end": round(end, 2), "text": text})
+        except QueueFull as e:
+            yield _ndjson({"type": "error", "message": str(e)})
+            return
+        except Exception as e:
+            logger.error(f"Streaming transcription failed: {e}", exc_info=True)
+            yield _ndjson({"type": "error", "message": str(e)})
+            return
+        text = " ".join(parts).strip()
+        logger.info(f"Transcription result: {text}")
+        yield _ndjson({"type": "final", "text": text})
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+
+@app.websocket("/ws/transcribe")
+async def transcribe_ws(websocket: WebSocket, sample_rate: int = 16000):
+    """
+    Chunked streaming STT. Client sends binary 16-bit mono PCM chunks and
+    {"type": "end"} to close an utterance. Server sends
+    {"type": "partial", "stable", "unstable"} while audio arrives and
+    {"type": "final", "text"} after "end"; the session can then continue.
+    """
+    await websocket.accept()
+    if stt_pool is None or not stt_pool.ready:
+        await websocket.close(code=1013, reason="Model is not loaded yet")
+        return
+
+    transcriber = StreamingTranscriber(
+        stt_pool.segments,
+        window_s=settings.STT_STREAM_WINDOW_S,
+        step_ms=settings.STT_STREAM_STEP_MS,
+    )
+    # Giữ trạng thái bộ lọc giữa các chunk: resample từng chunk riêng lẻ gây nhiễu ở mỗi ranh giới
+    resampler = PcmResampler(sample_rate)
+
+    async def send(payload: dict) -> None:
+        await websocket.send_text(json.dumps(payload, ensure_ascii=False))
 
-    # Optionally delete temp file to keep disk clean
     try:
-        os.remove(tmp_path)
-    except Exception:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            if message.get("bytes"):
+                try:
+                    result = await transcriber.add(resampler.feed(message["bytes"]))
+                except QueueFull:
+                    result = None  # kết quả tạm chỉ là best-effort, bỏ qua lượt này
+                if result is not None:
+                    await send({"type": "partial", **result})
+            elif message.get("text"):
+                try:
+                    kind = json.loads(message["text"]).get("type")
+                except ValueError:
+                    kind = None
+                if kind != "end":
+                    await send({"type": "error", "message": "expected {\"type\": \"end\"}"})
+                    continue
+                try:
+                    text = await transcriber.finish(resampler.flush())
+                except QueueFull as e:
+                    transcriber.reset()
+                    await send({"type": "error", "message": str(e)})
+                    continue
+                logger.info(f"Streaming transcription result: {text}")
+                await send({"type": "final", "text": text})
+    except WebSocketDisconnect:
         pass
 
-    return {"text": text}
+
+@app.get("/health")
+async def health():
+    """Readiness probe: 200 once the models are loaded and warmed up, 503 before (or if loading failed)."""
+    if stt_pool is not None and stt_pool.ready:
+        return {"status": "ready", "phases": stt_pool.startup_timings}
+    payload = {"status": "starting", "phases": stt_pool.startup_timings if stt_pool is not None else {}}
+    if _pool_startup is not None and _pool_startup.done() and not _pool_startup.cancelled() and _pool_startup.exception():
+        payload.update(status="error", error=str(_pool_startup.exception()))
+    return JSONResponse(payload, status_code=503)
+
+
+@app.get("/metrics")
+async def metrics():
+    """Per-stage latency histograms in the Prometheus text format."""
+    return Response(tracing.render_metrics(), media_type=tracing.METRICS_CONTENT_TYPE)
+
+
+@app.get("/stats")
+async def stats():
+    """Worker pool queue depth, wait time and batching counters, plus model tier routing."""
+    if stt_pool is None:
+        return {}
+    result = stt_pool.stats()
+    tiers = [model.stats() for model in stt_pool.models if isinstance(model, TieredWhisper)]
+    if tiers:
+        result["tiers"] = {key: sum(t[key] for t in tiers) for key in tiers[0]}
+    return result
 
 
 if __name__ == "__main__":
@@ -0,0 +1,109 @@
+"""
+Incremental transcription of chunked audio with a sliding window.
+
+Audio arrives in small chunks; every STT_STREAM_STEP_MS of new audio the
+uncommitted tail (at most about STT_STREAM_WINDOW_S seconds) is decoded again.
+Words on which two consecutive hypotheses agree are *stable* (LocalAgreement);
+the rest is *unstable* and may still change. Once the tail grows past the
+window, whole segments that are already stable are committed and their audio
+is dropped, so each decode stays bounded no matter how long the visitor talks.
+"""
+
+from __future__ import annotations
+
+from typing import Awaitable, Callable, List, Optional
+
+import numpy as np
+
+from servers.stt_pool import Segment
+from src.utils.audio_handler import WHISPER_SAMPLE_RATE
+
+
+def _common_prefix(a: List[str], b: List[str]) -> int:
+    n = 0
+    for x, y in zip(a, b):
+        if x.casefold() != y.casefold():
+            break
+        n += 1
+    return n
+
+
+class StreamingTranscriber:
+    def __init__(
+        self,
+        decode: Callable[[np.ndarray], Awaitable[List[Segment]]],
+        window_s: float = 10.0,
+        step_ms: int = 500,
+    ):
+        self.decode = decode
+        self.window_samples = int(window_s * WHISPER_SAMPLE_RATE)
+        self.step_samples = int(step_ms * WHISPER_SAMPLE_RATE / 1000)
+        self.reset()
+
+    def reset(self) -> None:
+        self._buffer = np.zeros(0, dtype=np.float32)  # uncommitted audio
+        self._undecoded = 0  # samples added since the last decode
+        self._committed: List[str] = []
+        self._previous: List[str] = []  # last hypothesis for the uncommitted audio
+
+    @property
+    def committed_text(self) -> str:
+        return " ".join(self._committed)
+
+    async def add(self, audio: np.ndarray) -> Optional[dict]:
+        """
+        Append 16 kHz float32 audio. Returns {"stable", "unstable"} after a
+        decode, or None if not enough new audio has arrived yet.
+        """
+        self._buffer = np.concatenate([self._buffer, audio.astype(np.float32, copy=False)])
+        self._undecoded += audio.size
+        if self._undecoded < self.step_samples:
+            return None
+        self._undecoded = 0
+
+        segments = await self.decode(self._buffer)
+        words = [w for _, _, text in segments for w in text.split()]
+        agreed = _common_prefix(self._previous, words)
+        self._previous = words
+
+        if self._buffer.size > self.window_samples:
+            agreed = max(0, agreed - self._commit(segments, agreed))
+
+        tail = self._previous
+        return {
+            "stable": " ".join(self._committed + tail[:agreed]),
+            "unstable": " ".join(tail[agreed:]),
+        }
+
+    def _commit(self, segments: List[Segment], agreed: int) -> int:
+        """Commit leading segments whose words are all stable (never the last one); returns words committed."""
+        count, cut = 0, None
+        for start, end, text in segments[:-1]:
+            n = len(text.split())
+            if count + n > agreed:
+                break
+            count += n
+            cut = end
+        if cut is None and self._buffer.size > 1.5 * self.window_samples and len(segments) > 1:
+            # Không có gì ổn định mà cửa sổ đã quá dài: chốt luôn segment đầu
+            start, cut, text = segments[0]
+            count = len(text.split())
+        if cut is None:
+            return 0
+
+        self._committed.extend(self._previous[:count])
+        self._previous = self._previous[count:]
+        self._buffer = self._buffer[int(cut * WHISPER_SAMPLE_RATE):]
+        return count
+
+    async def finish(self, tail: Optional[np.ndarray] = None) -> str:
+        """Append `tail`, decode what is left and return the full transcript; the transcriber is reset."""
+        if tail is not None and tail.size:
+            self._buffer = np.concatenate([self._buffer, tail.astype(np.float32, copy=False)])
+        words: List[str] = []
+        if self._buffer.size:
+            segments = await self.decode(self._buffer)
+            words = [w for _, _, text in segments for w in text.split()]
+        text = " ".join(self._committed + words)
+        self.reset()
+        return text
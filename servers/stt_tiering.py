@@ -0,0 +1,135 @@
+"""
+Two-tier Whisper: a small model for easy clips, a larger one for hard ones.
+
+`TieredWhisper` looks like a `WhisperModel` to the worker pool (same
+`transcribe` signature). Short clips (<= STT_FAST_MAX_SECONDS) and clips that
+are clearly speech (energy VAD speech ratio >= STT_FAST_MIN_SPEECH_RATIO) go to
+the fast model; if its average log-probability is below
+STT_ESCALATE_LOGPROB, the clip is decoded again with the accurate model.
+Everything else, and audio given as a file path, goes straight to the
+accurate model. Streaming jobs (`/transcribe/stream`) always use the accurate
+model (`streaming_model`), decoded lazily so segments are not held back.
+"""
+
+from __future__ import annotations
+
+import threading
+from typing import Any, List, Tuple
+
+import numpy as np
+
+from servers.stt_pool import Audio, transcribe_batch
+from src.utils.audio_handler import WHISPER_SAMPLE_RATE
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+_FRAME = int(0.03 * WHISPER_SAMPLE_RATE)  # 30 ms, như Endpointer
+
+
+def speech_ratio(audio: np.ndarray, threshold: float = 3.0, min_rms: float = 0.01) -> float:
+    """Fraction of 30 ms frames louder than `threshold` x the clip's own noise floor."""
+    n = audio.size // _FRAME
+    if n == 0:
+        return 0.0
+    frames = audio[: n * _FRAME].reshape(n, _FRAME)
+    rms = np.sqrt(np.mean(frames * frames, axis=1))
+    floor = float(np.percentile(rms, 10))
+    return float(np.mean(rms > max(min_rms, floor * threshold)))
+
+
+def warm_up(model) -> None:
+    """Run one throwaway decode so lazy initialization happens before real traffic."""
+    for m in getattr(model, "tiers", (model,)):
+        # Tiếng ồn nhẹ, tắt VAD để encoder và decoder đều thật sự chạy
+        audio = np.random.default_rng(0).normal(0, 0.01, WHISPER_SAMPLE_RATE).astype(np.float32)
+        segments, _ = m.transcribe(audio, language="vi", beam_size=1, vad_filter=False)
+        for _ in segments:
+            pass
+
+
+class TieredWhisper:
+    def __init__(
+        self,
+        fast,
+        accurate,
+        fast_max_seconds: float = 5.0,
+        fast_min_speech_ratio: float = 0.6,
+        escalate_logprob: float = -0.7,
+    ):
+        self.fast = fast
+        self.accurate = accurate
+        self.fast_max_samples = int(fast_max_seconds * WHISPER_SAMPLE_RATE)
+        self.fast_min_speech_ratio = fast_min_speech_ratio
+        self.escalate_logprob = escalate_logprob
+
+        self._lock = threading.Lock()
+        self.fast_count = 0
+        self.accurate_count = 0
+        self.escalated = 0
+
+    @property
+    def tiers(self) -> Tuple[Any, Any]:
+        return self.fast, self.accurate
+
+    @property
+    def streaming_model(self):
+        """Model for streamed segments: decoded lazily, never materialized for escalation."""
+        return self.accurate
+
+    def _count(self, fast: int = 0, accurate: int = 0, escalated: int = 0) -> None:
+        with self._lock:
+            self.fast_count += fast
+            self.accurate_count += accurate
+            self.escalated += escalated
+
+    def use_fast(self, audio: Audio) -> bool:
+        if not isinstance(audio, np.ndarray):
+            return False  # file tạm: không biết độ dài, dùng model chính xác
+        return audio.size <= self.fast_max_samples or speech_ratio(audio) >= self.fast_min_speech_ratio
+
+    def transcribe(self, audio: Audio, **kwargs):
+        """Same contract as `WhisperModel.transcribe`: returns (segments, info)."""
+        if not self.use_fast(audio):
+            self._count(accurate=1)
+            return self.accurate.transcribe(audio, **kwargs)
+
+        segments, info = self.fast.transcribe(audio, **kwargs)
+        # Phải giải mã hết mới biết độ tin cậy; job stream không đi đường này (streaming_model)
+        segments = list(segments)
+        decoded = [s for s in segments if s.text.strip()]
+        if decoded:
+            tokens = [max(1, len(s.tokens)) for s in decoded]
+            avg_logprob = sum(s.avg_logprob * n for s, n in zip(decoded, tokens)) / sum(tokens)
+            if avg_logprob < self.escalate_logprob:
+                logger.info(f"Fast STT unsure (avg_logprob {avg_logprob:.2f}), escalating to the accurate model.")
+                self._count(fast=1, escalated=1)
+                return self.accurate.transcribe(audio, **kwargs)
+        self._count(fast=1)
+        return iter(segments), info
+
+    def transcribe_batch(self, audios: List[np.ndarray]) -> List[str]:
+        """Batched decode (see `transcribe_batch`), routed and escalated per clip."""
+        texts: List[str] = [""] * len(audios)
+        routed = [self.use_fast(audio) for audio in audios]
+        fast = [i for i, use_fast in enumerate(routed) if use_fast]
+        accurate = [i for i, use_fast in enumerate(routed) if not use_fast]
+
+        if fast:
+            results = transcribe_batch(self.fast, [audios[i] for i in fast], with_logprob=True)
+            for i, (text, avg_logprob) in zip(fast, results):
+                if text and avg_logprob < self.escalate_logprob:
+                    accurate.append(i)
+                else:
+                    texts[i] = text
+        escalated = len(fast) + len(accurate) - len(audios)
+        if accurate:
+            for i, text in zip(accurate, transcribe_batch(self.accurate, [audios[i] for i in accurate])):
+                texts[i] = text
+
+        self._count(fast=len(fast), accurate=len(accurate) - escalated, escalated=escalated)
+        return texts
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"fast": self.fast_count, "accurate": self.accurate_count, "escalated": self.escalated}
@@ -3,24 +3,49 @@ TTS microservice using Edge-TTS.
 
 Expose a simple HTTP API (FastAPI) for text-to-speech.
 Optimized for Vietnamese voice, saving audio into web static/audio_cache.
+Synthesis and the cache file write are traced separately under the caller's
+X-Request-ID; /metrics exports their latency histograms.
 """
 
-import os
-import uuid
 import asyncio
-from typing import Optional
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
 
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response, StreamingResponse
 import edge_tts
 import aiohttp
 
+from src.utils.audio_cache import AudioCache, make_cache_key
+from src.utils.sentence_splitter import split_sentences
+from src.utils import tracing
 from utils.logger import get_logger
 from config import settings
 
 logger = get_logger(__name__)
 
-app = FastAPI(title="BrainV2 TTS Service", version="0.1.0")
+audio_cache: Optional[AudioCache] = None
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Lifespan context manager for FastAPI startup/shutdown."""
+    # Startup: rebuild cache index from files already on disk
+    global audio_cache
+    audio_cache = AudioCache(
+        settings.TTS_OUTPUT_DIR,
+        max_bytes=settings.TTS_CACHE_MAX_BYTES,
+        max_entries=settings.TTS_CACHE_MAX_ENTRIES,
+        grace_seconds=settings.TTS_CACHE_GRACE_SECONDS,
+    )
+    logger.info("TTS service is ready.")
+    yield
+    audio_cache = None
+
+
+app = FastAPI(title="BrainV2 TTS Service", version="0.1.0", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -29,30 +54,92 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(tracing.TraceMiddleware)
 
 
-async def generate_tts_with_retry(text: str, voice: str, file_path: str, max_retries: int = 3) -> bool:
+async def generate_tts_bytes_with_retry(
+    text: str, voice: str, max_retries: int = 3, rate: str = settings.TTS_RATE
+) -> Optional[bytes]:
     """
-    Generate TTS with retry mechanism to handle Edge-TTS API errors.
-    Returns True if successful, False otherwise.
+    Generate TTS with retry mechanism to handle Edge-TTS API errors,
+    keeping the MP3 in memory.
+    Returns the audio bytes, or None if generation failed.
     """
     for attempt in range(max_retries):
         try:
-            communicate = edge_tts.Communicate(text=text, voice=voice)
-            await communicate.save(file_path)
-            return True
+            communicate = edge_tts.Communicate(text=text, voice=voice, rate=rate)
+            audio = bytearray()
+            async for chunk in communicate.stream():
+                if chunk["type"] == "audio":
+                    audio.extend(chunk["data"])
+            return bytes(audio)
         except aiohttp.client_exceptions.WSServerHandshakeError as e:
             if attempt < max_retries - 1:
-                wait_time = (attempt + 1) * 2  # Exponential backoff: 2s, 4s, 6s
+                wait_time = (attempt + 1) * 2
                 logger.warning(f"Edge-TTS API error (attempt {attempt + 1}/{max_retries}): {e}. Retrying in {wait_time}s...")
                 await asyncio.sleep(wait_time)
             else:
                 logger.error(f"Edge-TTS API failed after {max_retries} attempts: {e}")
-                return False
+                return None
         except Exception as e:
             logger.error(f"Unexpected error in TTS generation: {e}", exc_info=True)
-            return False
-    return False
+            return None
+    return None
+
+
+async def _synthesize(text: str, voice: str) -> Optional[bytes]:
+    started = time.perf_counter()
+    audio = await generate_tts_bytes_with_retry(text, voice)
+    tracing.observe("tts_synth", time.perf_counter() - started, error=not audio)
+    return audio
+
+
+def _read_file(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+async def synthesize_sentences(sentences: list, voice: str) -> AsyncIterator[bytes]:
+    """
+    Synthesize sentences concurrently (at most TTS_MAX_PARALLEL at a time)
+    and yield their audio in the original order.
+    """
+    semaphore = asyncio.Semaphore(max(1, settings.TTS_MAX_PARALLEL))
+    loop = asyncio.get_running_loop()
+
+    async def _one(sentence: str) -> Optional[bytes]:
+        key = make_cache_key(sentence, voice, settings.TTS_RATE)
+        cached = audio_cache.get(key)
+        if cached:
+            try:
+                return await loop.run_in_executor(None, _read_file, cached)
+            except OSError:
+                # File bị xóa (LRU) giữa get() và open(): tổng hợp lại
+                logger.warning(f"Cached TTS file disappeared, re-synthesizing: {cached}")
+        async with semaphore:
+            audio = await _synthesize(sentence, voice)
+        if audio:
+            with tracing.span("file_write"):
+                await loop.run_in_executor(None, audio_cache.put_bytes, key, audio)
+        return audio
+
+    tasks = [asyncio.create_task(_one(s)) for s in sentences]
+    try:
+        for i, task in enumerate(tasks):
+            audio = await task
+            if audio is None:
+                logger.error(f"TTS failed for sentence {i + 1}/{len(tasks)}, skipping.")
+                continue
+            yield audio
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+@app.get("/health")
+async def health():
+    """Readiness probe (Edge-TTS is remote; ready once the audio cache index is loaded)."""
+    return {"status": "ready" if audio_cache is not None else "starting"}
 
 
 @app.get("/speak")
@@ -66,20 +153,19 @@ async def speak(text: str):
 
     logger.info(f"TTS request: {text[:100]}...")  # Log only first 100 chars
 
-    output_dir = settings.TTS_OUTPUT_DIR
-    os.makedirs(output_dir, exist_ok=True)
-
-    file_id = uuid.uuid4().hex
-    file_name = f"{file_id}.mp3"
-    file_path = os.path.join(output_dir, file_name)
-
     # Edge-TTS voice for Vietnamese
     voice = settings.TTS_VI_VOICE
+    key = make_cache_key(text, voice, settings.TTS_RATE)
+
+    cached = audio_cache.get(key)
+    if cached:
+        logger.info(f"TTS cache hit: {cached}")
+        return {"audio_path": f"audio_cache/{audio_cache.file_name(key)}"}
 
     # Try to generate TTS with retry
-    success = await generate_tts_with_retry(text, voice, file_path)
-    
-    if not success:
+    audio = await _synthesize(text, voice)
+
+    if not audio:
         # Return error but don't crash - let frontend handle it
         logger.error(f"Failed to generate TTS for text: {text[:50]}...")
         raise HTTPException(
@@ -87,13 +173,46 @@ async def speak(text: str):
             detail="TTS service temporarily unavailable. Please try again later."
         )
 
+    # Written to a temp file first, then moved into the cache atomically
+    # (ghi file, fsync, dọn LRU chạy trong thread pool, không chặn event loop)
+    with tracing.span("file_write"):
+        file_path = await asyncio.get_running_loop().run_in_executor(None, audio_cache.put_bytes, key, audio)
     logger.info(f"TTS audio saved to: {file_path}")
 
     # Return web-accessible path (relative)
-    rel_path = f"audio_cache/{file_name}"
+    rel_path = f"audio_cache/{audio_cache.file_name(key)}"
     return {"audio_path": rel_path}
 
 
+@app.get("/metrics")
+async def metrics():
+    """Per-stage latency histograms in the Prometheus text format."""
+    return Response(tracing.render_metrics(), media_type=tracing.METRICS_CONTENT_TYPE)
+
+
+@app.get("/cache/stats")
+async def cache_stats():
+    """TTS audio cache usage and hit/miss counters."""
+    return audio_cache.stats()
+
+@app.get("/speak/stream")
+async def speak_stream(text: str):
+    """
+    Pipelined TTS: split text into sentences, synthesize them in parallel
+    and return one chunked MP3 stream, so playback can start after the first sentence.
+    """
+    if not text:
+        raise HTTPException(status_code=400, detail="text is required")
+
+    sentences = split_sentences(text, min_chars=settings.TTS_SENTENCE_MIN_CHARS)
+    logger.info(f"TTS stream request: {len(sentences)} sentence(s), {text[:100]}...")
+
+    return StreamingResponse(
+        synthesize_sentences(sentences, settings.TTS_VI_VOICE),
+        media_type="audio/mpeg",
+    )
+
+
 if __name__ == "__main__":
     import uvicorn
 
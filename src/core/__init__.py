@@ -1,7 +1,13 @@
 """
 Core logic for BrainV2:
-- llm_manager: switch between Gemini and Ollama (qwen2.5:7b)
+- llm_manager: switch between Gemini and Ollama (qwen2.5:7b) with routing, fallback and hedging
+- llm_routing: rolling latency / error rate and circuit breaker per LLM backend
 - rag_engine: retrieval-augmented generation pipeline
+- answer_cache: exact + semantic answer cache in front of rag_engine
+- context_builder: dedup / boilerplate removal / relevance packing of the prompt context
+- hybrid_retriever: BM25 + vector retrieval fused with reciprocal rank fusion
+- query_understanding: artifact name / period detection for metadata pre-filtering
+- prefetch: speculative retrieval from interim transcripts, reused by the final question
 """
 
 
@@ -0,0 +1,273 @@
+"""
+Two-level answer cache in front of RAGEngine.
+
+- Level 1: exact match on the normalized question (case folded, diacritics
+  folded, whitespace collapsed).
+- Level 2: semantic match over embeddings of past questions (cosine similarity
+  above a configurable threshold). Cosine alone cannot tell "trống đồng Ngọc
+  Lũ" from "trống đồng Hoàng Hạ", so each entry also keeps the artifact /
+  period hints detected in its question (`MetadataLookup.analyze`) and a
+  semantic hit requires the same hints. Questions that name no artifact or
+  period ("bảo tàng mở cửa lúc mấy giờ") only match each other, above a
+  stricter threshold; without a hints function every question is treated
+  that way.
+
+Entries expire after a TTL and are evicted LRU. The whole cache is dropped when
+the vector DB version marker (written by `scripts/store_data_from_csv.py`)
+changes, so answers never outlive the data they were built from.
+"""
+
+from __future__ import annotations
+
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+
+from src.utils.vi_text import fold_diacritics
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+_WHITESPACE_RE = re.compile(r"\s+")
+_PUNCT_RE = re.compile(r"[^\w\s]")
+
+
+def normalize_question(text: str) -> str:
+    text = fold_diacritics(text.casefold())
+    text = _PUNCT_RE.sub(" ", text)
+    return _WHITESPACE_RE.sub(" ", text).strip()
+
+
+def read_db_version(marker_path: str) -> Optional[str]:
+    """Return the current vector DB version (marker file content), or None if missing."""
+    try:
+        with open(marker_path, encoding="utf-8") as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def write_db_version(marker_path: str) -> str:
+    """Bump the vector DB version marker (called after ingestion). Returns the new version."""
+    version = f"{time.time_ns()}"
+    os.makedirs(os.path.dirname(marker_path) or ".", exist_ok=True)
+    tmp_path = f"{marker_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(version)
+    os.replace(tmp_path, marker_path)
+    return version
+
+
+Hints = Tuple[Tuple[str, ...], Tuple[str, ...]]  # (item_ids, thoi_ky)
+NO_HINTS: Hints = ((), ())
+
+
+@dataclass
+class _Entry:
+    answer: str
+    embedding: Optional[np.ndarray]
+    created_at: float
+    hints: Optional[Hints] = None
+
+
+class AnswerCache:
+    def __init__(
+        self,
+        embed_fn: Optional[Callable[[str], List[float]]],
+        max_entries: int = 500,
+        ttl_seconds: float = 86400,
+        similarity_threshold: float = 0.95,
+        version_file: Optional[str] = None,
+        hints_fn: Optional[Callable[[str], object]] = None,
+        hintless_similarity_threshold: float = 0.97,
+    ):
+        """
+        embed_fn: embeds a question (e.g. `embeddings.embed_query`); None disables level 2.
+        version_file: vector DB version marker; the cache is cleared when it changes.
+        hints_fn: question -> QueryHints (e.g. `MetadataLookup.analyze`); None treats every
+            question as naming no artifact or period.
+        hintless_similarity_threshold: threshold for questions without hints; > 1 disables
+            semantic hits for them.
+        """
+        self.embed_fn = embed_fn
+        self.hints_fn = hints_fn
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self.hintless_similarity_threshold = hintless_similarity_threshold
+        self.version_file = version_file
+
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._matrix: Optional[np.ndarray] = None  # stacked embeddings, rebuilt lazily
+        self._matrix_keys: List[str] = []
+        self._lock = threading.Lock()
+        self._db_version = read_db_version(version_file) if version_file else None
+
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+        if embed_fn is None:
+            logger.warning("Answer cache: no embedding function, semantic matching is disabled (exact matches only).")
+        elif hints_fn is None and hintless_similarity_threshold > 1:
+            logger.warning(
+                "Answer cache: no artifact/period analysis and hintless threshold > 1, "
+                "semantic matching is disabled (exact matches only)."
+            )
+        elif hints_fn is None:
+            logger.info(
+                "Answer cache: no artifact/period analysis, semantic hits need cosine >= "
+                f"{hintless_similarity_threshold} (hintless threshold)."
+            )
+
+    # --- Public API ---
+
+    def lookup(self, question: str) -> tuple[Optional[str], Optional[np.ndarray]]:
+        """
+        Return (answer, embedding). On a miss the answer is None and the question
+        embedding (if computed) is returned so `store` can reuse it.
+        """
+        self._check_db_version()
+        key = normalize_question(question)
+        now = time.time()
+
+        with self._lock:
+            self._expire_locked(now)
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.exact_hits += 1
+                return entry.answer, entry.embedding
+
+        hints = self._hints(question)
+        threshold = self._threshold(hints)
+        if threshold is None:
+            with self._lock:
+                self.misses += 1
+            return None, None
+
+        embedding = self._embed(question)
+        if embedding is None:
+            with self._lock:
+                self.misses += 1
+            return None, None
+
+        with self._lock:
+            match_key = self._nearest_locked(embedding, hints, threshold)
+            if match_key is not None:
+                self._entries.move_to_end(match_key)
+                self.semantic_hits += 1
+                logger.info(f"Answer cache semantic hit: '{question}' ~ '{match_key}'")
+                return self._entries[match_key].answer, embedding
+            self.misses += 1
+        return None, embedding
+
+    def store(self, question: str, answer: str, embedding: Optional[np.ndarray] = None) -> None:
+        key = normalize_question(question)
+        hints = self._hints(question)
+        if self._threshold(hints) is None:
+            embedding = None  # chỉ phục vụ khớp chính xác
+        elif embedding is None:
+            embedding = self._embed(question)
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = _Entry(answer=answer, embedding=embedding, created_at=time.time(), hints=hints)
+            while self.max_entries and len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._matrix = None
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._matrix = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.exact_hits + self.semantic_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "exact_hits": self.exact_hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "hit_rate": (self.exact_hits + self.semantic_hits) / lookups if lookups else 0.0,
+                "invalidations": self.invalidations,
+            }
+
+    # --- Internals ---
+
+    def _hints(self, question: str) -> Optional[Hints]:
+        """Artifact / period hints of `question` (NO_HINTS without hints_fn), or None if analysis failed."""
+        if self.embed_fn is None:
+            return None
+        if self.hints_fn is None:
+            return NO_HINTS
+        try:
+            found = self.hints_fn(question)
+        except Exception as e:
+            logger.warning(f"Answer cache: query analysis failed, semantic lookup skipped: {e}")
+            return None
+        return (tuple(sorted(found.item_ids)), tuple(sorted(found.thoi_ky)))
+
+    def _threshold(self, hints: Optional[Hints]) -> Optional[float]:
+        """Cosine threshold for a semantic hit on `hints`, or None when only exact matches apply."""
+        if hints is None:
+            return None
+        if hints != NO_HINTS:
+            return self.similarity_threshold
+        # Không nhận ra hiện vật / thời kỳ: cosine không phân biệt được tên riêng, nên dùng ngưỡng chặt hơn
+        return self.hintless_similarity_threshold if self.hintless_similarity_threshold <= 1 else None
+
+    def _embed(self, question: str) -> Optional[np.ndarray]:
+        if self.embed_fn is None:
+            return None
+        try:
+            vec = np.asarray(self.embed_fn(question), dtype=np.float32)
+        except Exception as e:
+            logger.warning(f"Answer cache: embedding failed, semantic lookup skipped: {e}")
+            return None
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm > 0 else vec
+
+    def _check_db_version(self) -> None:
+        if not self.version_file:
+            return
+        version = read_db_version(self.version_file)
+        if version != self._db_version:
+            logger.info(f"Vector DB version changed ({self._db_version} -> {version}), clearing answer cache.")
+            self._db_version = version
+            self.invalidations += 1
+            self.clear()
+
+    def _expire_locked(self, now: float) -> None:
+        if not self.ttl_seconds:
+            return
+        expired = [k for k, e in self._entries.items() if now - e.created_at > self.ttl_seconds]
+        for k in expired:
+            del self._entries[k]
+        if expired:
+            self._matrix = None
+
+    def _nearest_locked(self, embedding: np.ndarray, hints: Hints, threshold: float) -> Optional[str]:
+        if self._matrix is None:
+            self._matrix_keys = [k for k, e in self._entries.items() if e.embedding is not None]
+            self._matrix = (
+                np.stack([self._entries[k].embedding for k in self._matrix_keys])
+                if self._matrix_keys
+                else np.empty((0, embedding.shape[0]), dtype=np.float32)
+            )
+        if not self._matrix_keys:
+            return None
+        scores = self._matrix @ embedding
+        same_hints = np.fromiter((self._entries[k].hints == hints for k in self._matrix_keys), dtype=bool)
+        scores = np.where(same_hints, scores, -np.inf)
+        best = int(np.argmax(scores))
+        if scores[best] >= threshold:
+            return self._matrix_keys[best]
+        return None
@@ -0,0 +1,183 @@
+"""
+Context compression for the RAG prompt.
+
+Instead of pasting every retrieved chunk verbatim, `ContextBuilder`:
+- groups chunks by `item_id` (overlapping sub-chunks of one artifact become
+  one entry, repeated sentences are dropped);
+- removes the ingestion template boilerplate ("Thông tin hiện vật: ...",
+  "Đặc điểm chi tiết: ...") and puts the name / period in one header line;
+- ranks sentences by keyword overlap with the question (plus a small bonus for
+  higher-ranked documents) and packs the best ones into CONTEXT_TOKEN_BUDGET
+  tokens, keeping the original order inside each artifact.
+
+Token counts are estimates (words and punctuation x CONTEXT_TOKENS_PER_WORD);
+no tokenizer of the serving LLM is loaded.
+"""
+
+from __future__ import annotations
+
+import math
+import re
+import threading
+from dataclasses import dataclass
+from typing import List, Optional, Sequence
+
+from langchain_core.documents import Document
+
+from src.utils.vi_text import tokenize
+
+_WORD_RE = re.compile(r"\w+|[^\w\s]")
+_SENTENCE_RE = re.compile(r"(?<=[.!?…])\s+|\n+")
+
+# Nhãn của template ingestion (scripts/store_data_from_csv.py): (tiền tố, thay bằng; None = bỏ cả câu)
+_NAME_LABEL = "Thông tin hiện vật:"
+_PERIOD_LABEL = "Hiện vật thuộc thời kỳ lịch sử:"
+_LABELS = (
+    ("Đặc điểm chi tiết:", ""),
+    ("Công dụng chính hoặc ý nghĩa lịch sử là:", "Công dụng: "),
+)
+
+
+def estimate_tokens(text: str, tokens_per_word: float = 1.6) -> int:
+    return math.ceil(len(_WORD_RE.findall(text)) * tokens_per_word)
+
+
+@dataclass
+class BuiltContext:
+    text: str
+    tokens: int  # estimated tokens of `text`
+    original_tokens: int  # estimated tokens if the chunks had been pasted verbatim
+    items: int
+    sentences_used: int
+    sentences_total: int
+
+
+@dataclass
+class _Sentence:
+    item: int
+    position: int
+    text: str
+    tokens: int
+    score: float = 0.0
+
+
+class ContextBuilder:
+    def __init__(self, token_budget: int = 600, tokens_per_word: float = 1.6):
+        self.token_budget = token_budget
+        self.tokens_per_word = tokens_per_word
+
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.tokens_total = 0
+        self.original_tokens_total = 0
+
+    def count(self, text: str) -> int:
+        return estimate_tokens(text, self.tokens_per_word)
+
+    @staticmethod
+    def _clean(sentence: str, has_name: bool, has_period: bool) -> Optional[str]:
+        if sentence.startswith(_NAME_LABEL):
+            return None if has_name else sentence[len(_NAME_LABEL):].strip()
+        if sentence.startswith(_PERIOD_LABEL):
+            return None if has_period else "Thời kỳ: " + sentence[len(_PERIOD_LABEL):].strip()
+        for label, replacement in _LABELS:
+            if sentence.startswith(label):
+                return (replacement + sentence[len(label):].strip()).strip()
+        return sentence
+
+    def _group(self, docs: Sequence[Document]):
+        """[(header, [sentences])] per item, in retrieval order, boilerplate and duplicates removed."""
+        order: List[str] = []
+        grouped = {}
+        for doc in docs:
+            key = doc.metadata.get("item_id") or doc.page_content
+            if key not in grouped:
+                order.append(key)
+                grouped[key] = (doc.metadata, [])
+            grouped[key][1].append(doc.page_content)
+
+        items = []
+        for key in order:
+            metadata, contents = grouped[key]
+            name, period = metadata.get("ten"), metadata.get("thoi_ky")
+            header = f"[{name}]" if name else ""
+            if period:
+                header = f"{header} (thời kỳ: {period})".strip()
+
+            sentences: List[str] = []
+            seen = set()
+            for content in contents:
+                for raw in _SENTENCE_RE.split(content):
+                    sentence = self._clean(raw.strip(), bool(name), bool(period))
+                    if not sentence or len(sentence) < 3:
+                        continue
+                    normalized = " ".join(tokenize(sentence, bigrams=False))
+                    if normalized in seen:
+                        continue
+                    seen.add(normalized)
+                    sentences.append(sentence)
+            # Các đoạn con chồng lấn cắt ngang câu: bỏ mảnh nằm trọn trong một câu khác
+            folded = [" ".join(tokenize(s, bigrams=False)) for s in sentences]
+            sentences = [
+                s for i, s in enumerate(sentences)
+                if not any(i != j and folded[i] != folded[j] and folded[i] in folded[j] for j in range(len(folded)))
+            ]
+            items.append((header, sentences))
+        return items
+
+    def build(self, question: str, docs: Sequence[Document]) -> BuiltContext:
+        original = "\n\n".join(doc.page_content for doc in docs)
+        items = self._group(docs)
+
+        question_tokens = set(tokenize(question))
+        candidates: List[_Sentence] = []
+        for rank, (_, sentences) in enumerate(items):
+            for position, text in enumerate(sentences):
+                words = tokenize(text)
+                overlap = len(question_tokens.intersection(words))
+                score = overlap / (1 + math.log1p(len(words))) + 0.5 / (1 + rank)
+                candidates.append(_Sentence(rank, position, text, self.count(text), score))
+
+        chosen: List[_Sentence] = []
+        header_tokens = [self.count(header) for header, _ in items]
+        included = set()
+        used = 0
+        for sentence in sorted(candidates, key=lambda s: -s.score):
+            cost = sentence.tokens + (0 if sentence.item in included else header_tokens[sentence.item])
+            if used + cost > self.token_budget and chosen:
+                continue
+            chosen.append(sentence)
+            included.add(sentence.item)
+            used += cost
+
+        blocks = []
+        for rank, (header, _) in enumerate(items):
+            picked = sorted((s for s in chosen if s.item == rank), key=lambda s: s.position)
+            if picked:
+                body = " ".join(s.text for s in picked)
+                blocks.append(f"{header}\n{body}" if header else body)
+        text = "\n\n".join(blocks)
+
+        built = BuiltContext(
+            text=text,
+            tokens=self.count(text),
+            original_tokens=self.count(original),
+            items=len(blocks),
+            sentences_used=len(chosen),
+            sentences_total=len(candidates),
+        )
+        with self._lock:
+            self.requests += 1
+            self.tokens_total += built.tokens
+            self.original_tokens_total += built.original_tokens
+        return built
+
+    def stats(self) -> dict:
+        with self._lock:
+            requests = self.requests
+            return {
+                "token_budget": self.token_budget,
+                "requests": requests,
+                "avg_context_tokens": round(self.tokens_total / requests, 1) if requests else 0.0,
+                "avg_original_tokens": round(self.original_tokens_total / requests, 1) if requests else 0.0,
+            }
@@ -0,0 +1,215 @@
+"""
+Hybrid retrieval: BM25 keyword index + Chroma vector search, fused with
+reciprocal rank fusion (RRF).
+
+The multilingual embedding is weak on proper nouns ("Súng trường SKS"), which
+keyword matching handles well; RRF merges both rankings without having to
+calibrate their scores. The BM25 index is a small JSON file persisted next to
+the Chroma store and updated incrementally by `scripts/store_data_from_csv.py`.
+"""
+
+from __future__ import annotations
+
+import json
+import math
+import os
+import threading
+from collections import Counter, defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from src.utils.vi_text import tokenize
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+def document_id(metadata: dict) -> str:
+    """
+    Stable document ID shared by Chroma and the BM25 index: item_id, with a
+    '#k' suffix for sub-chunks after the first one.
+    """
+    chunk = metadata.get("chunk", 0)
+    return metadata["item_id"] if not chunk else f"{metadata['item_id']}#{chunk}"
+
+
+def matches_where(metadata: dict, where: Optional[dict]) -> bool:
+    """Evaluate a simple Chroma-style filter ({field: value} or {field: {"$in": [...]}})."""
+    if not where:
+        return True
+    for key, cond in where.items():
+        value = metadata.get(key)
+        if isinstance(cond, dict):
+            if "$in" in cond and value not in cond["$in"]:
+                return False
+            if "$eq" in cond and value != cond["$eq"]:
+                return False
+        elif value != cond:
+            return False
+    return True
+
+
+class BM25Index:
+    """In-process Okapi BM25 over diacritic-folded syllables + bigrams."""
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        # doc_id -> {"tf": {term: count}, "len": int, "content": str, "metadata": dict}
+        self.docs: Dict[str, dict] = {}
+        # term -> {doc_id: term frequency}; derived from docs, not persisted
+        self.postings: Dict[str, Dict[str, int]] = defaultdict(dict)
+        self._total_len = 0
+
+    def __len__(self) -> int:
+        return len(self.docs)
+
+    # --- Updates ---
+
+    def upsert(self, doc_id: str, content: str, metadata: dict) -> None:
+        self.delete([doc_id])
+        tokens = tokenize(content)
+        tf = Counter(tokens)
+        self.docs[doc_id] = {"tf": dict(tf), "len": len(tokens), "content": content, "metadata": metadata}
+        self._index_doc(doc_id)
+
+    def _index_doc(self, doc_id: str) -> None:
+        doc = self.docs[doc_id]
+        for term, freq in doc["tf"].items():
+            self.postings[term][doc_id] = freq
+        self._total_len += doc["len"]
+
+    def delete(self, doc_ids) -> None:
+        for doc_id in doc_ids:
+            doc = self.docs.pop(doc_id, None)
+            if doc is None:
+                continue
+            self._total_len -= doc["len"]
+            for term in doc["tf"]:
+                posting = self.postings.get(term)
+                if posting is None:
+                    continue
+                posting.pop(doc_id, None)
+                if not posting:
+                    del self.postings[term]
+
+    def content_hash(self, doc_id: str) -> Optional[str]:
+        doc = self.docs.get(doc_id)
+        return doc["metadata"].get("content_hash") if doc else None
+
+    # --- Search ---
+
+    def search(self, query: str, k: int, where: Optional[dict] = None) -> List[Tuple[str, float]]:
+        if not self.docs:
+            return []
+        n = len(self.docs)
+        avgdl = self._total_len / n if n else 0.0
+        scores: Dict[str, float] = {}
+        for term in set(tokenize(query)):
+            posting = self.postings.get(term)
+            if not posting:
+                continue
+            df = len(posting)
+            idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+            for doc_id, freq in posting.items():
+                if where and not matches_where(self.docs[doc_id]["metadata"], where):
+                    continue
+                doc_len = self.docs[doc_id]["len"]
+                norm = self.k1 * (1 - self.b + self.b * doc_len / avgdl) if avgdl else self.k1
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * freq * (self.k1 + 1) / (freq + norm)
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+    def get_document(self, doc_id: str) -> Document:
+        doc = self.docs[doc_id]
+        return Document(page_content=doc["content"], metadata=doc["metadata"])
+
+    # --- Persistence ---
+
+    def save(self, path: str) -> None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"k1": self.k1, "b": self.b, "docs": self.docs}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        index = cls(k1=data.get("k1", 1.5), b=data.get("b", 0.75))
+        index.docs = data.get("docs", {})
+        for doc_id in index.docs:
+            index._index_doc(doc_id)
+        return index
+
+    @classmethod
+    def load_or_empty(cls, path: str) -> "BM25Index":
+        if os.path.exists(path):
+            try:
+                return cls.load(path)
+            except Exception as e:
+                logger.warning(f"BM25 index unreadable ({e}), starting from an empty index.")
+        return cls()
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    Fuse Chroma similarity search and BM25 with reciprocal rank fusion:
+    score(d) = sum over rankings of 1 / (rrf_k + rank(d)).
+    """
+
+    vectorstore: Any
+    index_path: str
+    k: int = 5
+    fetch_k: int = 20
+    rrf_k: int = 60
+
+    _bm25: Optional[BM25Index] = None
+    _bm25_mtime: Optional[float] = None
+    _lock: Any = None
+
+    def model_post_init(self, __context: Any) -> None:
+        self._lock = threading.Lock()
+        self._reload_if_changed()
+
+    def _reload_if_changed(self) -> BM25Index:
+        """Pick up index updates written by ingestion without restarting the service."""
+        try:
+            mtime = os.path.getmtime(self.index_path)
+        except OSError:
+            mtime = None
+        with self._lock:
+            if self._bm25 is None or mtime != self._bm25_mtime:
+                self._bm25 = BM25Index.load_or_empty(self.index_path)
+                self._bm25_mtime = mtime
+                logger.info(f"BM25 index loaded: {len(self._bm25)} document(s) from {self.index_path}")
+            return self._bm25
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        return self.search(query)
+
+    def search(self, query: str, where: Optional[dict] = None) -> List[Document]:
+        """Fused search, optionally restricted by a metadata `where` filter on both sides."""
+        bm25 = self._reload_if_changed()
+
+        dense_docs = self.vectorstore.similarity_search(query, k=self.fetch_k, filter=where)
+        keyword_hits = bm25.search(query, self.fetch_k, where=where)
+
+        scores: Dict[str, float] = {}
+        docs: Dict[str, Document] = {}
+        for rank, doc in enumerate(dense_docs):
+            doc_id = document_id(doc.metadata) if "item_id" in doc.metadata else doc.page_content
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (self.rrf_k + rank + 1)
+            docs.setdefault(doc_id, doc)
+        for rank, (doc_id, _) in enumerate(keyword_hits):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (self.rrf_k + rank + 1)
+            if doc_id not in docs:
+                docs[doc_id] = bm25.get_document(doc_id)
+
+        ranked = sorted(scores, key=scores.get, reverse=True)[: self.k]
+        return [docs[doc_id] for doc_id in ranked]
@@ -5,18 +5,40 @@ Logic:
 - Primary: Gemini (if GOOGLE_API_KEY is available and USE_GEMINI_PRIMARY=True).
 - Fallback: Ollama (HTTP API at OLLAMA_BASE_URL, default http://localhost:11434).
 
+Routing: each backend has rolling p50/p95 latency, an error rate and a circuit
+breaker (`src/core/llm_routing.py`); a backend whose circuit is open is skipped
+instead of making every request wait for its failure. With LLM_ROUTING=latency
+the backend with the lower rolling p50 goes first. With LLM_HEDGE_AFTER_S > 0,
+if the first backend has produced no text within that deadline the next one is
+started as well and whichever answers first wins. Non-streaming calls only
+produce text once the whole answer is done, so they keep their own latency
+window and use the separate LLM_HEDGE_AFTER_BLOCKING_S deadline.
+
+Ollama calls use the native /api/chat endpoint by default (OLLAMA_NATIVE_API):
+the stable system prompt goes in its own message ahead of the per-question
+context, so Ollama can reuse the KV cache of that prefix between questions;
+`keep_alive` and `options` (num_ctx, num_predict, num_thread) are sent with
+every request, and a periodic warm-ping keeps the model resident between
+visitor bursts.
+
 This module exposes a simple `generate_answer` function that other parts
-of the system (e.g., RAG engine, web app) can call.
+of the system (e.g., RAG engine, web app) can call, plus `stream_answer`
+which yields the answer token-by-token for low time-to-first-text.
 """
 
 from __future__ import annotations
 
+import json
 import os
-from typing import Optional
+import queue
+import threading
+import time
+from typing import Callable, Dict, Iterator, List, Optional
 
-import requests
 from langchain_google_genai import ChatGoogleGenerativeAI
 
+from src.core.llm_routing import BLOCKING, STREAM, BackendHealth
+from src.utils.http_client import get_http_client
 from config import settings
 from utils.logger import get_logger
 
@@ -34,6 +56,26 @@ class LLMManager:
 
         self._gemini_client: Optional[ChatGoogleGenerativeAI] = None
 
+        # Thứ tự ưu tiên giữ nguyên như trước: Gemini chỉ dùng khi là primary và có API key
+        self.backends: List[str] = ["ollama"]
+        if self.use_gemini_primary and self.google_api_key:
+            self.backends.insert(0, "gemini")
+        self.health: Dict[str, BackendHealth] = {
+            name: BackendHealth(
+                name,
+                window=settings.LLM_LATENCY_WINDOW,
+                failure_threshold=settings.LLM_BREAKER_FAILURES,
+                cooldown_seconds=settings.LLM_BREAKER_COOLDOWN,
+            )
+            for name in self.backends
+        }
+        self.routing = settings.LLM_ROUTING
+        self.hedge_after = {STREAM: settings.LLM_HEDGE_AFTER_S, BLOCKING: settings.LLM_HEDGE_AFTER_BLOCKING_S}
+        self.hedged = 0
+
+        self._ollama_last_used = 0.0
+        self._keepalive_thread: Optional[threading.Thread] = None
+
     def _get_gemini_client(self) -> ChatGoogleGenerativeAI:
         if self._gemini_client is None:
             if not self.google_api_key:
@@ -48,52 +90,332 @@ class LLMManager:
             )
         return self._gemini_client
 
-    def _call_gemini(self, prompt: str) -> str:
+    def warm_up(self) -> None:
+        """
+        Create the primary client up front instead of on the first question,
+        load the Ollama model into memory and start the periodic warm-ping.
+        """
+        if self.use_gemini_primary and self.google_api_key:
+            self._get_gemini_client()
+        if settings.OLLAMA_NATIVE_API:
+            self._ping_ollama()
+            self._start_keepalive()
+
+    # --- Ollama residency ---
+
+    def _ollama_options(self) -> dict:
+        options = {
+            "num_ctx": settings.OLLAMA_NUM_CTX,
+            "num_predict": settings.OLLAMA_NUM_PREDICT,
+            "num_thread": settings.OLLAMA_NUM_THREAD,
+        }
+        # 0 = để Ollama tự chọn
+        return {k: v for k, v in options.items() if v}
+
+    def _ping_ollama(self) -> bool:
+        """Load the model (or reset its keep_alive timer) without generating anything."""
+        try:
+            res = get_http_client().post(
+                f"{self.ollama_base_url}/api/generate",
+                json={
+                    "model": self.ollama_model_name,
+                    "prompt": "",
+                    "keep_alive": settings.OLLAMA_KEEP_ALIVE,
+                    "options": self._ollama_options(),
+                },
+            )
+            res.raise_for_status()
+        except Exception as e:
+            logger.warning(f"Ollama warm-ping failed: {e}")
+            return False
+        self._ollama_last_used = time.monotonic()
+        return True
+
+    def _start_keepalive(self) -> None:
+        interval = settings.OLLAMA_WARM_PING_INTERVAL
+        if interval <= 0 or "ollama" not in self.backends or self._keepalive_thread is not None:
+            return
+
+        def run() -> None:
+            while True:
+                time.sleep(interval)
+                # Chỉ ping khi không có request thật nào gần đây
+                if time.monotonic() - self._ollama_last_used >= interval:
+                    self._ping_ollama()
+
+        self._keepalive_thread = threading.Thread(target=run, name="ollama-keepalive", daemon=True)
+        self._keepalive_thread.start()
+        logger.info(f"Ollama warm-ping every {interval:.0f}s (keep_alive={settings.OLLAMA_KEEP_ALIVE}).")
+
+    # --- Backends ---
+
+    @staticmethod
+    def _gemini_input(prompt: str, system: Optional[str]):
+        return [("system", system), ("human", prompt)] if system else prompt
+
+    def _ollama_messages(self, prompt: str, system: Optional[str]) -> List[dict]:
+        messages = [{"role": "user", "content": prompt}]
+        if system:
+            # Tin nhắn system cố định đứng trước: Ollama dùng lại KV cache của phần tiền tố này
+            messages.insert(0, {"role": "system", "content": system})
+        return messages
+
+    def _log_ollama_metrics(self, data: dict) -> None:
+        if "prompt_eval_count" in data or "eval_count" in data:
+            logger.info(
+                f"Ollama: {data.get('prompt_eval_count', 0)} prompt token(s) evaluated "
+                f"in {data.get('prompt_eval_duration', 0) / 1e6:.0f} ms, "
+                f"{data.get('eval_count', 0)} generated in {data.get('eval_duration', 0) / 1e6:.0f} ms"
+                + (f", model load {data['load_duration'] / 1e6:.0f} ms" if data.get("load_duration", 0) > 1e8 else "")
+            )
+
+    def _call_gemini(self, prompt: str, system: Optional[str] = None) -> str:
         client = self._get_gemini_client()
         logger.info("Calling Gemini LLM...")
-        resp = client.invoke(prompt)
+        resp = client.invoke(self._gemini_input(prompt, system))
         # LangChain ChatGoogleGenerativeAI usually returns a Message-like object
         try:
             return resp.content
         except Exception:
             return str(resp)
 
-    def _call_ollama(self, prompt: str) -> str:
+    def _stream_gemini(self, prompt: str, system: Optional[str] = None) -> Iterator[str]:
+        client = self._get_gemini_client()
+        logger.info("Streaming from Gemini LLM...")
+        for chunk in client.stream(self._gemini_input(prompt, system)):
+            text = getattr(chunk, "content", None) or ""
+            if text:
+                yield text
+
+    def _ollama_request(self, prompt: str, system: Optional[str], stream: bool):
+        """(url, payload) for the native /api/chat endpoint or the OpenAI-compatible one."""
+        self._ollama_last_used = time.monotonic()
+        payload = {
+            "model": self.ollama_model_name,
+            "messages": self._ollama_messages(prompt, system),
+            "stream": stream,
+        }
+        if not settings.OLLAMA_NATIVE_API:
+            return f"{self.ollama_base_url}/v1/chat/completions", payload
+        payload["keep_alive"] = settings.OLLAMA_KEEP_ALIVE
+        payload["options"] = self._ollama_options()
+        return f"{self.ollama_base_url}/api/chat", payload
+
+    def _call_ollama(self, prompt: str, system: Optional[str] = None) -> str:
         """
         Call local Ollama HTTP API.
         Assumes Ollama is running, e.g. `ollama serve` on D:/Ollama but reachable at localhost:11434.
         """
-        url = f"{self.ollama_base_url}/v1/chat/completions"
+        url, payload = self._ollama_request(prompt, system, stream=False)
         logger.info(f"Calling Ollama model: {self.ollama_model_name} at {url}")
-        payload = {
-            "model": self.ollama_model_name,
-            "messages": [
-                {"role": "user", "content": prompt},
-            ],
-            "stream": False,
-        }
         try:
-            res = requests.post(url, json=payload, timeout=120)
+            res = get_http_client().post(url, json=payload)
             res.raise_for_status()
             data = res.json()
+            if settings.OLLAMA_NATIVE_API:
+                self._log_ollama_metrics(data)
+                return data["message"]["content"]
             # OpenAI-style response
             return data["choices"][0]["message"]["content"]
         except Exception as e:
             logger.error(f"Ollama call failed: {e}", exc_info=True)
             raise
 
-    def generate_answer(self, prompt: str) -> str:
+    def _stream_ollama(self, prompt: str, system: Optional[str] = None) -> Iterator[str]:
         """
-        Generate answer using primary model with fallback.
+        Stream tokens from Ollama: NDJSON lines from the native /api/chat, or SSE
+        lines `data: {...}` from the OpenAI-compatible endpoint.
         """
-        if self.use_gemini_primary and self.google_api_key:
+        url, payload = self._ollama_request(prompt, system, stream=True)
+        logger.info(f"Streaming from Ollama model: {self.ollama_model_name} at {url}")
+        with get_http_client().post(url, json=payload, stream=True) as res:
+            res.raise_for_status()
+            if settings.OLLAMA_NATIVE_API:
+                yield from self._iter_native_stream(res)
+                return
+            for line in res.iter_lines(decode_unicode=True):
+                if not line or not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                try:
+                    delta = json.loads(data)["choices"][0].get("delta", {})
+                except (ValueError, KeyError, IndexError):
+                    logger.warning(f"Ollama stream: skipping malformed chunk: {data[:100]}")
+                    continue
+                text = delta.get("content")
+                if text:
+                    yield text
+
+    def _iter_native_stream(self, res) -> Iterator[str]:
+        for line in res.iter_lines(decode_unicode=True):
+            if not line:
+                continue
+            try:
+                data = json.loads(line)
+            except ValueError:
+                logger.warning(f"Ollama stream: skipping malformed chunk: {line[:100]}")
+                continue
+            if data.get("error"):
+                raise RuntimeError(f"Ollama error: {data['error']}")
+            text = (data.get("message") or {}).get("content")
+            if text:
+                yield text
+            if data.get("done"):
+                self._log_ollama_metrics(data)
+                break
+
+    # --- Routing ---
+
+    def _route(self, kind: str = STREAM) -> List[str]:
+        """Backends to try, in order: open circuits skipped, optionally sorted by rolling p50 of `kind` calls."""
+        order = [name for name in self.backends if self.health[name].available()]
+        if not order:
+            # Tất cả đều đang "hỏng": vẫn thử theo thứ tự ưu tiên còn hơn từ chối
+            return list(self.backends)
+        if self.routing == "latency" and all(self.health[n].sample_count(kind) >= 5 for n in order):
+            order.sort(key=lambda n: self.health[n].percentile(50, kind))
+        return order
+
+    def _race(self, sources: Dict[str, Callable[[], Iterator[str]]], kind: str = STREAM) -> Iterator[str]:
+        """
+        Yield the answer from the first routed backend that produces text.
+
+        Backends are tried in `_route()` order; one that fails before producing
+        text falls through to the next. A backend whose circuit is half-open is
+        only started if it can claim the single probe slot (`try_begin`), unless
+        every backend is unavailable and they are all tried anyway. With hedging, the next backend is also
+        started once the current one has been silent for `hedge_after[kind]`
+        seconds; the first to produce text wins and the other is told to stop
+        (its latency is still recorded when its first text arrives). A failure
+        after text was yielded is re-raised (the partial answer is already out).
+        """
+        pending = self._route(kind)
+        # _route trả về mọi backend khi không backend nào khả dụng: khi đó gọi cả probe đang bận
+        forced = not any(self.health[name].available() for name in pending)
+        hedge_after = self.hedge_after[kind]
+        events: "queue.Queue" = queue.Queue()
+        stops: Dict[str, threading.Event] = {}
+
+        def pump(name: str, stop: threading.Event) -> None:
+            health = self.health[name]
+            started = time.perf_counter()
+            produced = False
             try:
-                return self._call_gemini(prompt)
+                for text in sources[name]():
+                    if not produced:
+                        produced = True
+                        # Ghi cả khi đã thua cuộc đua, để p50 không chỉ gồm các lần thắng
+                        health.record_success(time.perf_counter() - started, kind)
+                    if stop.is_set():
+                        return
+                    events.put((name, "text", text))
+                if not produced:
+                    health.record_success(time.perf_counter() - started, kind)
+                events.put((name, "done", None))
             except Exception as e:
-                logger.error(f"Gemini failed, falling back to Ollama: {e}", exc_info=True)
+                health.record_failure()
+                events.put((name, "error", e))
+
+        def launch() -> Optional[str]:
+            """Start the next pending backend that may be called now; None if there is none."""
+            while pending:
+                name = pending.pop(0)
+                if not self.health[name].try_begin() and not forced:
+                    logger.info(f"LLM backend '{name}' is being probed by another call, skipping it.")
+                    continue
+                stops[name] = threading.Event()
+                threading.Thread(target=pump, args=(name, stops[name]), name=f"llm-{name}", daemon=True).start()
+                return name
+            return None
+
+        if launch() is None:
+            raise RuntimeError("No LLM backend available right now.")
+        running = 1
+        launched_at = time.monotonic()
+        winner: Optional[str] = None
+        last_error: Optional[Exception] = None
+        try:
+            while True:
+                timeout = None
+                if winner is None and pending and hedge_after > 0:
+                    timeout = max(0.0, launched_at + hedge_after - time.monotonic())
+                try:
+                    name, event, value = events.get(timeout=timeout)
+                except queue.Empty:
+                    hedge = launch()
+                    if hedge is not None:
+                        logger.warning(f"No LLM output after {hedge_after:.1f}s, hedging with {hedge}.")
+                        self.hedged += 1
+                        running += 1
+                        launched_at = time.monotonic()
+                    continue
 
-        # Fallback or primary if Gemini disabled
-        return self._call_ollama(prompt)
+                if winner is None:
+                    if event == "error":
+                        logger.error(f"LLM backend '{name}' failed: {value}")
+                        last_error = value
+                        running -= 1
+                        if running == 0:
+                            fallback = launch()
+                            if fallback is None:
+                                raise last_error
+                            logger.info(f"Falling back to {fallback}.")
+                            running += 1
+                            launched_at = time.monotonic()
+                        continue
+                    winner = name
+                    for other, stop in stops.items():
+                        if other != winner:
+                            stop.set()
+
+                if name != winner:
+                    continue
+                if event == "text":
+                    yield value
+                elif event == "done":
+                    return
+                else:
+                    logger.error(f"LLM backend '{name}' failed mid-answer: {value}")
+                    raise value
+        finally:
+            for stop in stops.values():
+                stop.set()
+
+    def generate_answer(self, prompt: str, system: Optional[str] = None) -> str:
+        """
+        Generate answer using the routed backends with fallback (and hedging, if enabled).
+        `system` is sent as a separate system message (keep it identical across calls).
+        The whole answer arrives at once, so hedging uses LLM_HEDGE_AFTER_BLOCKING_S.
+        """
+        sources = {
+            "gemini": lambda: iter([self._call_gemini(prompt, system)]),
+            "ollama": lambda: iter([self._call_ollama(prompt, system)]),
+        }
+        return "".join(self._race(sources, BLOCKING))
+
+    def stream_answer(self, prompt: str, system: Optional[str] = None) -> Iterator[str]:
+        """
+        Stream answer chunks using the routed backends with fallback (and hedging, if enabled).
+
+        Fallback only happens if a backend fails before producing any text;
+        a failure mid-stream is re-raised since the partial answer was already sent.
+        """
+        yield from self._race({
+            "gemini": lambda: self._stream_gemini(prompt, system),
+            "ollama": lambda: self._stream_ollama(prompt, system),
+        }, STREAM)
+
+    def stats(self) -> dict:
+        return {
+            "routing": self.routing,
+            "order": self._route(),
+            "hedge_after_s": self.hedge_after[STREAM],
+            "hedge_after_blocking_s": self.hedge_after[BLOCKING],
+            "hedged": self.hedged,
+            "backends": {name: health.snapshot() for name, health in self.health.items()},
+        }
 
 
 llm_manager = LLMManager()
@@ -0,0 +1,130 @@
+"""
+Per-backend health for LLMManager routing.
+
+`BackendHealth` keeps rolling latency windows per call type - STREAM (time
+until the backend produced its first text) and BLOCKING (the whole answer of
+a non-streaming call) - since the two differ by the full generation time,
+plus a window of call outcomes, and acts as a circuit breaker: after LLM_BREAKER_FAILURES
+consecutive failures the backend is skipped for LLM_BREAKER_COOLDOWN seconds;
+after that the circuit is half-open: one call at a time is let through as a
+probe (`try_begin`), other callers see the backend as unavailable until the
+probe records its outcome. A failed probe re-opens the circuit, a successful
+one closes it.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from collections import deque
+from typing import Optional
+
+import numpy as np
+
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+STREAM = "stream"
+BLOCKING = "blocking"
+
+
+class BackendHealth:
+    def __init__(self, name: str, window: int = 50, failure_threshold: int = 3, cooldown_seconds: float = 30.0):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.cooldown_seconds = cooldown_seconds
+
+        self._lock = threading.Lock()
+        self._latencies = {STREAM: deque(maxlen=window), BLOCKING: deque(maxlen=window)}
+        self._outcomes: deque = deque(maxlen=window)  # True = success
+        self._consecutive_failures = 0
+        self._opened_at: Optional[float] = None
+        self._probe_started: Optional[float] = None  # probe đang chạy khi nửa mở
+        self.calls = 0
+
+    def _state_locked(self, now: float) -> str:
+        if self._opened_at is None:
+            return "closed"
+        return "half_open" if now - self._opened_at >= self.cooldown_seconds else "open"
+
+    def _probing_locked(self, now: float) -> bool:
+        # Probe treo quá một chu kỳ chờ thì coi như đã mất, cho probe khác chạy
+        return self._probe_started is not None and now - self._probe_started < self.cooldown_seconds
+
+    def available(self) -> bool:
+        """False while the circuit is open, or half-open with a probe already in flight."""
+        with self._lock:
+            now = time.monotonic()
+            state = self._state_locked(now)
+            return state == "closed" or (state == "half_open" and not self._probing_locked(now))
+
+    def try_begin(self) -> bool:
+        """
+        Claim a call before starting it: True when closed; when half-open, True
+        for a single probe until it records success or failure.
+        """
+        with self._lock:
+            now = time.monotonic()
+            state = self._state_locked(now)
+            if state == "closed":
+                return True
+            if state == "open" or self._probing_locked(now):
+                return False
+            self._probe_started = now
+            return True
+
+    def record_success(self, latency: float, kind: str = STREAM) -> None:
+        with self._lock:
+            self.calls += 1
+            self._latencies[kind].append(latency)
+            self._outcomes.append(True)
+            self._consecutive_failures = 0
+            self._probe_started = None
+            if self._opened_at is not None:
+                logger.info(f"LLM backend '{self.name}' recovered, circuit closed.")
+            self._opened_at = None
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.calls += 1
+            self._outcomes.append(False)
+            self._consecutive_failures += 1
+            self._probe_started = None
+            if self._consecutive_failures >= self.failure_threshold:
+                if self._opened_at is None:
+                    logger.warning(
+                        f"LLM backend '{self.name}' failed {self._consecutive_failures} times in a row, "
+                        f"skipping it for {self.cooldown_seconds:.0f}s."
+                    )
+                # Nửa mở mà vẫn lỗi: mở lại, tính lại thời gian chờ
+                self._opened_at = time.monotonic()
+
+    def percentile(self, q: float, kind: str = STREAM) -> Optional[float]:
+        with self._lock:
+            if not self._latencies[kind]:
+                return None
+            return float(np.percentile(np.fromiter(self._latencies[kind], dtype=float), q))
+
+    def sample_count(self, kind: str = STREAM) -> int:
+        with self._lock:
+            return len(self._latencies[kind])
+
+    def snapshot(self) -> dict:
+        latency = {}
+        for kind in (STREAM, BLOCKING):
+            p50, p95 = self.percentile(50, kind), self.percentile(95, kind)
+            latency[kind] = {
+                "p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+                "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+            }
+        with self._lock:
+            outcomes = list(self._outcomes)
+            state = self._state_locked(time.monotonic())
+            calls = self.calls
+        return {
+            "state": state,
+            "calls": calls,
+            "latency": latency,
+            "error_rate": round(outcomes.count(False) / len(outcomes), 3) if outcomes else 0.0,
+        }
@@ -0,0 +1,139 @@
+"""
+Speculative retrieval prefetch.
+
+While the visitor is still speaking, interim transcripts are sent to
+`RAGEngine.prefetch(session_id, text)`: the partial question is embedded and
+the retriever is run on it, and the documents are kept for a few seconds per
+session. When the final question arrives with the same session id and is
+close enough to the speculated one (same normalized text, or cosine similarity
+above PREFETCH_SIMILARITY), those documents are used directly and only the LLM
+call remains on the critical path.
+"""
+
+from __future__ import annotations
+
+import itertools
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, List, Optional
+
+import numpy as np
+from langchain_core.documents import Document
+
+from src.core.answer_cache import normalize_question
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+@dataclass
+class _Speculation:
+    seq: int
+    normalized: str
+    embedding: np.ndarray
+    docs: List[Document]
+    created_at: float
+
+
+def _unit(vector) -> np.ndarray:
+    v = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(v)
+    return v / norm if norm else v
+
+
+class RetrievalPrefetcher:
+    def __init__(
+        self,
+        embed_fn: Callable[[str], List[float]],
+        retrieve_fn: Callable[[str], List[Document]],
+        ttl_seconds: float = 30,
+        similarity_threshold: float = 0.9,
+        max_sessions: int = 256,
+        min_chars: int = 8,
+    ):
+        self.embed_fn = embed_fn
+        self.retrieve_fn = retrieve_fn
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self.max_sessions = max_sessions
+        self.min_chars = min_chars
+
+        self._lock = threading.Lock()
+        self._sessions: "OrderedDict[str, _Speculation]" = OrderedDict()
+        self._seq = itertools.count()
+
+        self.issued = 0
+        self.skipped = 0
+        self.hits = 0
+        self.misses = 0
+
+    def prefetch(self, session_id: str, text: str) -> bool:
+        """Retrieve for a partial question and keep the result for this session. Returns False if skipped."""
+        normalized = normalize_question(text)
+        if not session_id or len(normalized) < self.min_chars:
+            return False
+        seq = next(self._seq)
+        with self._lock:
+            current = self._sessions.get(session_id)
+            if current is not None and current.normalized == normalized:
+                self.skipped += 1
+                return False
+            self.issued += 1
+
+        embedding = _unit(self.embed_fn(text))
+        docs = self.retrieve_fn(text)
+
+        with self._lock:
+            current = self._sessions.get(session_id)
+            # Một lần prefetch cũ hơn có thể xong sau lần mới hơn: giữ kết quả mới nhất
+            if current is None or current.seq < seq:
+                self._sessions[session_id] = _Speculation(seq, normalized, embedding, docs, time.monotonic())
+                self._sessions.move_to_end(session_id)
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+        return True
+
+    def take(self, session_id: Optional[str], question: str, embedding=None) -> Optional[List[Document]]:
+        """
+        Pop the session's speculation and return its documents if it matches
+        `question`; `embedding` (of the question) is computed if not given.
+        """
+        if not session_id:
+            return None
+        with self._lock:
+            speculation = self._sessions.pop(session_id, None)
+        if speculation is None:
+            return None
+        if time.monotonic() - speculation.created_at > self.ttl_seconds:
+            self.misses += 1
+            return None
+
+        if normalize_question(question) != speculation.normalized:
+            if embedding is None:
+                embedding = self.embed_fn(question)
+            similarity = float(np.dot(_unit(embedding), speculation.embedding))
+            if similarity < self.similarity_threshold:
+                self.misses += 1
+                logger.info(f"Prefetch miss (similarity {similarity:.3f}).")
+                return None
+
+        self.hits += 1
+        logger.info(f"Prefetch hit: reusing {len(speculation.docs)} document(s) retrieved while listening.")
+        return speculation.docs
+
+    def discard(self, session_id: str) -> None:
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            sessions = len(self._sessions)
+        return {
+            "sessions": sessions,
+            "issued": self.issued,
+            "skipped": self.skipped,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
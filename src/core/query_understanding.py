@@ -0,0 +1,197 @@
+"""
+Query understanding: detect an exact artifact name or a historical period in
+the question, using lookup tables built from the Chroma metadata (`ten`,
+`thoi_ky`, `item_id`) at startup.
+
+- Artifact name found  -> its documents are fetched by `item_id` directly
+  (metadata lookup, no ANN search).
+- Period found         -> the search is restricted with a Chroma `where`
+  filter on `thoi_ky`.
+- Nothing found        -> the normal retriever is used unchanged.
+"""
+
+from __future__ import annotations
+
+import re
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Set
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from src.core.answer_cache import read_db_version
+from src.utils.vi_text import fold_diacritics
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+_PAREN_RE = re.compile(r"\([^)]*\)")
+_SEGMENT_SPLIT_RE = re.compile(r"[–\-,;/.]")
+_NON_WORD_RE = re.compile(r"[^\w\s]")
+_SPACE_RE = re.compile(r"\s+")
+_DIGIT_RE = re.compile(r"\d")
+
+# Tiền tố chỉ thời kỳ; tên thời kỳ một âm tiết ("Lý", "Lê") chỉ được nhận khi đi sau các tiền tố này
+_PERIOD_PREFIXES = ("thoi ky", "thoi", "nha", "trieu", "trieu dai", "giai doan", "van hoa", "dai")
+
+
+def _fold(text: str) -> str:
+    text = fold_diacritics(text.casefold())
+    text = _NON_WORD_RE.sub(" ", text)
+    return _SPACE_RE.sub(" ", text).strip()
+
+
+def _contains_phrase(haystack: str, phrase: str) -> bool:
+    return f" {phrase} " in f" {haystack} "
+
+
+def _period_keys(thoi_ky: str) -> Set[str]:
+    """'Thời Lê – Trịnh (1428 – 1802)' -> {'le', 'trinh'}"""
+    keys = set()
+    for segment in _SEGMENT_SPLIT_RE.split(_PAREN_RE.sub(" ", thoi_ky)):
+        key = _fold(segment)
+        if not key or _DIGIT_RE.search(key):
+            continue
+        for prefix in sorted(_PERIOD_PREFIXES, key=len, reverse=True):
+            if key.startswith(prefix + " "):
+                key = key[len(prefix) + 1:]
+                break
+        if key:
+            keys.add(key)
+    return keys
+
+
+@dataclass
+class QueryHints:
+    item_ids: List[str] = field(default_factory=list)
+    thoi_ky: List[str] = field(default_factory=list)
+
+    def where(self) -> Optional[dict]:
+        """Chroma `where` filter for the detected period(s)."""
+        if not self.thoi_ky:
+            return None
+        if len(self.thoi_ky) == 1:
+            return {"thoi_ky": self.thoi_ky[0]}
+        return {"thoi_ky": {"$in": self.thoi_ky}}
+
+
+class MetadataLookup:
+    """Name / period lookup tables built from the vector store metadata."""
+
+    def __init__(self, vectordb, version_file: Optional[str] = None):
+        self.vectordb = vectordb
+        self.version_file = version_file
+        self._lock = threading.Lock()
+        self._db_version: Optional[str] = None
+        self._names: Dict[str, Set[str]] = {}  # folded name -> item_ids
+        self._periods: Dict[str, Set[str]] = {}  # period key -> raw thoi_ky values
+        self.rebuild()
+
+    def rebuild(self) -> None:
+        metadatas = self.vectordb.get(include=["metadatas"])["metadatas"]
+        names: Dict[str, Set[str]] = {}
+        periods: Dict[str, Set[str]] = {}
+        for meta in metadatas:
+            meta = meta or {}
+            item_id, ten, thoi_ky = meta.get("item_id"), meta.get("ten"), meta.get("thoi_ky")
+            if item_id and ten:
+                for variant in {_fold(ten), _fold(_PAREN_RE.sub(" ", ten))}:
+                    # Tên một âm tiết quá dễ trùng với từ thường, bỏ qua
+                    if len(variant.split()) >= 2:
+                        names.setdefault(variant, set()).add(item_id)
+            if thoi_ky:
+                for key in _period_keys(thoi_ky):
+                    periods.setdefault(key, set()).add(thoi_ky)
+
+        with self._lock:
+            self._names = names
+            self._periods = periods
+            self._db_version = read_db_version(self.version_file) if self.version_file else None
+        logger.info(f"Metadata lookup built: {len(names)} artifact name(s), {len(periods)} period key(s)")
+
+    def _refresh_if_stale(self) -> None:
+        if self.version_file and read_db_version(self.version_file) != self._db_version:
+            logger.info("Vector DB changed, rebuilding metadata lookup.")
+            self.rebuild()
+
+    def analyze(self, question: str) -> QueryHints:
+        self._refresh_if_stale()
+        folded = _fold(question)
+        hints = QueryHints()
+
+        with self._lock:
+            # Longest names first, skipping names contained in an already matched one
+            matched: List[str] = []
+            for name in sorted(self._names, key=len, reverse=True):
+                if _contains_phrase(folded, name) and not any(name in m for m in matched):
+                    matched.append(name)
+            # Items in the order they appear in the question
+            for name in sorted(matched, key=lambda n: f" {folded} ".find(f" {n} ")):
+                hints.item_ids.extend(i for i in sorted(self._names[name]) if i not in hints.item_ids)
+            if hints.item_ids:
+                return hints
+
+            values: Set[str] = set()
+            for key, raw_values in self._periods.items():
+                if len(key.split()) >= 2:
+                    found = _contains_phrase(folded, key)
+                else:
+                    found = any(_contains_phrase(folded, f"{prefix} {key}") for prefix in _PERIOD_PREFIXES)
+                if found:
+                    values |= raw_values
+            hints.thoi_ky = sorted(values)
+        return hints
+
+    def documents_for_items(self, item_ids: List[str], limit: int) -> List[Document]:
+        where = {"item_id": item_ids[0]} if len(item_ids) == 1 else {"item_id": {"$in": item_ids}}
+        result = self.vectordb.get(where=where, include=["documents", "metadatas"])
+        docs = [
+            Document(page_content=content, metadata=meta or {})
+            for content, meta in zip(result["documents"], result["metadatas"])
+        ]
+        # Keep the question's order of items, then chunk order
+        order = {item_id: i for i, item_id in enumerate(item_ids)}
+        docs.sort(key=lambda d: (order.get(d.metadata.get("item_id"), 0), d.metadata.get("chunk", 0)))
+        return docs[:limit]
+
+
+class FilteredRetriever(BaseRetriever):
+    """
+    Wrap a retriever with the metadata pre-filter stage described above.
+    `base` may be a HybridRetriever (supports `search(query, where=...)`) or a
+    plain vector store retriever.
+    """
+
+    base: Any
+    vectordb: Any
+    lookup: Any
+    k: int = 5
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        try:
+            hints = self.lookup.analyze(query)
+        except Exception as e:
+            logger.warning(f"Query analysis failed, using unfiltered retrieval: {e}")
+            hints = QueryHints()
+
+        if hints.item_ids:
+            docs = self.lookup.documents_for_items(hints.item_ids, self.k)
+            if docs:
+                logger.info(f"Exact artifact match {hints.item_ids}: skipping vector search.")
+                return docs
+
+        where = hints.where()
+        if where is not None:
+            logger.info(f"Period filter: {where}")
+            if hasattr(self.base, "search"):
+                docs = self.base.search(query, where=where)
+            else:
+                docs = self.vectordb.similarity_search(query, k=self.k, filter=where)
+            if docs:
+                return docs
+
+        return self.base.invoke(query)
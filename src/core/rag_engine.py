@@ -1,21 +1,33 @@
 """
 RAG Engine built on top of existing ChromaDB and embedding logic.
 
-This wraps the previous `ChatbotService` idea into a simpler interface
-that uses LLMManager for answer generation when needed.
+This wraps the previous `ChatbotService` idea into a simpler interface:
+the retriever finds the context, the prompt is formatted here, and every
+answer is generated through LLMManager (routing, fallback and hedging between
+Gemini and Ollama).
 """
 
 from __future__ import annotations
 
+import os
+import threading
+import time
 import warnings
-from typing import List
+from contextlib import contextmanager
+from typing import Iterator, List, Optional, Tuple
 
 from langchain_chroma import Chroma
-from langchain.prompts import ChatPromptTemplate
-from langchain.chains import RetrievalQA
 
+from src.core.answer_cache import AnswerCache
+from src.core.context_builder import ContextBuilder, estimate_tokens
+from src.core.hybrid_retriever import HybridRetriever
+from src.core.prefetch import RetrievalPrefetcher
+from src.core.query_understanding import FilteredRetriever, MetadataLookup
+from src.core.traced_vectorstore import TracedVectorStore
+from src.core.llm_manager import llm_manager
 from src.helper import download_hugging_face_embeddings
 from src.prompt import system_prompt
+from src.utils.tracing import observe, span, traced
 from config import settings
 from utils.logger import get_logger
 
@@ -28,71 +40,309 @@ logger = get_logger(__name__)
 
 class RAGEngine:
     def __init__(self):
-        logger.info("--- Initializing RAG Engine ---")
-        self.embeddings = download_hugging_face_embeddings()
-        self.retriever = self._load_vector_db()
-        self.rag_chain = self._create_rag_chain()
-        logger.info("--- RAG Engine is ready ---")
+        # Không nạp gì lúc import: model được nạp trong warm_up() (gọi nền khi server khởi động,
+        # hoặc tự động ở request đầu tiên)
+        self._ready = threading.Event()
+        self._warmup_lock = threading.Lock()
+        self.startup_timings: dict = {}
+        self.startup_error: Optional[str] = None
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set()
+
+    @contextmanager
+    def _phase(self, name: str):
+        started = time.perf_counter()
+        yield
+        self.startup_timings[name] = round(time.perf_counter() - started, 3)
+        logger.info(f"RAG warm-up phase '{name}' took {self.startup_timings[name]:.2f}s")
+
+    def warm_up(self) -> None:
+        """Load embeddings, vector DB, chain, caches and the LLM client, timing each phase. Idempotent."""
+        if self._ready.is_set():
+            return
+        with self._warmup_lock:
+            if self._ready.is_set():
+                return
+            logger.info("--- Initializing RAG Engine ---")
+            self.startup_error = None
+            try:
+                with self._phase("embeddings"):
+                    self.embeddings = download_hugging_face_embeddings()
+                    # Lần embed đầu tiên khởi tạo lười tokenizer / session: trả giá ở đây
+                    self.embeddings.embed_query("xin chào")
+                with self._phase("vector_db"):
+                    self.retriever = self._load_vector_db()
+                with self._phase("prompt"):
+                    self.system_message, self.prompt_template = self._create_prompt_template()
+                    self.context_builder = (
+                        ContextBuilder(settings.CONTEXT_TOKEN_BUDGET, settings.CONTEXT_TOKENS_PER_WORD)
+                        if settings.CONTEXT_COMPRESSION else None
+                    )
+                with self._phase("caches"):
+                    self.answer_cache = self._create_answer_cache()
+                    self.prefetcher = self._create_prefetcher()
+                with self._phase("llm"):
+                    llm_manager.warm_up()
+            except Exception as e:
+                self.startup_error = str(e)
+                logger.error(f"RAG Engine warm-up failed: {e}", exc_info=True)
+                raise
+            self._ready.set()
+            logger.info(f"--- RAG Engine is ready ({sum(self.startup_timings.values()):.2f}s) ---")
+
+    def start_warm_up(self) -> threading.Thread:
+        """Run `warm_up` on a background thread so the server can answer /health meanwhile."""
+
+        def run() -> None:
+            try:
+                self.warm_up()
+            except Exception:
+                pass  # đã log; request tiếp theo sẽ thử lại
+
+        thread = threading.Thread(target=run, name="rag-warmup", daemon=True)
+        thread.start()
+        return thread
+
+    def health(self) -> dict:
+        if self.ready:
+            status = "ready"
+        else:
+            status = "error" if self.startup_error else "starting"
+        payload = {"status": status, "phases": dict(self.startup_timings)}
+        if self.startup_error:
+            payload["error"] = self.startup_error
+        return payload
+
+    def _create_prefetcher(self):
+        if not settings.PREFETCH_ENABLED:
+            return None
+        return RetrievalPrefetcher(
+            embed_fn=self.embeddings.embed_query,
+            retrieve_fn=self.retriever.invoke,
+            ttl_seconds=settings.PREFETCH_TTL,
+            similarity_threshold=settings.PREFETCH_SIMILARITY,
+            min_chars=settings.PREFETCH_MIN_CHARS,
+        )
+
+    def prefetch(self, session_id: str, partial_question: str) -> bool:
+        """Speculatively retrieve for an interim transcript (see src/core/prefetch.py)."""
+        # Chỉ là suy đoán: không chờ warm-up
+        if not self.ready or self.prefetcher is None:
+            return False
+        try:
+            return self.prefetcher.prefetch(session_id, partial_question)
+        except Exception as e:
+            logger.warning(f"Retrieval prefetch failed: {e}")
+            return False
+
+    def _prefetched_docs(self, session_id: Optional[str], question: str, embedding):
+        if self.prefetcher is None or not session_id:
+            return None
+        try:
+            return self.prefetcher.take(session_id, question, embedding)
+        except Exception as e:
+            logger.warning(f"Prefetch lookup failed: {e}")
+            return None
+
+    def _create_answer_cache(self):
+        if not settings.ANSWER_CACHE_ENABLED:
+            logger.info("Answer cache is disabled.")
+            return None
+        return AnswerCache(
+            embed_fn=traced("embed", self.embeddings.embed_query),
+            max_entries=settings.ANSWER_CACHE_MAX_ENTRIES,
+            ttl_seconds=settings.ANSWER_CACHE_TTL,
+            similarity_threshold=settings.ANSWER_CACHE_SIMILARITY,
+            version_file=settings.VECTOR_DB_VERSION_FILE,
+            # Khớp ngữ nghĩa chỉ khi hai câu hỏi nhắc cùng hiện vật / thời kỳ
+            hints_fn=self.metadata_lookup.analyze if self.metadata_lookup is not None else None,
+            hintless_similarity_threshold=settings.ANSWER_CACHE_SIMILARITY_NO_HINTS,
+        )
+
+    def _cache_lookup(self, question: str):
+        """Return (cached_answer, question_embedding); both None when the cache is off."""
+        if self.answer_cache is None:
+            return None, None
+        try:
+            return self.answer_cache.lookup(question)
+        except Exception as e:
+            logger.warning(f"Answer cache lookup failed: {e}")
+            return None, None
+
+    def _cache_store(self, question: str, answer: str, embedding) -> None:
+        if self.answer_cache is None:
+            return
+        try:
+            self.answer_cache.store(question, answer, embedding)
+        except Exception as e:
+            logger.warning(f"Answer cache store failed: {e}")
 
     def _load_vector_db(self):
         logger.info(f"Loading ChromaDB from: {settings.PERSIST_DIRECTORY} ...")
-        vectordb = Chroma(
+        # Embedding câu hỏi và tìm kiếm Chroma được đo thành hai stage riêng ("embed", "vector_search")
+        vectordb = TracedVectorStore(Chroma(
             persist_directory=settings.PERSIST_DIRECTORY,
             embedding_function=self.embeddings,
-        )
-        retriever = vectordb.as_retriever(search_kwargs={"k": 5})
-        return retriever
-
-    def _create_rag_chain(self):
-        logger.info(f"Configuring LLM for RAG: {settings.LLM_MODEL_NAME} ...")
+        ))
+        self.vectordb = vectordb
+        self.metadata_lookup = None
 
-        # Reuse original Google GenAI LLM for now; can later refactor to use LLMManager directly.
-        from langchain_google_genai import ChatGoogleGenerativeAI
+        retriever = None
+        if settings.RETRIEVAL_MODE == "hybrid":
+            if os.path.exists(settings.BM25_INDEX_PATH):
+                logger.info(f"Using hybrid retrieval (BM25 + vector, RRF), k={settings.RETRIEVAL_K}")
+                retriever = HybridRetriever(
+                    vectorstore=vectordb,
+                    index_path=settings.BM25_INDEX_PATH,
+                    k=settings.RETRIEVAL_K,
+                    fetch_k=settings.RETRIEVAL_FETCH_K,
+                    rrf_k=settings.RRF_K,
+                )
+            else:
+                logger.warning(
+                    f"BM25 index not found at {settings.BM25_INDEX_PATH}, using dense retrieval. "
+                    "Run scripts/store_data_from_csv.py to build it."
+                )
 
-        chat_model = ChatGoogleGenerativeAI(
-            model=settings.LLM_MODEL_NAME,
-            temperature=0.7,
-            max_output_tokens=512,
-            google_api_key=settings.GOOGLE_API_KEY,
-            convert_system_message_to_human=True,
-        )
+        if retriever is None:
+            retriever = vectordb.as_retriever(search_kwargs={"k": settings.RETRIEVAL_K})
 
-        template = f"""{system_prompt}
+        if settings.QUERY_FILTER_ENABLED:
+            try:
+                lookup = MetadataLookup(vectordb, version_file=settings.VECTOR_DB_VERSION_FILE)
+                retriever = FilteredRetriever(base=retriever, vectordb=vectordb, lookup=lookup, k=settings.RETRIEVAL_K)
+                self.metadata_lookup = lookup
+            except Exception as e:
+                logger.error(f"Could not build metadata lookup, pre-filtering disabled: {e}", exc_info=True)
+        return retriever
 
-Dựa vào thông tin ngữ cảnh được cung cấp dưới đây để trả lời câu hỏi.
-Nếu không tìm thấy thông tin trong ngữ cảnh, hãy nói rằng bạn không biết.
+    def _create_prompt_template(self) -> Tuple[str, str]:
+        """
+        (system message, user template). The system message never changes between
+        questions, so it is sent separately ahead of the context: the LLM server
+        can then reuse the KV cache of that prefix instead of re-evaluating it.
+        """
+        system_message = f"""{system_prompt}
 
-Ngữ cảnh:
-{{context}}
+Dựa vào thông tin ngữ cảnh được cung cấp trong tin nhắn của người dùng để trả lời câu hỏi.
+Nếu không tìm thấy thông tin trong ngữ cảnh, hãy nói rằng bạn không biết."""
+        template = """Ngữ cảnh:
+{context}
 
 Câu hỏi:
-{{question}}
+{question}
 
 Câu trả lời hữu ích:"""
+        logger.info("RAG prompt template created.")
+        return system_message, template
 
-        prompt = ChatPromptTemplate.from_template(template)
-
-        rag_chain = RetrievalQA.from_chain_type(
-            llm=chat_model,
-            retriever=self.retriever,
-            chain_type="stuff",
-            chain_type_kwargs={"prompt": prompt},
+    def _build_prompt(self, question: str, session_id: Optional[str], embedding) -> str:
+        """Retrieve (or reuse the documents prefetched for `session_id`) and format the prompt."""
+        docs = self._prefetched_docs(session_id, question, embedding)
+        if docs is None:
+            with span("retrieve"):
+                docs = self.retriever.invoke(question)
+        if self.context_builder is not None:
+            with span("context"):
+                built = self.context_builder.build(question, docs)
+            context = built.text
+            logger.info(
+                f"RAG context: {len(docs)} chunk(s) -> {built.items} item(s), "
+                f"{built.sentences_used}/{built.sentences_total} sentence(s), "
+                f"~{built.tokens} tokens (verbatim ~{built.original_tokens})"
+            )
+        else:
+            context = "\n\n".join(doc.page_content for doc in docs)
+        prompt = self.prompt_template.format(context=context, question=question)
+        logger.info(
+            f"RAG prompt: ~{estimate_tokens(prompt, settings.CONTEXT_TOKENS_PER_WORD)} tokens "
+            f"(+ ~{estimate_tokens(self.system_message, settings.CONTEXT_TOKENS_PER_WORD)} system)"
         )
-        logger.info("RAG chain created successfully.")
-        return rag_chain
+        return prompt
 
-    def get_answer(self, question: str) -> str:
+    def get_answer(self, question: str, session_id: Optional[str] = None) -> str:
         logger.info(f"RAG question: {question}")
         try:
-            response = self.rag_chain.invoke({"query": question})
-            answer = response.get("result", "").strip()
+            self.warm_up()
+        except Exception:
+            return "Đã xảy ra lỗi khi truy vấn RAG, vui lòng thử lại."
+        cached, embedding = self._cache_lookup(question)
+        if cached is not None:
+            logger.info("RAG answer served from cache.")
+            return cached
+        try:
+            prompt_text = self._build_prompt(question, session_id, embedding)
+            with span("llm"):
+                answer = (llm_manager.generate_answer(prompt_text, system=self.system_message) or "").strip()
             if not answer:
-                answer = "Xin lỗi, tôi không tìm thấy câu trả lời phù hợp trong dữ liệu."
+                return "Xin lỗi, tôi không tìm thấy câu trả lời phù hợp trong dữ liệu."
+            self._cache_store(question, answer, embedding)
             return answer
         except Exception as e:
             logger.error(f"Error while running RAG: {e}", exc_info=True)
             return "Đã xảy ra lỗi khi truy vấn RAG, vui lòng thử lại."
 
+    def stream_answer(self, question: str, session_id: Optional[str] = None) -> Iterator[str]:
+        """
+        Stream the answer chunk-by-chunk.
+
+        Retrieval and prompt formatting run first (`_build_prompt`, shared with
+        `get_answer`), then the LLM output is yielded as soon as each chunk is
+        produced.
+        """
+        logger.info(f"RAG stream question: {question}")
+        try:
+            self.warm_up()
+        except Exception:
+            yield "Đã xảy ra lỗi khi truy vấn RAG, vui lòng thử lại."
+            return
+        cached, embedding = self._cache_lookup(question)
+        if cached is not None:
+            logger.info("RAG answer served from cache.")
+            yield cached
+            return
+
+        try:
+            prompt_text = self._build_prompt(question, session_id, embedding)
+        except Exception as e:
+            logger.error(f"Error while retrieving for RAG stream: {e}", exc_info=True)
+            yield "Đã xảy ra lỗi khi truy vấn RAG, vui lòng thử lại."
+            return
+
+        parts = []
+        started = time.perf_counter()
+        try:
+            for text in llm_manager.stream_answer(prompt_text, system=self.system_message):
+                if not parts:
+                    observe("llm_first_text", time.perf_counter() - started)
+                parts.append(text)
+                yield text
+            observe("llm", time.perf_counter() - started)
+        except Exception as e:
+            observe("llm", time.perf_counter() - started, error=True)
+            logger.error(f"Error while streaming RAG answer: {e}", exc_info=True)
+            if not parts:
+                yield "Đã xảy ra lỗi khi truy vấn RAG, vui lòng thử lại."
+            return
+
+        answer = "".join(parts).strip()
+        if not answer:
+            yield "Xin lỗi, tôi không tìm thấy câu trả lời phù hợp trong dữ liệu."
+            return
+        self._cache_store(question, answer, embedding)
+
+    def cache_stats(self) -> dict:
+        if not self.ready:
+            return {"enabled": settings.ANSWER_CACHE_ENABLED, "ready": False}
+        stats = self.answer_cache.stats() if self.answer_cache is not None else {"enabled": False}
+        if self.prefetcher is not None:
+            stats["prefetch"] = self.prefetcher.stats()
+        if self.context_builder is not None:
+            stats["context"] = self.context_builder.stats()
+        return stats
+
 
 rag_engine = RAGEngine()
 
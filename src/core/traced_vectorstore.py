@@ -0,0 +1,52 @@
+"""
+Vector store wrapper that splits a similarity search into two traced stages.
+
+Chroma embeds the query inside `similarity_search`, so a single span around
+retrieval cannot tell the embedding model from the index lookup. Here the
+query is embedded first (stage "embed") and the search is run with
+`similarity_search_by_vector` (stage "vector_search"); /metrics then shows
+the two latencies separately. Everything else (`get`, `delete`, ...) is
+passed through to the wrapped store.
+"""
+
+from __future__ import annotations
+
+from typing import Any, List, Optional
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+from src.utils.tracing import span
+
+
+class TracedVectorStore(VectorStore):
+    def __init__(self, store: VectorStore):
+        self.store = store
+
+    def __getattr__(self, name: str) -> Any:
+        # Chỉ được gọi khi thuộc tính không có trên wrapper: get, delete, _collection...
+        store = self.__dict__.get("store")
+        if store is None:
+            raise AttributeError(name)
+        return getattr(store, name)
+
+    @property
+    def embeddings(self) -> Optional[Embeddings]:
+        return self.store.embeddings
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        with span("embed"):
+            embedding = self.store.embeddings.embed_query(query)
+        return self.similarity_search_by_vector(embedding, k=k, **kwargs)
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, **kwargs: Any) -> List[Document]:
+        with span("vector_search"):
+            return self.store.similarity_search_by_vector(embedding, k=k, **kwargs)
+
+    def add_texts(self, texts, metadatas=None, **kwargs: Any) -> List[str]:
+        return self.store.add_texts(texts, metadatas=metadatas, **kwargs)
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, **kwargs: Any):
+        raise NotImplementedError("TracedVectorStore only wraps an existing store.")
@@ -1,14 +1,44 @@
+import time
+
 from langchain_huggingface import HuggingFaceEmbeddings
 from config import settings
 from utils.logger import get_logger
 
 logger = get_logger(__name__)
 
-def download_hugging_face_embeddings():
+def download_hugging_face_embeddings(backend=None):
     """
     Tải mô hình embeddings từ HuggingFace dựa trên tên trong settings.
+    backend: "torch" | "onnx" | "onnx-int8" | "remote" (mặc định lấy từ settings.EMBEDDING_BACKEND).
     """
-    logger.info(f"Đang tải mô hình embedding: {settings.EMBEDDING_MODEL_NAME}...")
+    backend = (backend or settings.EMBEDDING_BACKEND).lower()
+    logger.info(f"Đang tải mô hình embedding: {settings.EMBEDDING_MODEL_NAME} (backend={backend})...")
+    if backend == "remote":
+        from src.remote_embeddings import load_remote_embeddings
+
+        embeddings = load_remote_embeddings()
+        # Service có thể đang khởi động song song (run_system.py): chờ một lúc trước khi bỏ cuộc
+        deadline = time.monotonic() + settings.EMBEDDING_SERVICE_WAIT
+        while True:
+            if embeddings.ping():
+                logger.info(f"Dùng embedding service dùng chung: {embeddings.base_url}")
+                return embeddings
+            if time.monotonic() >= deadline:
+                break
+            time.sleep(1)
+        logger.error(f"Embedding service không sẵn sàng ({embeddings.base_url}), quay về torch trong process này.")
+    elif backend in ("onnx", "onnx-int8"):
+        try:
+            from src.onnx_embeddings import load_onnx_embeddings
+
+            embeddings = load_onnx_embeddings(quantized=backend == "onnx-int8")
+            logger.info("Tải embedding ONNX thành công.")
+            return embeddings
+        except Exception as e:
+            logger.error(f"Không dùng được backend ONNX, quay về torch: {e}", exc_info=True)
+    elif backend != "torch":
+        logger.warning(f"EMBEDDING_BACKEND không hợp lệ: '{backend}', dùng torch.")
+
     try:
         embeddings = HuggingFaceEmbeddings(
             model_name=settings.EMBEDDING_MODEL_NAME,
@@ -1,5 +1,7 @@
 """
 Data ingestion tools for building/updating the vector database from CSV or other sources.
+- load_csv: CLI wrapper around scripts/store_data_from_csv.py
+- embedding_engine: batched / multi-process embedding and bulk Chroma writes
 """
 
 
@@ -0,0 +1,251 @@
+"""
+Batched embedding engine for ingestion.
+
+Query-time embedding stays on `src.helper.download_hugging_face_embeddings`;
+this engine is only for bulk ingestion:
+- texts are sorted by length and cut into batches, so each batch pads to a
+  similar length (less wasted compute on padding);
+- batches run in-process or on a process pool with one model replica per worker,
+  or, with EMBEDDING_BACKEND=remote, are sent to the shared embedding service
+  (no local model copy at all);
+- vectors are written to Chroma in bulk as soon as they are produced, with a
+  tqdm progress bar.
+
+`embed_and_write` accepts a generator of Documents and runs a bounded
+producer/consumer pipeline: parsing, embedding and Chroma writes overlap, and
+only a few windows of documents are held in memory at any time.
+"""
+
+from __future__ import annotations
+
+import queue
+import threading
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from contextlib import nullcontext
+from typing import Callable, Iterable, List, Optional, Sequence
+
+from tqdm import tqdm
+
+from config import settings
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Model replica of the current worker process (set by _init_worker)
+_worker_model = None
+
+# Sentinel marking the end of a pipeline queue
+_DONE = object()
+
+
+def _load_model(model_name: str, device: str):
+    from sentence_transformers import SentenceTransformer
+
+    return SentenceTransformer(model_name, device=device)
+
+
+def _init_worker(model_name: str, device: str) -> None:
+    global _worker_model
+    _worker_model = _load_model(model_name, device)
+
+
+def _encode_batch(indices: List[int], texts: List[str], batch_size: int):
+    vectors = _worker_model.encode(texts, batch_size=batch_size, show_progress_bar=False)
+    return indices, vectors.tolist()
+
+
+class IngestionEmbedder:
+    def __init__(
+        self,
+        model_name: str = settings.EMBEDDING_MODEL_NAME,
+        batch_size: int = settings.INGEST_BATCH_SIZE,
+        num_workers: int = settings.INGEST_NUM_WORKERS,
+        write_batch_size: int = settings.INGEST_WRITE_BATCH_SIZE,
+        queue_size: int = settings.INGEST_QUEUE_SIZE,
+        device: str = "cpu",
+        remote: bool = settings.EMBEDDING_BACKEND == "remote",
+    ):
+        self.model_name = model_name
+        self.batch_size = max(1, batch_size)
+        self.num_workers = max(1, num_workers)
+        self.write_batch_size = max(1, write_batch_size)
+        self.queue_size = max(1, queue_size)
+        self.device = device
+        self.remote = remote
+        if remote and self.num_workers > 1:
+            # Service đã giữ mô hình và tự gộp batch: process pool chỉ tốn thêm RAM
+            logger.info("Embedding qua service dùng chung, bỏ qua INGEST_NUM_WORKERS.")
+            self.num_workers = 1
+        self._model = None
+
+    def _make_batches(self, texts: Sequence[str]) -> List[List[int]]:
+        """Length-sorted buckets of indices."""
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        return [order[i:i + self.batch_size] for i in range(0, len(order), self.batch_size)]
+
+    def _iter_in_process(self, texts: Sequence[str], batches: List[List[int]]):
+        if self.remote:
+            if self._model is None:
+                from src.remote_embeddings import load_remote_embeddings
+
+                self._model = load_remote_embeddings()
+            for indices in batches:
+                yield indices, self._model.embed_documents([texts[i] for i in indices])
+            return
+        if self._model is None:
+            logger.info(f"Đang tải mô hình embedding cho ingestion: {self.model_name}...")
+            self._model = _load_model(self.model_name, self.device)
+        for indices in batches:
+            vectors = self._model.encode(
+                [texts[i] for i in indices], batch_size=self.batch_size, show_progress_bar=False
+            )
+            yield indices, vectors.tolist()
+
+    def _create_pool(self) -> ProcessPoolExecutor:
+        logger.info(f"Khởi động {self.num_workers} worker embedding (mỗi worker một bản sao mô hình)...")
+        return ProcessPoolExecutor(
+            max_workers=self.num_workers,
+            initializer=_init_worker,
+            initargs=(self.model_name, self.device),
+        )
+
+    def _iter_pool(self, pool: ProcessPoolExecutor, texts: Sequence[str], batches: List[List[int]]):
+        # Giới hạn số batch đang xử lý để không đẩy toàn bộ dữ liệu vào hàng đợi cùng lúc
+        max_in_flight = self.num_workers * 2
+        pending = set()
+        it = iter(batches)
+        while True:
+            for indices in it:
+                pending.add(pool.submit(_encode_batch, indices, [texts[i] for i in indices], self.batch_size))
+                if len(pending) >= max_in_flight:
+                    break
+            if not pending:
+                break
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+
+    def iter_embeddings(self, texts: Sequence[str], pool: Optional[ProcessPoolExecutor] = None):
+        """Yield (indices, vectors) per batch, in completion order."""
+        batches = self._make_batches(texts)
+        if pool is not None:
+            yield from self._iter_pool(pool, texts, batches)
+        elif self.num_workers > 1 and len(batches) > 1:
+            with self._create_pool() as own_pool:
+                yield from self._iter_pool(own_pool, texts, batches)
+        else:
+            yield from self._iter_in_process(texts, batches)
+
+    def embed_documents(self, texts: Sequence[str]) -> List[List[float]]:
+        vectors: List[Optional[List[float]]] = [None] * len(texts)
+        for indices, batch_vectors in self.iter_embeddings(texts):
+            for i, vec in zip(indices, batch_vectors):
+                vectors[i] = vec
+        return vectors
+
+    def embed_and_write(self, documents: Iterable, id_fn: Callable, collection) -> int:
+        """
+        Embed documents and upsert them into a Chroma collection in bulk batches.
+
+        Pipeline: reader thread (pulls `documents`, groups into windows) -> bounded
+        queue -> embedding (this thread, or the process pool) -> bounded queue ->
+        writer thread (`collection.upsert`). `collection` is the raw chromadb
+        collection (e.g. `vectordb._collection`). Returns the number of vectors written.
+        """
+        window_size = self.batch_size * self.num_workers * 4
+        windows: "queue.Queue" = queue.Queue(maxsize=self.queue_size)
+        writes: "queue.Queue" = queue.Queue(maxsize=self.queue_size)
+        stop = threading.Event()
+        errors: List[BaseException] = []
+        written = 0
+
+        def put(q: "queue.Queue", item) -> bool:
+            while not stop.is_set():
+                try:
+                    q.put(item, timeout=0.5)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def reader():
+            try:
+                window = []
+                for doc in documents:
+                    window.append(doc)
+                    if len(window) >= window_size:
+                        if not put(windows, window):
+                            return
+                        window = []
+                if window:
+                    put(windows, window)
+            except BaseException as e:
+                errors.append(e)
+                stop.set()
+            finally:
+                put(windows, _DONE)
+
+        def writer():
+            nonlocal written
+            try:
+                while True:
+                    item = writes.get()
+                    if item is _DONE:
+                        return
+                    ids, vectors, texts, metadatas = item
+                    collection.upsert(ids=ids, embeddings=vectors, documents=texts, metadatas=metadatas)
+                    written += len(ids)
+            except BaseException as e:
+                errors.append(e)
+                stop.set()
+
+        reader_thread = threading.Thread(target=reader, name="ingest-reader", daemon=True)
+        writer_thread = threading.Thread(target=writer, name="ingest-writer", daemon=True)
+        reader_thread.start()
+        writer_thread.start()
+
+        buffer = ([], [], [], [])  # ids, vectors, texts, metadatas
+
+        def flush():
+            if buffer[0]:
+                put(writes, tuple(list(part) for part in buffer))
+                for part in buffer:
+                    part.clear()
+
+        pool_ctx = self._create_pool() if self.num_workers > 1 else nullcontext()
+        try:
+            with pool_ctx as pool, tqdm(desc="Embedding", unit="doc") as progress:
+                while not stop.is_set():
+                    try:
+                        window = windows.get(timeout=0.5)
+                    except queue.Empty:
+                        continue
+                    if window is _DONE:
+                        break
+                    texts = [doc.page_content for doc in window]
+                    for indices, vectors in self.iter_embeddings(texts, pool=pool):
+                        for i, vec in zip(indices, vectors):
+                            buffer[0].append(id_fn(window[i]))
+                            buffer[1].append(vec)
+                            buffer[2].append(texts[i])
+                            buffer[3].append(window[i].metadata)
+                        progress.update(len(indices))
+                        if len(buffer[0]) >= self.write_batch_size:
+                            flush()
+                flush()
+        except BaseException as e:
+            errors.append(e)
+            stop.set()
+        finally:
+            # Let the writer drain what is already queued (unless it died)
+            while writer_thread.is_alive():
+                try:
+                    writes.put(_DONE, timeout=0.5)
+                    break
+                except queue.Full:
+                    continue
+            writer_thread.join()
+
+        if errors:
+            raise errors[0]
+        return written
@@ -0,0 +1,131 @@
+"""
+ONNX Runtime backend for the sentence-transformers embedding model.
+
+Same model as the default `HuggingFaceEmbeddings` (mean pooling over
+`last_hidden_state`, no normalization), exported once to ONNX and optionally
+quantized to dynamic int8. Used by `src.helper.download_hugging_face_embeddings`
+when EMBEDDING_BACKEND is "onnx" or "onnx-int8".
+"""
+
+from __future__ import annotations
+
+import os
+from typing import List
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from config import settings
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+FP32_FILE = "model.onnx"
+INT8_FILE = "model_int8.onnx"
+
+
+def export_onnx_model(model_name: str, output_dir: str, quantize: bool = True) -> str:
+    """
+    Export `model_name` to ONNX in `output_dir` (plus tokenizer files) and,
+    if `quantize`, write a dynamic int8 copy next to it.
+    Requires `optimum[onnxruntime]` (and torch) only at export time; it is
+    listed in requirements-dev.txt, not in the runtime requirements.
+    """
+    try:
+        from optimum.onnxruntime import ORTModelForFeatureExtraction
+    except ImportError as e:
+        raise ImportError(
+            "Exporting to ONNX needs `optimum[onnxruntime]`: pip install -r requirements-dev.txt "
+            "(only the export needs it, running the ONNX model does not)."
+        ) from e
+    from transformers import AutoTokenizer
+
+    os.makedirs(output_dir, exist_ok=True)
+    fp32_path = os.path.join(output_dir, FP32_FILE)
+    if not os.path.exists(fp32_path):
+        logger.info(f"Exporting {model_name} to ONNX: {output_dir} ...")
+        model = ORTModelForFeatureExtraction.from_pretrained(model_name, export=True)
+        model.save_pretrained(output_dir)
+        AutoTokenizer.from_pretrained(model_name).save_pretrained(output_dir)
+
+    int8_path = os.path.join(output_dir, INT8_FILE)
+    if quantize and not os.path.exists(int8_path):
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        logger.info(f"Quantizing ONNX model to int8: {int8_path} ...")
+        quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+
+    return int8_path if quantize else fp32_path
+
+
+class OnnxEmbeddings(Embeddings):
+    """LangChain `Embeddings` running the exported model on ONNX Runtime (CPU)."""
+
+    def __init__(
+        self,
+        model_dir: str,
+        quantized: bool = False,
+        batch_size: int = 32,
+        max_length: int = 128,
+        num_threads: int = 0,
+    ):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        model_path = os.path.join(model_dir, INT8_FILE if quantized else FP32_FILE)
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(
+                f"ONNX model not found: {model_path}. Run `python -m scripts.check_onnx_embedding --export` first."
+            )
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.batch_size = batch_size
+        self.max_length = max_length
+        logger.info(f"ONNX embedding session ready: {model_path}")
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        encoded = self.tokenizer(
+            texts,
+            padding=True,
+            truncation=True,
+            max_length=self.max_length,
+            return_tensors="np",
+        )
+        feeds = {k: v.astype(np.int64) for k, v in encoded.items() if k in self.input_names}
+        hidden = self.session.run(None, feeds)[0]  # (batch, seq, dim)
+
+        # Mean pooling, as in the sentence-transformers config of the model
+        mask = encoded["attention_mask"][..., None].astype(np.float32)
+        return (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        # Length-sorted batches to reduce padding, results restored to input order
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        vectors: List[List[float]] = [None] * len(texts)
+        for start in range(0, len(order), self.batch_size):
+            idx = order[start:start + self.batch_size]
+            for i, vec in zip(idx, self._encode([texts[i] for i in idx])):
+                vectors[i] = vec.tolist()
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._encode([text])[0].tolist()
+
+
+def load_onnx_embeddings(quantized: bool) -> OnnxEmbeddings:
+    model_dir = settings.EMBEDDING_ONNX_DIR
+    if not os.path.exists(os.path.join(model_dir, INT8_FILE if quantized else FP32_FILE)):
+        logger.warning(f"ONNX model missing in {model_dir}, exporting now (one-time)...")
+        export_onnx_model(settings.EMBEDDING_MODEL_NAME, model_dir, quantize=quantized)
+    return OnnxEmbeddings(
+        model_dir,
+        quantized=quantized,
+        num_threads=settings.EMBEDDING_NUM_THREADS,
+    )
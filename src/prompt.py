@@ -3,8 +3,4 @@ system_prompt = (
     "Nhiệm vụ của bạn là dựa vào thông tin trong phần 'Ngữ cảnh' dưới đây để trả lời 'Câu hỏi' của người dùng một cách chính xác, thân thiện và chi tiết."
     "Nếu thông tin không có trong ngữ cảnh, hãy lịch sự trả lời rằng bạn không có thông tin về vấn đề đó."
     "Tuyệt đối không tự bịa đặt thông tin."
-    "\n\n"
-    "--- Ngữ cảnh ---\n"
-    "{context}"
-    "\n--- Hết Ngữ cảnh ---"
-)
\ No newline at end of file
+)
@@ -0,0 +1,68 @@
+"""
+LangChain `Embeddings` adapter for the shared embedding service.
+
+`RemoteEmbeddings` sends texts to `servers.embedding_service` (POST /embed)
+over the pooled keep-alive HTTP client and reads the vectors back as raw
+float32, so every process using it shares the service's single model copy.
+Used by `src.helper.download_hugging_face_embeddings` when
+EMBEDDING_BACKEND is "remote".
+"""
+
+from __future__ import annotations
+
+from typing import List
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from src.utils.http_client import get_http_client
+from config import settings
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class RemoteEmbeddings(Embeddings):
+    """Embeddings computed by the embedding microservice."""
+
+    def __init__(self, base_url: str, batch_size: int = 64, timeout: float = 60.0):
+        self.base_url = base_url.rstrip("/")
+        self.batch_size = max(1, batch_size)
+        self.timeout = (settings.HTTP_CONNECT_TIMEOUT, timeout)
+
+    def ping(self) -> bool:
+        """True if the service is up and its model is loaded."""
+        try:
+            r = get_http_client().get(f"{self.base_url}/health", timeout=(settings.HTTP_CONNECT_TIMEOUT, 5))
+            return r.status_code == 200
+        except Exception:
+            return False
+
+    def _embed(self, texts: List[str]) -> List[List[float]]:
+        r = get_http_client().post(
+            f"{self.base_url}/embed",
+            json={"texts": texts},
+            headers={"Accept": "application/octet-stream"},
+            timeout=self.timeout,
+        )
+        r.raise_for_status()
+        dim = int(r.headers["X-Embedding-Dim"])
+        return np.frombuffer(r.content, dtype="<f4").reshape(-1, dim).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        vectors: List[List[float]] = []
+        for start in range(0, len(texts), self.batch_size):
+            vectors.extend(self._embed(list(texts[start:start + self.batch_size])))
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed([text])[0]
+
+
+def load_remote_embeddings() -> RemoteEmbeddings:
+    host = "localhost" if settings.EMBEDDING_SERVICE_HOST == "0.0.0.0" else settings.EMBEDDING_SERVICE_HOST
+    return RemoteEmbeddings(
+        settings.EMBEDDING_SERVICE_URL or f"http://{host}:{settings.EMBEDDING_SERVICE_PORT}",
+        batch_size=settings.EMBEDDING_MAX_BATCH,
+        timeout=settings.EMBEDDING_SERVICE_TIMEOUT,
+    )
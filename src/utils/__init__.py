@@ -1,7 +1,13 @@
 """
 Utility functions for BrainV2:
-- audio_handler: load/save temporary audio files
+- audio_handler: temp audio paths, in-memory decoding to 16 kHz float32
+- audio_cache: content-addressed TTS audio cache with LRU eviction
+- http_client: shared keep-alive HTTP clients (TTS, Ollama) with pool metrics
 - logger: shared logger utility
+- sentence_splitter: Vietnamese sentence splitting for pipelined TTS
+- tracing: request IDs across services, per-stage latency spans and Prometheus /metrics
+- vad: energy-based VAD / endpointing for streamed PCM
+- vi_text: diacritic folding and tokenization for Vietnamese
 """
 
 
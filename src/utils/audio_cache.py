@@ -0,0 +1,192 @@
+"""
+Content-addressed cache for TTS audio files.
+
+Files are named after a hash of (normalized text, voice, rate), so the same
+answer spoken with the same voice is synthesized only once. The cache keeps an
+LRU index bounded by total bytes and number of entries; the index is rebuilt
+from the directory on startup (file mtime is used as the last-access time).
+Entries returned by `get` or `commit` are not evicted for `grace_seconds`, so
+a path handed to a client stays downloadable for that long even when the
+cache is over budget.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import re
+import threading
+import time
+import unicodedata
+import uuid
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+_WHITESPACE_RE = re.compile(r"\s+")
+_TMP_SUFFIX = ".tmp"
+_AUDIO_EXT = ".mp3"
+
+
+def normalize_tts_text(text: str) -> str:
+    """Normalize text for cache keys (unicode NFC + collapsed whitespace)."""
+    text = unicodedata.normalize("NFC", text)
+    return _WHITESPACE_RE.sub(" ", text).strip()
+
+
+def make_cache_key(text: str, voice: str, rate: str) -> str:
+    raw = "\x1f".join((normalize_tts_text(text), voice, rate))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
+
+
+class AudioCache:
+    def __init__(self, directory: str, max_bytes: int = 0, max_entries: int = 0, grace_seconds: float = 0.0):
+        """
+        max_bytes / max_entries: budgets for LRU eviction, 0 means unlimited.
+        grace_seconds: how long a returned entry is protected from eviction.
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.grace_seconds = grace_seconds
+
+        self._index: "OrderedDict[str, int]" = OrderedDict()  # key -> size in bytes
+        self._total_bytes = 0
+        self._returned_at: Dict[str, float] = {}  # key -> monotonic time it was last handed out
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(self.directory, exist_ok=True)
+        self.rebuild_index()
+
+    # --- Paths ---
+
+    def file_name(self, key: str) -> str:
+        return f"{key}{_AUDIO_EXT}"
+
+    def path_for(self, key: str) -> str:
+        return os.path.join(self.directory, self.file_name(key))
+
+    def temp_path(self, key: str) -> str:
+        """Unique temp path in the same directory, so commit() can os.replace atomically."""
+        return os.path.join(self.directory, f".{key}.{uuid.uuid4().hex}{_TMP_SUFFIX}")
+
+    # --- Index ---
+
+    def rebuild_index(self) -> None:
+        """Scan the directory and rebuild the LRU index (oldest mtime first)."""
+        entries = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.endswith(_TMP_SUFFIX):
+                # Leftover from an interrupted write
+                self._safe_remove(path)
+                continue
+            if not name.endswith(_AUDIO_EXT) or not os.path.isfile(path):
+                continue
+            st = os.stat(path)
+            entries.append((st.st_mtime, name[: -len(_AUDIO_EXT)], st.st_size))
+
+        entries.sort()
+        with self._lock:
+            self._index = OrderedDict((key, size) for _, key, size in entries)
+            self._total_bytes = sum(size for _, _, size in entries)
+            evicted = self._evict_locked()
+
+        logger.info(
+            f"TTS cache index rebuilt: {len(self._index)} file(s), {self._total_bytes} bytes"
+            + (f", evicted {evicted}" if evicted else "")
+        )
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached file path and mark it as recently used, or None on miss."""
+        path = self.path_for(key)
+        with self._lock:
+            if key not in self._index or not os.path.exists(path):
+                self._drop_locked(key)
+                self.misses += 1
+                return None
+            self._index.move_to_end(key)
+            self._returned_at[key] = time.monotonic()
+            self.hits += 1
+        try:
+            # Persist recency across restarts
+            os.utime(path, None)
+        except OSError:
+            pass
+        return path
+
+    def commit(self, key: str, tmp_path: str) -> str:
+        """Atomically move a fully written temp file into the cache."""
+        path = self.path_for(key)
+        os.replace(tmp_path, path)
+        size = os.path.getsize(path)
+        with self._lock:
+            self._drop_locked(key)
+            self._index[key] = size
+            self._total_bytes += size
+            self._returned_at[key] = time.monotonic()
+            self._evict_locked()
+        return path
+
+    def put_bytes(self, key: str, data: bytes) -> str:
+        tmp_path = self.temp_path(key)
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        return self.commit(key, tmp_path)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._index),
+                "bytes": self._total_bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+    # --- Internals (call with lock held) ---
+
+    def _drop_locked(self, key: str) -> None:
+        self._returned_at.pop(key, None)
+        size = self._index.pop(key, None)
+        if size is not None:
+            self._total_bytes -= size
+
+    def _over_budget_locked(self) -> bool:
+        if self.max_entries and len(self._index) > self.max_entries:
+            return True
+        if self.max_bytes and self._total_bytes > self.max_bytes:
+            return True
+        return False
+
+    def _in_grace_locked(self, key: str, now: float) -> bool:
+        returned_at = self._returned_at.get(key)
+        return returned_at is not None and now - returned_at < self.grace_seconds
+
+    def _evict_locked(self) -> int:
+        evicted = 0
+        now = time.monotonic()
+        # Never evict the most recent entry (it was just written or requested)
+        while len(self._index) > 1 and self._over_budget_locked():
+            key = next(iter(self._index))
+            if self._in_grace_locked(key, now):
+                # Thứ tự LRU: mục cũ nhất còn trong hạn thì mọi mục sau cũng vậy; tạm vượt ngân sách
+                break
+            self._drop_locked(key)
+            self._safe_remove(self.path_for(key))
+            evicted += 1
+        return evicted
+
+    @staticmethod
+    def _safe_remove(path: str) -> None:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
@@ -1,13 +1,23 @@
 """
 Audio helper utilities.
 
-At this stage we keep this minimal: mainly path helpers for temp audio,
-so the STT/TTS services and the web app can share the same conventions.
+Path helpers for temp audio, so the STT/TTS services and the web app can share
+the same conventions, plus in-memory decoding of audio into the float32
+16 kHz arrays Whisper takes directly (no temp files on the hot path).
 """
 
+import io
+import math
 import os
+import wave
+from typing import Optional
+
+import numpy as np
+
 from config import settings
 
+WHISPER_SAMPLE_RATE = 16000
+
 
 def get_temp_audio_dir() -> str:
     os.makedirs(settings.AUDIO_TEMP_DIR, exist_ok=True)
@@ -19,4 +29,125 @@ def get_tts_output_dir() -> str:
     return settings.TTS_OUTPUT_DIR
 
 
+def pcm16_to_float32(data: bytes, sample_rate: int = WHISPER_SAMPLE_RATE) -> np.ndarray:
+    """
+    Convert 16-bit little-endian mono PCM to the float32 [-1, 1] array at
+    16 kHz that Whisper expects. Other rates are resampled with a polyphase
+    filter (`scipy.signal.resample_poly`), whose low-pass removes the content
+    above 8 kHz that would otherwise alias into the speech band when
+    downsampling from 44.1/48 kHz. For a stream sent in chunks use
+    `PcmResampler`, which keeps the filter state between chunks.
+    """
+    audio = np.frombuffer(data[: len(data) - len(data) % 2], dtype="<i2").astype(np.float32) / 32768.0
+    if sample_rate != WHISPER_SAMPLE_RATE and audio.size:
+        from scipy.signal import resample_poly
+
+        g = math.gcd(WHISPER_SAMPLE_RATE, sample_rate)
+        audio = resample_poly(audio, WHISPER_SAMPLE_RATE // g, sample_rate // g).astype(np.float32)
+    return audio
+
+
+class PcmResampler:
+    """
+    `pcm16_to_float32` for a PCM stream sent in small chunks (/ws/transcribe).
+    Resampling each chunk on its own gives the filter zeros on both sides of
+    every chunk boundary (audible clicks) and rounds the output length per
+    chunk (drift). This keeps the filter history and any odd trailing byte
+    across chunks, so the concatenated output equals `pcm16_to_float32` on the
+    whole stream: `feed` returns the samples that are already final, `flush`
+    the rest at the end of an utterance.
+    """
+
+    def __init__(self, sample_rate: int = WHISPER_SAMPLE_RATE):
+        g = math.gcd(WHISPER_SAMPLE_RATE, sample_rate)
+        self.up, self.down = WHISPER_SAMPLE_RATE // g, sample_rate // g
+        self._h: Optional[np.ndarray] = None
+        if (self.up, self.down) != (1, 1):
+            from scipy.signal import firwin
+
+            # Cùng bộ lọc và độ trễ như resample_poly (window Kaiser 5.0)
+            max_rate = max(self.up, self.down)
+            half_len = 10 * max_rate
+            h = firwin(2 * half_len + 1, 1.0 / max_rate, window=("kaiser", 5.0)) * self.up
+            pre_pad = self.down - half_len % self.down
+            self._h = np.concatenate([np.zeros(pre_pad), h]).astype(np.float32)
+            self._skip = (half_len + pre_pad) // self.down
+        self.reset()
+
+    def reset(self) -> None:
+        self._odd = b""
+        self._x = np.zeros(0, dtype=np.float32)  # đầu vào còn cần cho bộ lọc
+        self._x_start = 0  # chỉ số (tuyệt đối) của self._x[0], luôn là bội của down
+        self._received = 0
+        self._next = 0  # chỉ số đầu ra upfirdn tiếp theo
+
+    def feed(self, data: bytes) -> np.ndarray:
+        data = self._odd + data
+        self._odd = data[len(data) - len(data) % 2:]
+        audio = pcm16_to_float32(data[: len(data) - len(self._odd)])
+        if self._h is None:
+            return audio
+        self._x = np.concatenate([self._x, audio])
+        self._received += audio.size
+        if not self._received:
+            return audio
+        # Đầu ra m dùng các mẫu vào j <= m * down / up: chỉ phát những đầu ra đã đủ mẫu
+        return self._emit((self._received - 1) * self.up // self.down)
+
+    def flush(self) -> np.ndarray:
+        """Remaining samples of the stream (the filter's tail); the resampler is reset."""
+        out = np.zeros(0, dtype=np.float32)
+        if self._h is not None and self._received:
+            total = -(-self._received * self.up // self.down)  # ceil, như resample_poly
+            self._x = np.concatenate([self._x, np.zeros(self._h.size // self.up + 1, dtype=np.float32)])
+            out = self._emit(self._skip + total - 1)
+        self.reset()
+        return out
+
+    def _emit(self, last: int) -> np.ndarray:
+        from scipy.signal import upfirdn
+
+        if last < self._next:
+            return np.zeros(0, dtype=np.float32)
+        first = self._next
+        offset = self._x_start * self.up // self.down
+        y = upfirdn(self._h, self._x, self.up, self.down)[first - offset: last - offset + 1]
+        self._next = last + 1
+        # Bỏ các mẫu vào mà các đầu ra sau không còn dùng tới
+        needed = max(0, (self._next * self.down - self._h.size) // self.up + 1)
+        start = max(self._x_start, needed - needed % self.down)
+        self._x = self._x[start - self._x_start:]
+        self._x_start = start
+        # Các đầu ra đầu tiên là độ trễ của bộ lọc (resample_poly cũng bỏ đi)
+        return y[max(0, self._skip - first):].astype(np.float32, copy=False)
+
+
+def _decode_wav(content: bytes) -> np.ndarray:
+    """Fast path for 16-bit PCM WAV using only the stdlib."""
+    with wave.open(io.BytesIO(content)) as wav:
+        if wav.getsampwidth() != 2:
+            raise ValueError(f"unsupported WAV sample width: {wav.getsampwidth()}")
+        channels = wav.getnchannels()
+        sample_rate = wav.getframerate()
+        frames = wav.readframes(wav.getnframes())
+    if channels > 1:
+        samples = np.frombuffer(frames, dtype="<i2").reshape(-1, channels).mean(axis=1)
+        frames = samples.astype("<i2").tobytes()
+    return pcm16_to_float32(frames, sample_rate)
+
+
+def decode_audio_bytes(content: bytes) -> np.ndarray:
+    """
+    Decode an uploaded audio file (wav, webm/opus, mp3, ogg, ...) from memory
+    to a float32 array at 16 kHz. WAV is parsed directly; other containers go
+    through PyAV (bundled with faster-whisper). Raises on undecodable input.
+    """
+    if content[:4] == b"RIFF" and content[8:12] == b"WAVE":
+        try:
+            return _decode_wav(content)
+        except (wave.Error, ValueError, EOFError):
+            pass  # e.g. float WAV: let PyAV handle it
+
+    from faster_whisper.audio import decode_audio
 
+    return decode_audio(io.BytesIO(content), sampling_rate=WHISPER_SAMPLE_RATE)
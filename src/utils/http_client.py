@@ -0,0 +1,312 @@
+"""
+Shared, pooled HTTP clients for calls between BrainV2 services (TTS, Ollama).
+
+One process-wide `requests.Session` keeps per-host keep-alive pools, so
+repeated calls to localhost:8002 / localhost:11434 reuse TCP connections
+instead of opening a new one per request. Proxy variables from the environment
+are ignored once here (`trust_env=False`), and every call gets separate
+connect / read timeouts by default.
+
+Each host is limited to HTTP_POOL_MAXSIZE requests in flight; extra callers
+wait up to HTTP_POOL_TIMEOUT for a connection, and that wait is measured.
+`make_async_session` builds the aiohttp equivalent for the ASGI server with
+the same limits, feeding the same per-host metrics.
+
+Sync requests carry the current X-Request-ID (see `src/utils/tracing.py`) so
+the called service logs under the same request.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from typing import Dict, Optional, Tuple, Union
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from src.utils.tracing import outgoing_headers
+from config import settings
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+Timeout = Union[float, Tuple[float, float], None]
+
+
+def _host_key(url: str) -> str:
+    parts = urlsplit(url)
+    port = parts.port or (443 if parts.scheme == "https" else 80)
+    return f"{parts.hostname}:{port}"
+
+
+class HostStats:
+    """Pool usage and connection-wait counters for one host."""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.requests = 0
+        self.waited = 0  # requests that had to wait for a free connection
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.pool_timeouts = 0
+        self.connections_created = 0
+        self.connections_reused = 0
+        self._lock = threading.Lock()
+
+    def record_wait(self, seconds: float) -> None:
+        with self._lock:
+            if seconds > 0.001:
+                self.waited += 1
+            self.wait_seconds_total += seconds
+            self.wait_seconds_max = max(self.wait_seconds_max, seconds)
+
+    def enter(self) -> None:
+        with self._lock:
+            self.requests += 1
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    def leave(self) -> None:
+        with self._lock:
+            self.in_flight -= 1
+
+    def record_pool_timeout(self) -> None:
+        with self._lock:
+            self.pool_timeouts += 1
+
+    def count_connection(self, reused: bool) -> None:
+        with self._lock:
+            if reused:
+                self.connections_reused += 1
+            else:
+                self.connections_created += 1
+
+    def set_connection_counts(self, created: int, reused: int) -> None:
+        with self._lock:
+            self.connections_created = created
+            self.connections_reused = reused
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "max_size": self.max_size,
+                "in_flight": self.in_flight,
+                "peak_in_flight": self.peak_in_flight,
+                "requests": self.requests,
+                "waited": self.waited,
+                "wait_ms_avg": round(1000 * self.wait_seconds_total / self.requests, 2) if self.requests else 0.0,
+                "wait_ms_max": round(1000 * self.wait_seconds_max, 2),
+                "pool_timeouts": self.pool_timeouts,
+                "connections_created": self.connections_created,
+                "connections_reused": self.connections_reused,
+            }
+
+
+class PooledHTTPClient:
+    """Thread-safe `requests` client with bounded per-host keep-alive pools."""
+
+    def __init__(
+        self,
+        pool_maxsize: int = 10,
+        connect_timeout: float = 3.0,
+        read_timeout: float = 120.0,
+        pool_timeout: float = 10.0,
+    ):
+        self.pool_maxsize = max(1, pool_maxsize)
+        self.default_timeout = (connect_timeout, read_timeout)
+        self.pool_timeout = pool_timeout
+
+        self.session = requests.Session()
+        # Không dùng proxy từ env (tránh lỗi ProxyError khi gọi localhost)
+        self.session.trust_env = False
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.pool_maxsize)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._adapter = adapter
+
+        self._lock = threading.Lock()
+        self._slots: Dict[str, threading.BoundedSemaphore] = {}
+        self._stats: Dict[str, HostStats] = {}
+
+    def _host(self, key: str) -> Tuple[threading.BoundedSemaphore, HostStats]:
+        with self._lock:
+            if key not in self._slots:
+                self._slots[key] = threading.BoundedSemaphore(self.pool_maxsize)
+                self._stats[key] = stats_for(key, self.pool_maxsize)
+            return self._slots[key], self._stats[key]
+
+    def request(self, method: str, url: str, timeout: Timeout = None, **kwargs) -> requests.Response:
+        """
+        Same as `requests.Session.request`. With `stream=True` the connection
+        stays checked out until the response is closed (use it as a context manager).
+        """
+        key = _host_key(url)
+        slot, stats = self._host(key)
+        trace_headers = outgoing_headers()
+        if trace_headers:
+            kwargs["headers"] = {**trace_headers, **(kwargs.get("headers") or {})}
+
+        start = time.perf_counter()
+        if not slot.acquire(timeout=self.pool_timeout):
+            stats.record_pool_timeout()
+            raise requests.exceptions.ConnectTimeout(
+                f"No free connection to {key} after {self.pool_timeout:.1f}s (pool size {self.pool_maxsize})"
+            )
+        stats.record_wait(time.perf_counter() - start)
+        stats.enter()
+
+        released = False
+
+        def release() -> None:
+            nonlocal released
+            if not released:
+                released = True
+                stats.leave()
+                slot.release()
+
+        try:
+            response = self.session.request(method, url, timeout=timeout or self.default_timeout, **kwargs)
+        except BaseException:
+            release()
+            raise
+
+        if not kwargs.get("stream"):
+            release()
+            return response
+
+        close = response.close
+
+        def close_and_release() -> None:
+            try:
+                close()
+            finally:
+                release()
+
+        response.close = close_and_release
+        return response
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def _sync_connection_counts(self) -> None:
+        """Copy urllib3's per-pool connection counters into the host stats."""
+        pools = self._adapter.poolmanager.pools
+        for pool_key in list(pools.keys()):
+            pool = pools.get(pool_key)
+            if pool is None:
+                continue
+            key = f"{pool.host}:{pool.port}"
+            with self._lock:
+                stats = self._stats.get(key)
+            if stats is not None:
+                stats.set_connection_counts(pool.num_connections, max(0, pool.num_requests - pool.num_connections))
+
+    def close(self) -> None:
+        self.session.close()
+
+
+# --- Shared instances & metrics ---
+
+_stats_lock = threading.Lock()
+_host_stats: Dict[str, HostStats] = {}
+_client: Optional[PooledHTTPClient] = None
+_client_lock = threading.Lock()
+
+
+def stats_for(key: str, max_size: int) -> HostStats:
+    with _stats_lock:
+        if key not in _host_stats:
+            _host_stats[key] = HostStats(max_size)
+        return _host_stats[key]
+
+
+def get_http_client() -> PooledHTTPClient:
+    """Process-wide pooled client configured from settings."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = PooledHTTPClient(
+                    pool_maxsize=settings.HTTP_POOL_MAXSIZE,
+                    connect_timeout=settings.HTTP_CONNECT_TIMEOUT,
+                    read_timeout=settings.HTTP_READ_TIMEOUT,
+                    pool_timeout=settings.HTTP_POOL_TIMEOUT,
+                )
+    return _client
+
+
+def http_stats() -> Dict[str, dict]:
+    """Per-host pool usage / connection-wait metrics for all clients in this process."""
+    if _client is not None:
+        _client._sync_connection_counts()
+    with _stats_lock:
+        items = list(_host_stats.items())
+    return {key: stats.snapshot() for key, stats in items}
+
+
+def make_async_session(limit_per_host: Optional[int] = None):
+    """
+    aiohttp session with the same pool limits / timeouts as the sync client;
+    connection waits and reuse are recorded through aiohttp tracing.
+    Must be created inside a running event loop.
+    """
+    import aiohttp
+
+    limit = max(1, limit_per_host or settings.HTTP_POOL_MAXSIZE)
+    trace = aiohttp.TraceConfig()
+
+    async def on_request_start(session, ctx, params):
+        ctx.stats = stats_for(_host_key(str(params.url)), limit)
+        ctx.queued_at = None
+        ctx.checked_out = False
+
+    async def on_request_end(session, ctx, params):
+        if ctx.checked_out:
+            ctx.checked_out = False
+            ctx.stats.leave()
+
+    async def on_queued_start(session, ctx, params):
+        ctx.queued_at = time.perf_counter()
+
+    async def on_queued_end(session, ctx, params):
+        if ctx.queued_at is not None:
+            ctx.stats.record_wait(time.perf_counter() - ctx.queued_at)
+
+    def checked_out(ctx, reused: bool) -> None:
+        ctx.stats.count_connection(reused)
+        if not ctx.checked_out:
+            ctx.checked_out = True
+            ctx.stats.enter()
+
+    async def on_create_end(session, ctx, params):
+        checked_out(ctx, reused=False)
+
+    async def on_reuse(session, ctx, params):
+        checked_out(ctx, reused=True)
+
+    trace.on_request_start.append(on_request_start)
+    trace.on_request_end.append(on_request_end)
+    trace.on_request_exception.append(on_request_end)
+    trace.on_connection_queued_start.append(on_queued_start)
+    trace.on_connection_queued_end.append(on_queued_end)
+    trace.on_connection_create_end.append(on_create_end)
+    trace.on_connection_reuseconn.append(on_reuse)
+
+    return aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(limit_per_host=limit, keepalive_timeout=settings.HTTP_KEEPALIVE),
+        timeout=aiohttp.ClientTimeout(
+            total=None,
+            connect=settings.HTTP_CONNECT_TIMEOUT,
+            sock_read=settings.HTTP_READ_TIMEOUT,
+        ),
+        # Không dùng proxy từ env (tránh lỗi ProxyError khi gọi localhost)
+        trust_env=False,
+        trace_configs=[trace],
+    )
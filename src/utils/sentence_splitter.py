@@ -0,0 +1,94 @@
+"""
+Vietnamese sentence splitting for pipelined TTS.
+
+`SentenceBuffer` splits text incrementally while an answer is still being
+streamed from the LLM, so each finished sentence can be sent to TTS before the
+rest of the answer exists; `split_sentences` runs a complete text through the
+same buffer. Only ".", "!", "?", "…" and line breaks end a sentence: ":" and
+";" usually introduce or continue a list, and cutting there makes TTS pause
+mid-thought.
+"""
+
+from __future__ import annotations
+
+import re
+from typing import List
+
+# Dấu kết thúc câu (kể cả dấu ba chấm unicode) theo sau bởi khoảng trắng, hoặc xuống dòng
+_BOUNDARY_RE = re.compile(r"(?<=[.!?…])[\"'”’)\]]*\s+|\n+")
+
+# Viết tắt thường gặp trong tiếng Việt, không được coi là hết câu
+_ABBREVIATIONS = ("TP.", "Tp.", "TT.", "GS.", "PGS.", "TS.", "ThS.", "BS.", "St.", "v.v.", "Q.", "P.")
+
+DEFAULT_MIN_CHARS = 20
+
+
+def _is_abbreviation(text: str) -> bool:
+    stripped = text.rstrip()
+    return any(stripped.endswith(" " + abbr) or stripped == abbr for abbr in _ABBREVIATIONS)
+
+
+def _split(text: str) -> List[str]:
+    """Split at every boundary, re-joining pieces that end with an abbreviation."""
+    pieces: List[str] = []
+    start = 0
+    for m in _BOUNDARY_RE.finditer(text):
+        piece = text[start:m.end()]
+        if _is_abbreviation(piece) and "\n" not in m.group(0):
+            continue
+        pieces.append(piece)
+        start = m.end()
+    pieces.append(text[start:])
+    return pieces
+
+
+class SentenceBuffer:
+    """
+    Accumulate streamed text and emit sentences as soon as they are complete.
+
+    Usage:
+        buf = SentenceBuffer()
+        for chunk in stream:
+            for sentence in buf.feed(chunk):
+                ...
+        for sentence in buf.flush():
+            ...
+    """
+
+    def __init__(self, min_chars: int = DEFAULT_MIN_CHARS):
+        self.min_chars = min_chars
+        self._buffer = ""
+
+    def feed(self, text: str) -> List[str]:
+        self._buffer += text
+        pieces = _split(self._buffer)
+        # The last piece has no boundary after it yet, keep it buffered
+        complete, self._buffer = pieces[:-1], pieces[-1]
+
+        sentences: List[str] = []
+        carry = ""
+        for piece in complete:
+            if not piece.strip():
+                continue
+            carry = f"{carry} {piece.strip()}".strip() if carry else piece.strip()
+            if len(carry) >= self.min_chars:
+                sentences.append(carry)
+                carry = ""
+        if carry:
+            # Too short to synthesize on its own: push back in front of the buffer
+            self._buffer = f"{carry} {self._buffer}" if self._buffer else f"{carry} "
+        return sentences
+
+    def flush(self) -> List[str]:
+        remaining, self._buffer = self._buffer.strip(), ""
+        if not remaining:
+            return []
+        return [remaining]
+
+
+def split_sentences(text: str, min_chars: int = DEFAULT_MIN_CHARS) -> List[str]:
+    """
+    Split a complete text into sentences suitable for TTS.
+    """
+    buffer = SentenceBuffer(min_chars)
+    return buffer.feed(text) + buffer.flush()
@@ -0,0 +1,228 @@
+"""
+Request tracing and Prometheus metrics shared by every BrainV2 service.
+
+- Request IDs: each HTTP request gets an ID (taken from the incoming
+  X-Request-ID header when it is well-formed, generated otherwise) kept in a
+  context variable. `PooledHTTPClient` copies it onto outgoing calls, and the
+  aiohttp callers pass `outgoing_headers()`, so one question carries the same
+  ID through the web server, STT, TTS and the embedding service. It is echoed
+  back in the response headers.
+- Spans: `with span("retrieve"): ...` times one stage, records it in that
+  stage's latency histogram and attaches it to the current request; when
+  TRACE_LOG_REQUESTS is on, one summary line per request lists its stages.
+- /metrics: `render_metrics()` returns the histograms (and per-stage error
+  counters) in the Prometheus text format, so p95 per stage is
+  `histogram_quantile(0.95, rate(brainv2_stage_duration_seconds_bucket[5m]))`.
+
+Context variables are not copied into thread pools by `run_in_executor` /
+`Executor.submit`; wrap the callable with `bind()` so spans recorded in the
+worker thread still belong to the request.
+"""
+
+from __future__ import annotations
+
+import bisect
+import contextvars
+import functools
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from config import settings
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+REQUEST_ID_HEADER = "X-Request-ID"
+METRICS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# ID nhận từ client chỉ được dùng lại nếu đúng dạng này (tránh chèn ký tự lạ vào log/header)
+_REQUEST_ID_RE = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+
+
+class Histogram:
+    """Cumulative latency histogram with fixed bucket bounds (seconds)."""
+
+    def __init__(self, buckets: Sequence[float]):
+        self.bounds = sorted(set(float(b) for b in buckets))
+        self._counts = [0] * (len(self.bounds) + 1)  # last slot = +Inf
+        self.sum = 0.0
+        self.count = 0
+        self.errors = 0
+
+    def observe(self, seconds: float, error: bool = False) -> None:
+        self._counts[bisect.bisect_left(self.bounds, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+        if error:
+            self.errors += 1
+
+    def cumulative(self) -> List[Tuple[str, int]]:
+        """[(le, cumulative count)], ending with ("+Inf", count)."""
+        result, running = [], 0
+        for bound, n in zip(self.bounds + [None], self._counts):
+            running += n
+            result.append(("+Inf" if bound is None else f"{bound:g}", running))
+        return result
+
+
+class _Trace:
+    __slots__ = ("request_id", "name", "started", "spans")
+
+    def __init__(self, request_id: str, name: str):
+        self.request_id = request_id
+        self.name = name
+        self.started = time.perf_counter()
+        self.spans: List[Tuple[str, float]] = []
+
+
+_lock = threading.Lock()
+_histograms: Dict[str, Histogram] = {}
+_current: contextvars.ContextVar[Optional[_Trace]] = contextvars.ContextVar("brainv2_trace", default=None)
+
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+def current_request_id() -> Optional[str]:
+    trace = _current.get()
+    return trace.request_id if trace is not None else None
+
+
+def outgoing_headers() -> Dict[str, str]:
+    """Headers that propagate the current request ID to another service."""
+    request_id = current_request_id()
+    return {REQUEST_ID_HEADER: request_id} if request_id else {}
+
+
+def start_trace(request_id: Optional[str] = None, name: str = "") -> _Trace:
+    """Make a new trace current in this context (reusing `request_id` if it is well-formed)."""
+    if not request_id or not _REQUEST_ID_RE.match(request_id):
+        request_id = new_request_id()
+    trace = _Trace(request_id, name)
+    _current.set(trace)
+    return trace
+
+
+def finish_trace(trace: _Trace) -> None:
+    """Log the stage breakdown of `trace` (if any stage ran) and detach it from this context."""
+    if _current.get() is trace:
+        _current.set(None)
+    if not settings.TRACE_LOG_REQUESTS or not trace.spans:
+        return
+    total = time.perf_counter() - trace.started
+    stages = ", ".join(f"{stage} {seconds * 1000:.0f}ms" for stage, seconds in trace.spans)
+    logger.info(f"[{trace.request_id}] {trace.name} {total * 1000:.0f}ms: {stages}")
+
+
+@contextmanager
+def trace(request_id: Optional[str] = None, name: str = ""):
+    """`start_trace` / `finish_trace` as a context manager (e.g. one voice turn)."""
+    current = start_trace(request_id, name)
+    try:
+        yield current
+    finally:
+        finish_trace(current)
+
+
+def observe(stage: str, seconds: float, error: bool = False) -> None:
+    """Record one measurement of `stage` (for timings not taken with `span`)."""
+    if not settings.TRACING_ENABLED:
+        return
+    with _lock:
+        histogram = _histograms.get(stage)
+        if histogram is None:
+            histogram = _histograms[stage] = Histogram(settings.TRACE_HISTOGRAM_BUCKETS)
+        histogram.observe(seconds, error)
+    current = _current.get()
+    if current is not None:
+        current.spans.append((stage, seconds))
+
+
+@contextmanager
+def span(stage: str):
+    """
+    Time the block as `stage`. A block that raises is still recorded (and
+    counted as an error); a cancelled one (CancelledError, GeneratorExit) is not.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        observe(stage, time.perf_counter() - started, error=True)
+        raise
+    observe(stage, time.perf_counter() - started)
+
+
+def traced(stage: str, fn: Callable) -> Callable:
+    """`fn` wrapped in `span(stage)`."""
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        with span(stage):
+            return fn(*args, **kwargs)
+
+    return wrapper
+
+
+def bind(fn: Callable, *args, **kwargs) -> Callable[[], object]:
+    """A no-argument callable running `fn(*args, **kwargs)` in a copy of the current context."""
+    return functools.partial(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+def render_metrics() -> str:
+    """All stage histograms in the Prometheus text exposition format."""
+    with _lock:
+        snapshot = [
+            (stage, h.cumulative(), h.sum, h.count, h.errors) for stage, h in sorted(_histograms.items())
+        ]
+    lines = [
+        "# HELP brainv2_stage_duration_seconds Latency of each pipeline stage.",
+        "# TYPE brainv2_stage_duration_seconds histogram",
+    ]
+    for stage, buckets, total, count, _ in snapshot:
+        for le, n in buckets:
+            lines.append(f'brainv2_stage_duration_seconds_bucket{{stage="{stage}",le="{le}"}} {n}')
+        lines.append(f'brainv2_stage_duration_seconds_sum{{stage="{stage}"}} {total:.6f}')
+        lines.append(f'brainv2_stage_duration_seconds_count{{stage="{stage}"}} {count}')
+    lines += [
+        "# HELP brainv2_stage_errors_total Stage executions that raised an error.",
+        "# TYPE brainv2_stage_errors_total counter",
+    ]
+    for stage, _, _, _, errors in snapshot:
+        lines.append(f'brainv2_stage_errors_total{{stage="{stage}"}} {errors}')
+    return "\n".join(lines) + "\n"
+
+
+class TraceMiddleware:
+    """
+    ASGI middleware: one trace per HTTP request (ID from X-Request-ID or new),
+    echoed in the response headers and finished once the body has been sent.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.TRACING_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        incoming = dict(scope.get("headers") or []).get(REQUEST_ID_HEADER.lower().encode())
+        current = start_trace(incoming.decode("latin-1") if incoming else None, f"{scope['method']} {scope['path']}")
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers") or []) + [
+                    (REQUEST_ID_HEADER.lower().encode(), current.request_id.encode())
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            finish_trace(current)
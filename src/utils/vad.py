@@ -0,0 +1,128 @@
+"""
+Energy-based voice activity detection and endpointing for streamed PCM audio.
+
+`Endpointer` consumes 16-bit little-endian mono PCM in arbitrary-sized chunks
+(as they arrive from a WebSocket), tracks an adaptive noise floor, and reports
+when speech starts and when an utterance has ended (enough trailing silence,
+or the maximum utterance length was reached). A short pre-roll is kept so the
+first syllable is not cut off.
+"""
+
+from __future__ import annotations
+
+from collections import deque
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+SPEECH_START = "start"
+SPEECH_END = "end"
+
+_BYTES_PER_SAMPLE = 2
+
+
+def frame_rms(frame: bytes) -> float:
+    samples = np.frombuffer(frame, dtype="<i2").astype(np.float32) / 32768.0
+    return float(np.sqrt(np.mean(samples * samples))) if samples.size else 0.0
+
+
+class Endpointer:
+    def __init__(
+        self,
+        sample_rate: int = 16000,
+        frame_ms: int = 30,
+        threshold: float = 3.0,
+        min_rms: float = 0.01,
+        start_ms: int = 90,
+        silence_ms: int = 700,
+        min_speech_ms: int = 250,
+        max_utterance_s: float = 15.0,
+        preroll_ms: int = 300,
+    ):
+        """
+        threshold: a frame is speech when its RMS exceeds `threshold` x noise floor
+        (and `min_rms`); `start_ms` of consecutive speech frames open an utterance,
+        `silence_ms` of silence close it. Utterances shorter than `min_speech_ms`
+        of speech are dropped as noise.
+        """
+        self.sample_rate = sample_rate
+        self.frame_bytes = int(sample_rate * frame_ms / 1000) * _BYTES_PER_SAMPLE
+        self.threshold = threshold
+        self.min_rms = min_rms
+        self.start_frames = max(1, start_ms // frame_ms)
+        self.silence_frames = max(1, silence_ms // frame_ms)
+        self.min_speech_frames = max(1, min_speech_ms // frame_ms)
+        self.max_frames = max(1, int(max_utterance_s * 1000 / frame_ms))
+
+        self.noise_floor: Optional[float] = None
+        self.in_speech = False
+        self._pending = b""
+        self._preroll: deque = deque(maxlen=max(1, preroll_ms // frame_ms))
+        self._utterance = bytearray()
+        self._utterance_frames = 0
+        self._speech_frames = 0
+        self._run = 0  # consecutive speech frames (before start) / silent frames (during speech)
+
+    def _is_speech(self, rms: float) -> bool:
+        if self.noise_floor is None:
+            self.noise_floor = rms
+        speech = rms > max(self.min_rms, self.noise_floor * self.threshold)
+        if not speech:
+            # Nền nhiễu chỉ cập nhật theo các khung im lặng
+            self.noise_floor = 0.95 * self.noise_floor + 0.05 * rms
+        return speech
+
+    def feed(self, pcm: bytes) -> List[Tuple[str, Optional[bytes]]]:
+        """
+        Add PCM bytes; return events in order: (SPEECH_START, None) and
+        (SPEECH_END, utterance_pcm), where utterance_pcm is None if the
+        utterance was too short to be speech.
+        """
+        events: List[Tuple[str, Optional[bytes]]] = []
+        data = self._pending + pcm
+        usable = len(data) - len(data) % self.frame_bytes
+        self._pending = data[usable:]
+
+        for offset in range(0, usable, self.frame_bytes):
+            frame = data[offset:offset + self.frame_bytes]
+            speech = self._is_speech(frame_rms(frame))
+
+            if not self.in_speech:
+                self._preroll.append(frame)
+                self._run = self._run + 1 if speech else 0
+                if self._run >= self.start_frames:
+                    self.in_speech = True
+                    self._utterance = bytearray(b"".join(self._preroll))
+                    self._utterance_frames = len(self._preroll)
+                    self._speech_frames = self._run
+                    self._preroll.clear()
+                    self._run = 0
+                    events.append((SPEECH_START, None))
+                continue
+
+            self._utterance += frame
+            self._utterance_frames += 1
+            if speech:
+                self._speech_frames += 1
+                self._run = 0
+            else:
+                self._run += 1
+
+            if self._run >= self.silence_frames or self._utterance_frames >= self.max_frames:
+                events.append((SPEECH_END, self.flush()))
+        return events
+
+    def current(self, start: int = 0) -> bytes:
+        """PCM of the utterance in progress from byte `start` on (empty when not in speech)."""
+        return bytes(self._utterance[start:]) if self.in_speech else b""
+
+    def flush(self) -> Optional[bytes]:
+        """Force the end of the current utterance; None if there was no real speech."""
+        utterance = bytes(self._utterance) if self.in_speech else None
+        enough = self._speech_frames >= self.min_speech_frames
+        self.in_speech = False
+        self._utterance = bytearray()
+        self._utterance_frames = 0
+        self._speech_frames = 0
+        self._run = 0
+        return utterance if enough else None
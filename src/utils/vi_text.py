@@ -0,0 +1,31 @@
+"""
+Vietnamese text helpers shared by the caches and the keyword index.
+"""
+
+from __future__ import annotations
+
+import re
+import unicodedata
+from typing import List
+
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def fold_diacritics(text: str) -> str:
+    """Remove Vietnamese diacritics ("Trống đồng" -> "Trong dong")."""
+    text = unicodedata.normalize("NFD", text)
+    text = "".join(ch for ch in text if unicodedata.category(ch) != "Mn")
+    return text.replace("đ", "d").replace("Đ", "D")
+
+
+def tokenize(text: str, bigrams: bool = True) -> List[str]:
+    """
+    Lowercase, diacritic-folded syllable tokens.
+
+    Vietnamese words are mostly multi-syllable ("súng trường"), so adjacent
+    syllable bigrams are added to keep compound names matchable as a unit.
+    """
+    syllables = _TOKEN_RE.findall(fold_diacritics(text.casefold()))
+    if not bigrams:
+        return syllables
+    return syllables + [f"{a}_{b}" for a, b in zip(syllables, syllables[1:])]
@@ -0,0 +1,114 @@
+import time
+
+import numpy as np
+
+from src.core.answer_cache import AnswerCache, normalize_question, write_db_version
+from src.core.query_understanding import QueryHints
+
+VECTORS = {
+    "trống đồng ngọc lũ là gì": [1.0, 0.0, 0.0],
+    "trống đồng ngọc lũ là cái gì": [0.99, 0.1, 0.0],
+    "trống đồng hoàng hạ là gì": [0.99, 0.05, 0.0],
+    "trống đồng là gì": [0.99, 0.0, 0.05],
+    "bảo tàng mở cửa lúc mấy giờ": [0.0, 1.0, 0.0],
+    "bảo tàng mở cửa vào mấy giờ": [0.0, 0.99, 0.1],
+}
+
+
+def embed(question):
+    return VECTORS[question.lower().rstrip("?")]
+
+
+def hints(question):
+    question = question.lower()
+    if "ngọc lũ" in question:
+        return QueryHints(item_ids=["1"])
+    if "hoàng hạ" in question:
+        return QueryHints(item_ids=["2"])
+    return QueryHints()
+
+
+def make_cache(**kwargs):
+    return AnswerCache(embed, similarity_threshold=0.9, hints_fn=hints, **kwargs)
+
+
+def test_normalize_question():
+    assert normalize_question("  Trống ĐỒNG   Ngọc Lũ là gì?? ") == "trong dong ngoc lu la gi"
+
+
+def test_exact_hit_after_normalization():
+    cache = make_cache()
+    cache.store("Bảo tàng mở cửa lúc mấy giờ", "8 giờ")
+    answer, _ = cache.lookup("bảo tàng MỞ CỬA lúc mấy giờ?")
+    assert answer == "8 giờ"
+    assert cache.stats()["exact_hits"] == 1
+
+
+def test_semantic_hit_requires_same_artifact():
+    cache = make_cache()
+    cache.store("Trống đồng Ngọc Lũ là gì", "A")
+    assert cache.lookup("Trống đồng Ngọc Lũ là cái gì")[0] == "A"
+    # Câu gần như giống hệt nhưng nói về hiện vật khác
+    assert cache.lookup("Trống đồng Hoàng Hạ là gì")[0] is None
+    stats = cache.stats()
+    assert stats["semantic_hits"] == 1 and stats["misses"] == 1
+
+
+def test_hintless_questions_use_stricter_threshold():
+    # cosine giữa hai câu hỏi giờ mở cửa ~0.995
+    cache = make_cache(hintless_similarity_threshold=0.99)
+    cache.store("Bảo tàng mở cửa lúc mấy giờ", "8 giờ")
+    assert cache.lookup("Bảo tàng mở cửa vào mấy giờ")[0] == "8 giờ"
+
+    strict = make_cache(hintless_similarity_threshold=0.999)
+    strict.store("Bảo tàng mở cửa lúc mấy giờ", "8 giờ")
+    assert strict.lookup("Bảo tàng mở cửa vào mấy giờ")[0] is None
+
+
+def test_hintless_question_never_matches_artifact_question():
+    cache = make_cache(hintless_similarity_threshold=0.5)
+    cache.store("Trống đồng Ngọc Lũ là gì", "A")
+    # Câu hỏi chung về trống đồng không được nhận câu trả lời về một hiện vật cụ thể
+    assert cache.lookup("Trống đồng là gì")[0] is None
+
+
+def test_semantic_level_without_hints_fn():
+    cache = AnswerCache(embed, similarity_threshold=0.9, hintless_similarity_threshold=0.99)
+    cache.store("Bảo tàng mở cửa lúc mấy giờ", "8 giờ")
+    assert cache.lookup("Bảo tàng mở cửa vào mấy giờ")[0] == "8 giờ"
+
+    disabled = AnswerCache(embed, hintless_similarity_threshold=1.1)
+    disabled.store("Bảo tàng mở cửa lúc mấy giờ", "8 giờ")
+    assert disabled.lookup("Bảo tàng mở cửa vào mấy giờ") == (None, None)
+
+
+def test_semantic_lookup_returns_embedding_for_store():
+    cache = make_cache()
+    answer, embedding = cache.lookup("Trống đồng Ngọc Lũ là gì")
+    assert answer is None
+    assert np.isclose(np.linalg.norm(embedding), 1.0)
+
+
+def test_ttl_expiry():
+    cache = make_cache(ttl_seconds=0.05)
+    cache.store("Bảo tàng mở cửa lúc mấy giờ", "8 giờ")
+    time.sleep(0.1)
+    assert cache.lookup("Bảo tàng mở cửa lúc mấy giờ")[0] is None
+
+
+def test_lru_bound():
+    cache = make_cache(max_entries=1)
+    cache.store("Trống đồng Ngọc Lũ là gì", "A")
+    cache.store("Bảo tàng mở cửa lúc mấy giờ", "8 giờ")
+    assert cache.stats()["entries"] == 1
+    assert cache.lookup("Trống đồng Ngọc Lũ là gì")[0] is None
+
+
+def test_db_version_change_clears_cache(tmp_path):
+    marker = str(tmp_path / "db_version")
+    write_db_version(marker)
+    cache = make_cache(version_file=marker)
+    cache.store("Bảo tàng mở cửa lúc mấy giờ", "8 giờ")
+    write_db_version(marker)
+    assert cache.lookup("Bảo tàng mở cửa lúc mấy giờ")[0] is None
+    assert cache.stats()["invalidations"] == 1
@@ -0,0 +1,67 @@
+import os
+import time
+
+from src.utils.audio_cache import AudioCache, make_cache_key
+
+
+def test_cache_key_ignores_whitespace_and_unicode_form():
+    assert make_cache_key("Xin  chào\n", "vi-VN-HoaiMyNeural", "+0%") == make_cache_key(
+        "Xin chào", "vi-VN-HoaiMyNeural", "+0%"
+    )
+    assert make_cache_key("Xin chào", "a", "+0%") != make_cache_key("Xin chào", "b", "+0%")
+
+
+def test_get_hit_and_miss(tmp_path):
+    cache = AudioCache(str(tmp_path))
+    assert cache.get("missing") is None
+    path = cache.put_bytes("k", b"mp3")
+    assert cache.get("k") == path
+    with open(path, "rb") as f:
+        assert f.read() == b"mp3"
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_lru_evicts_least_recently_used(tmp_path):
+    cache = AudioCache(str(tmp_path), max_entries=2)
+    cache.put_bytes("a", b"1")
+    cache.put_bytes("b", b"2")
+    cache.get("a")  # a trở thành mới dùng nhất
+    cache.put_bytes("c", b"3")
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    assert not os.path.exists(cache.path_for("b"))
+
+
+def test_byte_budget(tmp_path):
+    cache = AudioCache(str(tmp_path), max_bytes=10)
+    cache.put_bytes("a", b"x" * 6)
+    cache.put_bytes("b", b"x" * 6)
+    assert cache.stats()["entries"] == 1
+    assert cache.stats()["bytes"] == 6
+    assert cache.get("b") is not None
+
+
+def test_grace_period_protects_returned_entries(tmp_path):
+    cache = AudioCache(str(tmp_path), max_entries=1, grace_seconds=0.2)
+    cache.put_bytes("a", b"1")
+    cache.put_bytes("b", b"2")
+    # a vừa được trả về: tạm vượt ngân sách thay vì xóa
+    assert os.path.exists(cache.path_for("a"))
+    time.sleep(0.25)
+    cache.put_bytes("c", b"3")
+    assert not os.path.exists(cache.path_for("a"))
+    assert not os.path.exists(cache.path_for("b"))
+    assert os.path.exists(cache.path_for("c"))
+
+
+def test_rebuild_index_from_directory(tmp_path):
+    cache = AudioCache(str(tmp_path))
+    cache.put_bytes("a", b"12")
+    cache.put_bytes("b", b"345")
+    leftover = tmp_path / ".c.deadbeef.tmp"
+    leftover.write_bytes(b"partial")
+
+    reopened = AudioCache(str(tmp_path))
+    assert reopened.stats()["entries"] == 2
+    assert reopened.stats()["bytes"] == 5
+    assert not leftover.exists()
@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+from src.utils.audio_handler import WHISPER_SAMPLE_RATE, PcmResampler, pcm16_to_float32
+
+
+def pcm(seconds, rate, seed=0):
+    samples = np.random.default_rng(seed).normal(0, 3000, int(seconds * rate))
+    return samples.astype("<i2").tobytes()
+
+
+def feed_in_chunks(resampler, data, seed=0):
+    """Feed `data` in random-sized chunks (odd sizes split samples across chunks)."""
+    rng = np.random.default_rng(seed)
+    parts, i = [], 0
+    while i < len(data):
+        n = int(rng.integers(1, 2000))
+        parts.append(resampler.feed(data[i:i + n]))
+        i += n
+    parts.append(resampler.flush())
+    return np.concatenate(parts)
+
+
+def test_pcm16_to_float32_at_16k():
+    audio = pcm16_to_float32(np.array([0, 16384, -32768], dtype="<i2").tobytes() + b"\x01")
+    assert audio.dtype == np.float32
+    assert audio.tolist() == [0.0, 0.5, -1.0]
+
+
+def test_resampler_passthrough_keeps_split_samples():
+    data = pcm(0.5, WHISPER_SAMPLE_RATE)
+    chunked = feed_in_chunks(PcmResampler(WHISPER_SAMPLE_RATE), data)
+    assert np.array_equal(chunked, pcm16_to_float32(data))
+
+
+@pytest.mark.parametrize("rate", [48000, 44100, 22050, 8000])
+def test_chunked_resampling_matches_whole_buffer(rate):
+    pytest.importorskip("scipy")
+    data = pcm(1.37, rate, seed=rate)
+    whole = pcm16_to_float32(data, rate)
+    resampler = PcmResampler(rate)
+    chunked = feed_in_chunks(resampler, data, seed=rate)
+    # Cùng số mẫu (không trôi) và cùng giá trị (không nhiễu ở ranh giới chunk)
+    assert chunked.size == whole.size
+    assert np.allclose(chunked, whole, atol=1e-6)
+    # flush() đặt lại trạng thái: utterance tiếp theo bắt đầu từ đầu
+    assert np.allclose(feed_in_chunks(resampler, data, seed=1), whole, atol=1e-6)
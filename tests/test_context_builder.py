@@ -0,0 +1,41 @@
+from langchain_core.documents import Document
+
+from src.core.context_builder import ContextBuilder, estimate_tokens
+
+
+def doc(item_id, content, chunk=0):
+    metadata = {"item_id": item_id, "ten": f"Hiện vật {item_id}", "thoi_ky": "Đông Sơn"}
+    if chunk:
+        metadata["chunk"] = chunk
+    return Document(page_content=content, metadata=metadata)
+
+
+def test_estimate_tokens():
+    assert estimate_tokens("một hai ba.", tokens_per_word=1.0) == 4
+
+
+def test_groups_chunks_and_strips_template_labels():
+    docs = [
+        doc("1", "Thông tin hiện vật: Hiện vật 1. Đặc điểm chi tiết: Trống đồng lớn. "
+                 "Hiện vật thuộc thời kỳ lịch sử: Đông Sơn."),
+        doc("1", "Trống đồng lớn. Mặt trống có hình ngôi sao.", chunk=1),
+    ]
+    built = ContextBuilder(token_budget=1000).build("trống đồng", docs)
+    assert built.items == 1
+    assert built.text.startswith("[Hiện vật 1] (thời kỳ: Đông Sơn)\n")
+    assert "Thông tin hiện vật" not in built.text and "Đặc điểm chi tiết" not in built.text
+    # Câu lặp lại giữa hai đoạn con chỉ xuất hiện một lần
+    assert built.text.count("Trống đồng lớn.") == 1
+
+
+def test_respects_token_budget_and_prefers_relevant_sentences():
+    docs = [
+        doc("1", "Trống đồng Ngọc Lũ được tìm thấy ở Hà Nam. " + " ".join(f"Câu phụ số {i}." for i in range(30))),
+        doc("2", "Một hiện vật không liên quan gì cả."),
+    ]
+    builder = ContextBuilder(token_budget=30, tokens_per_word=1.0)
+    built = builder.build("Trống đồng Ngọc Lũ tìm thấy ở đâu", docs)
+    assert built.tokens <= 30 + builder.count("[Hiện vật 1] (thời kỳ: Đông Sơn)")
+    assert "Ngọc Lũ" in built.text
+    assert built.sentences_used < built.sentences_total
+    assert builder.stats()["requests"] == 1
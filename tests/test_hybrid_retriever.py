@@ -0,0 +1,86 @@
+from langchain_core.documents import Document
+
+from src.core.hybrid_retriever import BM25Index, HybridRetriever, document_id, matches_where
+
+DOCS = {
+    "1": ("Súng trường SKS dùng trong kháng chiến chống Mỹ.", {"item_id": "1", "thoi_ky": "Chống Mỹ"}),
+    "2": ("Trống đồng Ngọc Lũ thuộc văn hóa Đông Sơn.", {"item_id": "2", "thoi_ky": "Đông Sơn"}),
+    "3": ("Trống đồng Hoàng Hạ cũng thuộc văn hóa Đông Sơn.", {"item_id": "3", "thoi_ky": "Đông Sơn"}),
+}
+
+
+def make_index():
+    index = BM25Index()
+    for doc_id, (content, metadata) in DOCS.items():
+        index.upsert(doc_id, content, metadata)
+    return index
+
+
+class FakeVectorStore:
+    def __init__(self, ranking):
+        self.ranking = ranking
+        self.calls = []
+
+    def similarity_search(self, query, k, filter=None):
+        self.calls.append(filter)
+        docs = [Document(page_content=DOCS[i][0], metadata=DOCS[i][1]) for i in self.ranking]
+        return [d for d in docs if matches_where(d.metadata, filter)][:k]
+
+
+def test_document_id():
+    assert document_id({"item_id": "7"}) == "7"
+    assert document_id({"item_id": "7", "chunk": 0}) == "7"
+    assert document_id({"item_id": "7", "chunk": 2}) == "7#2"
+
+
+def test_matches_where():
+    meta = {"thoi_ky": "Đông Sơn"}
+    assert matches_where(meta, None)
+    assert matches_where(meta, {"thoi_ky": "Đông Sơn"})
+    assert matches_where(meta, {"thoi_ky": {"$in": ["Lý", "Đông Sơn"]}})
+    assert not matches_where(meta, {"thoi_ky": {"$eq": "Lý"}})
+
+
+def test_bm25_ranks_keyword_match_first():
+    hits = make_index().search("súng SKS", k=3)
+    assert hits[0][0] == "1"
+    # Không dấu vẫn khớp (tách âm tiết đã bỏ dấu)
+    assert make_index().search("trong dong ngoc lu", k=1)[0][0] == "2"
+
+
+def test_bm25_where_filter_and_delete():
+    index = make_index()
+    assert {doc_id for doc_id, _ in index.search("trống đồng", k=5, where={"item_id": "3"})} == {"3"}
+    index.delete(["2"])
+    assert "2" not in {doc_id for doc_id, _ in index.search("trống đồng", k=5)}
+    assert len(index) == 2
+
+
+def test_bm25_save_and_load(tmp_path):
+    path = str(tmp_path / "bm25.json")
+    index = make_index()
+    index.save(path)
+    loaded = BM25Index.load(path)
+    assert loaded.search("Hoàng Hạ", k=2) == index.search("Hoàng Hạ", k=2)
+    assert BM25Index.load_or_empty(str(tmp_path / "missing.json")).search("x", k=1) == []
+
+
+def test_rrf_fuses_both_rankings(tmp_path):
+    path = str(tmp_path / "bm25.json")
+    make_index().save(path)
+    # Vector search chỉ tìm thấy "3"; BM25 xếp "2" (đúng tên) trước: "3" có mặt ở cả hai nên đứng đầu
+    store = FakeVectorStore(["3"])
+    retriever = HybridRetriever(vectorstore=store, index_path=path, k=2, fetch_k=3, rrf_k=60)
+    docs = retriever.search("Trống đồng Ngọc Lũ")
+    assert [d.metadata["item_id"] for d in docs] == ["3", "2"]
+
+
+def test_rrf_passes_where_to_both_sides(tmp_path):
+    path = str(tmp_path / "bm25.json")
+    make_index().save(path)
+    store = FakeVectorStore(["1", "2", "3"])
+    retriever = HybridRetriever(vectorstore=store, index_path=path, k=5)
+    where = {"thoi_ky": "Đông Sơn"}
+    docs = retriever.search("trống đồng", where=where)
+    assert store.calls == [where]
+    assert {d.metadata["item_id"] for d in docs} == {"2", "3"}
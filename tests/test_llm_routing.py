@@ -0,0 +1,74 @@
+import time
+
+from src.core.llm_routing import BLOCKING, STREAM, BackendHealth
+
+
+def test_circuit_opens_after_consecutive_failures():
+    health = BackendHealth("ollama", failure_threshold=2, cooldown_seconds=60)
+    health.record_failure()
+    assert health.available()
+    health.record_failure()
+    assert not health.available()
+    assert health.snapshot()["state"] == "open"
+
+
+def test_success_resets_failure_count():
+    health = BackendHealth("ollama", failure_threshold=2)
+    health.record_failure()
+    health.record_success(0.1)
+    health.record_failure()
+    assert health.available()
+
+
+def test_half_open_then_closed_or_reopened():
+    health = BackendHealth("gemini", failure_threshold=1, cooldown_seconds=0.05)
+    health.record_failure()
+    assert not health.available()
+    time.sleep(0.06)
+    assert health.available()
+    assert health.snapshot()["state"] == "half_open"
+    assert health.try_begin()
+    # Một lỗi nữa khi nửa mở: mở lại ngay
+    health.record_failure()
+    assert not health.available()
+    time.sleep(0.06)
+    assert health.try_begin()
+    health.record_success(0.2)
+    assert health.snapshot()["state"] == "closed"
+
+
+def test_half_open_lets_one_probe_through():
+    health = BackendHealth("ollama", failure_threshold=1, cooldown_seconds=0.05)
+    health.record_failure()
+    time.sleep(0.06)
+    assert health.try_begin()
+    # Các lời gọi khác thấy backend không khả dụng cho tới khi probe có kết quả
+    assert not health.available()
+    assert not health.try_begin()
+    health.record_success(0.1)
+    assert health.available()
+    assert health.try_begin() and health.try_begin()
+
+
+def test_latency_windows_are_kept_per_call_type():
+    health = BackendHealth("ollama", window=3)
+    for latency in (0.1, 0.2, 0.3):
+        health.record_success(latency, STREAM)
+    health.record_success(5.0, BLOCKING)
+    assert health.percentile(50, STREAM) == 0.2
+    assert health.percentile(50, BLOCKING) == 5.0
+    assert health.sample_count(STREAM) == 3 and health.sample_count(BLOCKING) == 1
+    # Cửa sổ trượt: giá trị cũ nhất bị đẩy ra
+    health.record_success(0.4, STREAM)
+    assert health.percentile(50, STREAM) == 0.3
+
+
+def test_snapshot_error_rate():
+    health = BackendHealth("ollama", failure_threshold=10)
+    health.record_success(0.1)
+    health.record_failure()
+    snapshot = health.snapshot()
+    assert snapshot["calls"] == 2
+    assert snapshot["error_rate"] == 0.5
+    assert snapshot["latency"][STREAM]["p50_ms"] == 100.0
+    assert snapshot["latency"][BLOCKING]["p50_ms"] is None
@@ -0,0 +1,52 @@
+from src.utils.sentence_splitter import SentenceBuffer, split_sentences
+
+
+def feed_all(chunks, min_chars=20):
+    buffer = SentenceBuffer(min_chars=min_chars)
+    sentences = []
+    for chunk in chunks:
+        sentences += buffer.feed(chunk)
+    return sentences + buffer.flush()
+
+
+def test_emits_sentences_as_soon_as_complete():
+    buffer = SentenceBuffer(min_chars=5)
+    assert buffer.feed("Trống đồng Ngọc Lũ rất") == []
+    assert buffer.feed(" nổi tiếng. Nó có") == ["Trống đồng Ngọc Lũ rất nổi tiếng."]
+    assert buffer.flush() == ["Nó có"]
+
+
+def test_chunking_does_not_change_result():
+    text = "Đây là câu thứ nhất khá dài. Câu thứ hai cũng khá dài! Câu cuối cùng thì sao?"
+    expected = feed_all([text])
+    tokens = [text[i:i + 3] for i in range(0, len(text), 3)]
+    assert feed_all(tokens) == expected
+    assert expected == ["Đây là câu thứ nhất khá dài.", "Câu thứ hai cũng khá dài!", "Câu cuối cùng thì sao?"]
+
+
+def test_short_sentences_are_merged_forward():
+    assert feed_all(["Vâng. Trống đồng là hiện vật quý."]) == ["Vâng. Trống đồng là hiện vật quý."]
+
+
+def test_abbreviations_do_not_end_a_sentence():
+    assert feed_all(["Theo GS. Hà Văn Tấn, trống rất cổ. Xong rồi nhé bạn."]) == [
+        "Theo GS. Hà Văn Tấn, trống rất cổ.",
+        "Xong rồi nhé bạn.",
+    ]
+
+
+def test_colon_and_semicolon_are_not_boundaries():
+    text = "Hiện vật gồm: trống đồng; thạp đồng; rìu đá."
+    assert split_sentences(text, min_chars=1) == [text]
+
+
+def test_newline_is_a_boundary():
+    assert split_sentences("Dòng thứ nhất không có dấu\nDòng thứ hai", min_chars=1) == [
+        "Dòng thứ nhất không có dấu",
+        "Dòng thứ hai",
+    ]
+
+
+def test_split_sentences_matches_buffer():
+    text = "Vâng. Trống đồng Đông Sơn có niên đại khoảng 2500 năm. Ok."
+    assert split_sentences(text) == feed_all([text])
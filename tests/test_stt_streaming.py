@@ -0,0 +1,80 @@
+import asyncio
+
+import numpy as np
+
+from servers.stt_streaming import StreamingTranscriber
+from src.utils.audio_handler import WHISPER_SAMPLE_RATE
+
+WORDS = "mot hai ba bon nam sau bay tam chin muoi".split()
+SEGMENT_S = 0.5
+
+
+class FakeDecoder:
+    """One word per 0.5 s of audio, one segment per word; `unstable_last` changes the last word every call."""
+
+    def __init__(self, unstable_last=False):
+        self.sizes = []
+        self.calls = 0
+        self.unstable_last = unstable_last
+        self.offset = 0  # words already committed (audio dropped)
+
+    async def __call__(self, audio):
+        self.sizes.append(audio.size)
+        self.calls += 1
+        n = int(audio.size / (SEGMENT_S * WHISPER_SAMPLE_RATE))
+        words = [WORDS[(self.offset + i) % len(WORDS)] for i in range(n)]
+        if self.unstable_last and words:
+            words[-1] = f"x{self.calls}"
+        return [(i * SEGMENT_S, (i + 1) * SEGMENT_S, w) for i, w in enumerate(words)]
+
+
+def seconds(s):
+    return np.zeros(int(s * WHISPER_SAMPLE_RATE), dtype=np.float32)
+
+
+def test_waits_for_a_full_step():
+    decoder = FakeDecoder()
+    transcriber = StreamingTranscriber(decoder, window_s=10, step_ms=500)
+    assert asyncio.run(transcriber.add(seconds(0.2))) is None
+    assert decoder.calls == 0
+
+
+def test_local_agreement_marks_only_repeated_words_stable():
+    decoder = FakeDecoder(unstable_last=True)
+    transcriber = StreamingTranscriber(decoder, window_s=10, step_ms=500)
+
+    async def run():
+        first = await transcriber.add(seconds(1.0))
+        second = await transcriber.add(seconds(0.5))
+        return first, second
+
+    first, second = asyncio.run(run())
+    # Lần đầu chưa có gì để so: tất cả là unstable
+    assert first == {"stable": "", "unstable": "mot x1"}
+    # Từ đầu trùng với lần trước thì ổn định, từ cuối thay đổi thì chưa
+    assert second == {"stable": "mot", "unstable": "hai x2"}
+
+
+def test_commits_and_bounds_decode_window():
+    decoder = FakeDecoder()
+    transcriber = StreamingTranscriber(decoder, window_s=2, step_ms=500)
+
+    async def run():
+        for _ in range(12):
+            await transcriber.add(seconds(0.5))
+        return await transcriber.finish()
+
+    text = asyncio.run(run())
+    assert transcriber.committed_text == ""  # finish() resets
+    # Cửa sổ giải mã không tăng mãi theo độ dài câu nói
+    assert max(decoder.sizes) <= 3.5 * WHISPER_SAMPLE_RATE
+    assert len(text.split()) >= 6
+
+
+def test_finish_appends_tail():
+    decoder = FakeDecoder()
+    transcriber = StreamingTranscriber(decoder, window_s=10, step_ms=2000)
+    half = np.zeros(int(SEGMENT_S * WHISPER_SAMPLE_RATE), dtype=np.float32)
+    asyncio.run(transcriber.add(half))
+    assert asyncio.run(transcriber.finish(half)) == "mot hai"
+    assert decoder.sizes == [2 * half.size]
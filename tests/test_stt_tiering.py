@@ -0,0 +1,66 @@
+from types import SimpleNamespace
+
+import numpy as np
+
+from servers.stt_tiering import TieredWhisper, speech_ratio
+from src.utils.audio_handler import WHISPER_SAMPLE_RATE
+
+
+class FakeModel:
+    def __init__(self, name, avg_logprob=-0.2):
+        self.name = name
+        self.avg_logprob = avg_logprob
+        self.calls = 0
+
+    def transcribe(self, audio, **kwargs):
+        self.calls += 1
+        segment = SimpleNamespace(text=f" {self.name}", tokens=[1, 2, 3], avg_logprob=self.avg_logprob)
+        return iter([segment]), SimpleNamespace(language="vi")
+
+
+def clip(seconds, speech_fraction):
+    """Low noise floor with a loud tone over the first `speech_fraction` of the clip."""
+    n = int(seconds * WHISPER_SAMPLE_RATE)
+    audio = np.random.default_rng(0).normal(0, 0.001, n).astype(np.float32)
+    loud = int(n * speech_fraction)
+    audio[:loud] += 0.3 * np.sin(np.arange(loud) * 2 * np.pi * 220 / WHISPER_SAMPLE_RATE).astype(np.float32)
+    return audio
+
+
+def text_of(result):
+    segments, _ = result
+    return "".join(s.text for s in segments).strip()
+
+
+def make_tiered(fast_logprob=-0.2):
+    return TieredWhisper(FakeModel("fast", fast_logprob), FakeModel("accurate"),
+                         fast_max_seconds=5.0, fast_min_speech_ratio=0.6, escalate_logprob=-0.7)
+
+
+def test_speech_ratio():
+    assert speech_ratio(clip(10, 0.8)) > 0.7
+    assert speech_ratio(clip(10, 0.1)) < 0.2
+    assert speech_ratio(np.zeros(10, dtype=np.float32)) == 0.0
+
+
+def test_routing_by_length_and_speech_ratio():
+    tiered = make_tiered()
+    assert tiered.use_fast(clip(3, 0.1))       # ngắn
+    assert tiered.use_fast(clip(10, 0.8))      # dài nhưng phần lớn là tiếng nói
+    assert not tiered.use_fast(clip(10, 0.1))  # dài, phần lớn im lặng / nhiễu
+    assert not tiered.use_fast("/tmp/upload.wav")
+
+    assert text_of(tiered.transcribe(clip(10, 0.8))) == "fast"
+    assert text_of(tiered.transcribe(clip(10, 0.1))) == "accurate"
+    assert tiered.stats() == {"fast": 1, "accurate": 1, "escalated": 0}
+
+
+def test_low_logprob_escalates_to_accurate_model():
+    tiered = make_tiered(fast_logprob=-1.5)
+    assert text_of(tiered.transcribe(clip(10, 0.8))) == "accurate"
+    assert tiered.stats() == {"fast": 1, "accurate": 0, "escalated": 1}
+
+
+def test_streaming_uses_accurate_model():
+    tiered = make_tiered()
+    assert tiered.streaming_model is tiered.accurate
@@ -0,0 +1,84 @@
+import asyncio
+
+import pytest
+
+from config import settings
+from src.utils import tracing
+
+
+@pytest.fixture(autouse=True)
+def enabled(monkeypatch):
+    monkeypatch.setattr(settings, "TRACING_ENABLED", True)
+    monkeypatch.setattr(settings, "TRACE_LOG_REQUESTS", False)
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = tracing.Histogram([0.1, 0.5, 1])
+    for seconds in (0.05, 0.1, 0.3, 2.0):
+        histogram.observe(seconds)
+    histogram.observe(0.7, error=True)
+    assert histogram.cumulative() == [("0.1", 2), ("0.5", 3), ("1", 4), ("+Inf", 5)]
+    assert histogram.count == 5 and histogram.errors == 1
+    assert histogram.sum == pytest.approx(3.15)
+
+
+def test_span_records_stage_in_trace_and_metrics():
+    with tracing.trace(name="test") as current:
+        with tracing.span("test_stage_ok"):
+            pass
+        with pytest.raises(ValueError):
+            with tracing.span("test_stage_err"):
+                raise ValueError("boom")
+    assert [stage for stage, _ in current.spans] == ["test_stage_ok", "test_stage_err"]
+
+    metrics = tracing.render_metrics()
+    assert 'brainv2_stage_duration_seconds_count{stage="test_stage_ok"} 1' in metrics
+    assert 'brainv2_stage_errors_total{stage="test_stage_err"} 1' in metrics
+    assert 'brainv2_stage_duration_seconds_bucket{stage="test_stage_ok",le="+Inf"} 1' in metrics
+
+
+def test_request_id_reuse_and_propagation():
+    with tracing.trace("abc-123"):
+        assert tracing.outgoing_headers() == {tracing.REQUEST_ID_HEADER: "abc-123"}
+    # ID không đúng dạng thì sinh ID mới
+    with tracing.trace("bad id\r\n") as current:
+        assert current.request_id != "bad id\r\n"
+    assert tracing.current_request_id() is None
+
+
+def test_bind_carries_trace_into_threads():
+    async def run():
+        with tracing.trace("thread-test") as current:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, tracing.bind(tracing.observe, "test_stage_thread", 0.01))
+        return current
+
+    current = asyncio.run(run())
+    assert ("test_stage_thread", 0.01) in current.spans
+
+
+def test_traced_vectorstore_splits_embed_and_search():
+    from langchain_core.documents import Document
+
+    from src.core.traced_vectorstore import TracedVectorStore
+
+    class FakeEmbeddings:
+        def embed_query(self, text):
+            return [float(len(text))]
+
+    class FakeStore:
+        embeddings = FakeEmbeddings()
+
+        def similarity_search_by_vector(self, embedding, k=4, filter=None):
+            return [Document(page_content=f"{embedding[0]:g}", metadata={"filter": filter})][:k]
+
+        def get(self, **kwargs):
+            return {"ids": ["1"]}
+
+    store = TracedVectorStore(FakeStore())
+    with tracing.trace(name="test") as current:
+        docs = store.similarity_search("abc", k=2, filter={"thoi_ky": "Lý"})
+    assert docs[0].page_content == "3" and docs[0].metadata["filter"] == {"thoi_ky": "Lý"}
+    assert [stage for stage, _ in current.spans] == ["embed", "vector_search"]
+    assert store.get()["ids"] == ["1"]
+    assert store.as_retriever(search_kwargs={"k": 1}).invoke("abcd")[0].page_content == "4"
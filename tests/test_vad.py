@@ -0,0 +1,60 @@
+import numpy as np
+
+from src.utils.vad import SPEECH_END, SPEECH_START, Endpointer
+
+FRAME = 480  # 30 ms ở 16 kHz
+
+
+def pcm(frames, amplitude, seed=0):
+    samples = np.random.default_rng(seed).normal(0, amplitude, frames * FRAME)
+    return (np.clip(samples, -1, 1) * 32767).astype("<i2").tobytes()
+
+
+def test_detects_utterance_with_preroll():
+    endpointer = Endpointer(silence_ms=300)
+    events = endpointer.feed(pcm(10, 0.001))
+    assert events == []
+    events = endpointer.feed(pcm(30, 0.3, seed=1))
+    assert [e for e, _ in events] == [SPEECH_START]
+    assert endpointer.in_speech and endpointer.current()
+    events = endpointer.feed(pcm(20, 0.001, seed=2))
+    assert [e for e, _ in events] == [SPEECH_END]
+    utterance = events[0][1]
+    # Có pre-roll trước lúc bắt đầu nói và khoảng lặng kết thúc sau đó
+    assert len(utterance) > 30 * FRAME * 2
+    assert not endpointer.in_speech
+
+
+def test_arbitrary_chunk_sizes():
+    audio = pcm(10, 0.001) + pcm(30, 0.3, seed=1) + pcm(20, 0.001, seed=2)
+    whole = Endpointer(silence_ms=300).feed(audio)
+    endpointer = Endpointer(silence_ms=300)
+    chunked = []
+    for start in range(0, len(audio), 777):
+        chunked += endpointer.feed(audio[start:start + 777])
+    assert chunked == whole
+
+
+def test_short_noise_is_dropped():
+    endpointer = Endpointer(silence_ms=300, min_speech_ms=250)
+    endpointer.feed(pcm(10, 0.001))
+    events = endpointer.feed(pcm(4, 0.3, seed=1) + pcm(20, 0.001, seed=2))
+    assert [e for e, _ in events] == [SPEECH_START, SPEECH_END]
+    assert events[1][1] is None
+
+
+def test_max_utterance_length():
+    endpointer = Endpointer(max_utterance_s=0.6)
+    endpointer.feed(pcm(10, 0.001))
+    events = endpointer.feed(pcm(40, 0.3, seed=1))
+    assert SPEECH_END in [e for e, _ in events]
+
+
+def test_current_from_offset_and_flush():
+    endpointer = Endpointer()
+    endpointer.feed(pcm(10, 0.001))
+    endpointer.feed(pcm(20, 0.3, seed=1))
+    current = endpointer.current()
+    assert endpointer.current(100) == current[100:]
+    assert endpointer.flush() == current
+    assert endpointer.current() == b""
@@ -7,17 +7,28 @@ Responsibilities:
   - Receive text (from STT or keyboard).
   - Query RAG engine.
   - Call TTS service to generate voice.
+- Trace each request (X-Request-ID, per-stage spans) and export /metrics.
 
 This is designed to be lightweight and realtime-friendly.
 """
 
 from __future__ import annotations
 
+import itertools
+import json
 import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
 import requests
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, g, render_template, request, jsonify, stream_with_context
 
+from src.core.llm_manager import llm_manager
 from src.core.rag_engine import rag_engine
+from src.utils.http_client import get_http_client, http_stats
+from src.utils.sentence_splitter import SentenceBuffer
+from src.utils import tracing
 from config import settings
 from utils.logger import get_logger
 
@@ -33,6 +44,25 @@ app = Flask(
 os.environ.setdefault("NO_PROXY", "localhost,127.0.0.1,0.0.0.0")
 os.environ.setdefault("no_proxy", "localhost,127.0.0.1,0.0.0.0")
 
+# Pool dùng chung cho pipelined TTS (giới hạn số câu được tổng hợp song song)
+_tts_executor = ThreadPoolExecutor(max_workers=max(1, settings.TTS_MAX_PARALLEL), thread_name_prefix="tts")
+
+
+@app.before_request
+def _start_trace():
+    if settings.TRACING_ENABLED:
+        g.trace = tracing.start_trace(request.headers.get(tracing.REQUEST_ID_HEADER), f"{request.method} {request.path}")
+
+
+@app.after_request
+def _attach_request_id(response):
+    current = g.pop("trace", None)
+    if current is not None:
+        response.headers[tracing.REQUEST_ID_HEADER] = current.request_id
+        # Response dạng stream chạy tiếp sau hàm này: kết thúc trace khi đã gửi xong
+        response.call_on_close(lambda: tracing.finish_trace(current))
+    return response
+
 
 @app.route("/")
 def index():
@@ -45,6 +75,13 @@ def test():
     return jsonify({"status": "ok", "message": "Server is running"})
 
 
+@app.route("/health")
+def health():
+    """Readiness probe: 200 once the RAG engine has warmed up, 503 before (or if warm-up failed)."""
+    payload = rag_engine.health()
+    return jsonify(payload), 200 if payload["status"] == "ready" else 503
+
+
 @app.route("/api/test-rag")
 def test_rag():
     """Test endpoint to verify RAG engine is working."""
@@ -66,12 +103,36 @@ def test_rag():
         }), 500
 
 
+@app.route("/api/llm/stats")
+def llm_stats():
+    """Per-backend rolling latency, error rate and circuit state."""
+    return jsonify(llm_manager.stats())
+
+
+@app.route("/api/cache/stats")
+def cache_stats():
+    """Answer cache hit/miss counters."""
+    return jsonify(rag_engine.cache_stats())
+
+
+@app.route("/api/http/stats")
+def http_pool_stats():
+    """Per-host HTTP pool usage and connection-wait metrics."""
+    return jsonify(http_stats())
+
+
+@app.route("/metrics")
+def metrics():
+    """Per-stage latency histograms in the Prometheus text format."""
+    return Response(tracing.render_metrics(), content_type=tracing.METRICS_CONTENT_TYPE)
+
+
 @app.route("/ws")
 def websocket_placeholder():
     """WebSocket endpoint placeholder."""
     return jsonify({
         "status": "not_implemented",
-        "message": "WebSocket endpoint not implemented"
+        "message": "WebSocket voice loop is served by the ASGI server (WEB_SERVER=asgi)"
     }), 501
 
 
@@ -82,32 +143,20 @@ def serve_static(filename):
     return send_from_directory(app.static_folder, filename)
 
 
-@app.post("/api/chat")
-def api_chat():
+def _request_tts(answer: str) -> Optional[str]:
     """
-    Main API:
-    - input: { "text": "..." }
-    - output: { "answer": "...", "audio_path": "audio_cache/xxx.mp3" }
+    Call TTS service for the given answer.
+    Returns the web-relative audio path, or None if TTS failed.
     """
-    data = request.get_json(force=True)
-    user_text = (data or {}).get("text", "").strip()
-    if not user_text:
-        return jsonify({"error": "text is required"}), 400
-
-    logger.info(f"Web chat request: {user_text}")
-    answer = rag_engine.get_answer(user_text)
-
-    # Call TTS service
     # Sử dụng localhost thay vì 0.0.0.0 để tránh lỗi proxy
     audio_path = None
     try:
         tts_host = "localhost" if settings.TTS_HOST == "0.0.0.0" else settings.TTS_HOST
         tts_url = f"http://{tts_host}:{settings.TTS_PORT}/speak"
-        # Tắt proxy cho request này
-        session = requests.Session()
-        session.trust_env = False  # Không dùng proxy từ env
-        r = session.get(tts_url, params={"text": answer}, timeout=60)
-        r.raise_for_status()
+        # Client dùng chung: giữ kết nối keep-alive, đã tắt proxy từ env
+        with tracing.span("tts_request"):
+            r = get_http_client().get(tts_url, params={"text": answer}, timeout=(settings.HTTP_CONNECT_TIMEOUT, 60))
+            r.raise_for_status()
         audio_path = r.json().get("audio_path")
         logger.info(f"TTS audio generated: {audio_path}")
     except requests.exceptions.HTTPError as e:
@@ -122,6 +171,29 @@ def api_chat():
         # Other unexpected errors
         logger.error(f"TTS service call failed: {e}", exc_info=True)
         audio_path = None
+    return audio_path
+
+
+def _sse(event: str, payload: dict) -> str:
+    """Format one Server-Sent Event."""
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+@app.post("/api/chat")
+def api_chat():
+    """
+    Main API:
+    - input: { "text": "...", "session_id": "..." (optional, reuses /api/prefetch results) }
+    - output: { "answer": "...", "audio_path": "audio_cache/xxx.mp3" }
+    """
+    data = request.get_json(force=True)
+    user_text = (data or {}).get("text", "").strip()
+    if not user_text:
+        return jsonify({"error": "text is required"}), 400
+
+    logger.info(f"Web chat request: {user_text}")
+    answer = rag_engine.get_answer(user_text, session_id=(data or {}).get("session_id"))
+    audio_path = _request_tts(answer)
 
     # Always return answer, even if TTS failed
     return jsonify({
@@ -131,7 +203,87 @@ def api_chat():
     })
 
 
+@app.post("/api/prefetch")
+def api_prefetch():
+    """
+    Speculative retrieval while the visitor is still speaking:
+    - input: { "session_id": "...", "text": "<interim transcript>" }
+    - output: { "prefetched": bool }
+    The next /api/chat(/stream) call with the same session_id reuses the documents
+    if the final question is close enough.
+    """
+    data = request.get_json(force=True) or {}
+    session_id = (data.get("session_id") or "").strip()
+    text = (data.get("text") or "").strip()
+    if not session_id or not text:
+        return jsonify({"error": "session_id and text are required"}), 400
+    return jsonify({"prefetched": rag_engine.prefetch(session_id, text)})
+
+
+@app.post("/api/chat/stream")
+def api_chat_stream():
+    """
+    Streaming variant of /api/chat (Server-Sent Events):
+    - input: { "text": "...", "tts": true, "tts_mode": "sentence" | "full", "session_id": "..." (optional) }
+    - events:
+      - `token`: { "text": "<chunk>" } as soon as the LLM produces it
+      - `audio_chunk` (tts_mode=sentence): { "index": i, "text": "<sentence>", "audio_path": "..." },
+        emitted in sentence order while the answer is still being generated
+      - `audio` (tts_mode=full): { "audio_path": "...", "tts_available": bool } after the answer is complete
+      - `done`:  { "answer": "<full answer>" }
+    """
+    data = request.get_json(force=True) or {}
+    user_text = data.get("text", "").strip()
+    if not user_text:
+        return jsonify({"error": "text is required"}), 400
+    want_tts = bool(data.get("tts", True))
+    pipelined = data.get("tts_mode", "sentence") != "full"
+    session_id = data.get("session_id")
+
+    logger.info(f"Web chat stream request: {user_text}")
+
+    def generate():
+        parts = []
+        sentences = SentenceBuffer(min_chars=settings.TTS_SENTENCE_MIN_CHARS)
+        pending = deque()  # (index, sentence, future), in sentence order
+        indices = itertools.count()
+
+        def submit(new_sentences):
+            for sentence in new_sentences:
+                pending.append((next(indices), sentence, _tts_executor.submit(tracing.bind(_request_tts, sentence))))
+
+        def drain(block: bool):
+            # Emit finished audio strictly in order; stop at the first unfinished one
+            while pending and (block or pending[0][2].done()):
+                index, sentence, future = pending.popleft()
+                yield _sse("audio_chunk", {"index": index, "text": sentence, "audio_path": future.result()})
+
+        for text in rag_engine.stream_answer(user_text, session_id=session_id):
+            parts.append(text)
+            yield _sse("token", {"text": text})
+            if want_tts and pipelined:
+                submit(sentences.feed(text))
+                yield from drain(block=False)
+
+        answer = "".join(parts).strip()
+        if want_tts and pipelined:
+            submit(sentences.flush())
+            yield from drain(block=True)
+        elif want_tts:
+            audio_path = _request_tts(answer)
+            yield _sse("audio", {"audio_path": audio_path, "tts_available": audio_path is not None})
+        yield _sse("done", {"answer": answer})
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 if __name__ == "__main__":
+    # Nạp model nền: server nhận kết nối ngay, /health báo 503 cho tới khi sẵn sàng
+    rag_engine.start_warm_up()
     app.run(host=settings.WEB_HOST, port=settings.WEB_PORT, debug=False)
 
 
@@ -0,0 +1,444 @@
+"""
+Async web server for BrainV2 (FastAPI / ASGI), same API as `web/app_server.py`.
+
+Differences from the Flask server:
+- RAG calls run on a bounded thread pool, so the event loop never blocks on
+  Gemini/Ollama.
+- TTS/STT calls use one pooled aiohttp session (keep-alive, proxy env ignored),
+  built by `src.utils.http_client.make_async_session`.
+- Requests beyond WEB_MAX_CONCURRENT running + WEB_MAX_QUEUE waiting are
+  rejected with 429 and a Retry-After header instead of piling up.
+- /ws is a full-duplex voice loop (see `web/voice_session.py`).
+- Every request is traced (X-Request-ID, per-stage spans, see
+  `src/utils/tracing.py`); /metrics exports the stage latency histograms.
+
+Run: `python -m web.asgi_server` (or WEB_SERVER=asgi with run_system.py).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+
+import aiohttp
+from fastapi import FastAPI, Request, WebSocket
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
+from fastapi.staticfiles import StaticFiles
+
+from src.core.llm_manager import llm_manager
+from src.core.rag_engine import rag_engine
+from src.utils.http_client import http_stats, make_async_session
+from src.utils.sentence_splitter import SentenceBuffer
+from src.utils import tracing
+from web.voice_session import ServerBusy, VoiceSession
+from config import settings
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+WEB_DIR = os.path.dirname(__file__)
+
+# Thread pool riêng cho RAG (embedding + Chroma + LLM đều là code đồng bộ)
+_rag_executor = ThreadPoolExecutor(max_workers=max(1, settings.WEB_RAG_WORKERS), thread_name_prefix="rag")
+# Prefetch chỉ là suy đoán: pool riêng, không chiếm thread của câu hỏi thật
+_prefetch_executor = ThreadPoolExecutor(max_workers=max(1, settings.PREFETCH_WORKERS), thread_name_prefix="prefetch")
+_http_session: Optional[aiohttp.ClientSession] = None
+
+
+class ConcurrencyLimiter:
+    """
+    Admit at most `max_running` requests at once, let `max_waiting` more wait,
+    and reject the rest immediately (backpressure instead of unbounded queueing).
+    """
+
+    def __init__(self, max_running: int, max_waiting: int):
+        self.max_running = max(1, max_running)
+        self.max_waiting = max(0, max_waiting)
+        self._semaphore = asyncio.Semaphore(self.max_running)
+        self.admitted = 0  # running + waiting
+        self.rejected = 0
+
+    def try_enter(self) -> bool:
+        if self.admitted >= self.max_running + self.max_waiting:
+            self.rejected += 1
+            return False
+        self.admitted += 1
+        return True
+
+    async def acquire(self) -> None:
+        await self._semaphore.acquire()
+
+    def release(self, acquired: bool = True) -> None:
+        if acquired:
+            self._semaphore.release()
+        self.admitted -= 1
+
+    def stats(self) -> dict:
+        return {
+            "admitted": self.admitted,
+            "max_running": self.max_running,
+            "max_waiting": self.max_waiting,
+            "rejected": self.rejected,
+        }
+
+
+class Admission:
+    """
+    One request admitted by `ConcurrencyLimiter.try_enter`. `release` is
+    idempotent, so both the response body and the response itself can call it.
+    """
+
+    def __init__(self, limiter: ConcurrencyLimiter):
+        self.limiter = limiter
+        self.acquired = False
+        self.released = False
+
+    async def acquire(self) -> None:
+        await self.limiter.acquire()
+        self.acquired = True
+
+    def release(self) -> None:
+        if not self.released:
+            self.released = True
+            self.limiter.release(self.acquired)
+
+
+class AdmittedStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse holding a limiter slot: the slot is given back when the
+    response ends, even if its body was never iterated (client gone, send error).
+    """
+
+    def __init__(self, content, admission: Admission, **kwargs):
+        super().__init__(content, **kwargs)
+        self.admission = admission
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.admission.release()
+
+
+limiter: Optional[ConcurrencyLimiter] = None
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Lifespan context manager for FastAPI startup/shutdown."""
+    global _http_session, limiter
+    limiter = ConcurrencyLimiter(settings.WEB_MAX_CONCURRENT, settings.WEB_MAX_QUEUE)
+    _http_session = make_async_session()
+    # Nạp model nền: server nhận kết nối ngay, /health báo 503 cho tới khi sẵn sàng
+    rag_engine.start_warm_up()
+    logger.info("Async web server is up, RAG engine is warming up.")
+    yield
+    await _http_session.close()
+    _http_session = None
+
+
+app = FastAPI(title="BrainV2 Web", version="0.1.0", lifespan=lifespan)
+app.mount("/static", StaticFiles(directory=os.path.join(WEB_DIR, "static")), name="static")
+app.add_middleware(tracing.TraceMiddleware)
+
+
+def _too_busy() -> JSONResponse:
+    return JSONResponse(
+        {"error": "server is busy, please retry"},
+        status_code=429,
+        headers={"Retry-After": str(settings.WEB_RETRY_AFTER)},
+    )
+
+
+def _sse(event: str, payload: dict) -> str:
+    """Format one Server-Sent Event."""
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+async def _request_tts(answer: str) -> Optional[str]:
+    """
+    Call TTS service for the given answer.
+    Returns the web-relative audio path, or None if TTS failed.
+    """
+    tts_host = "localhost" if settings.TTS_HOST == "0.0.0.0" else settings.TTS_HOST
+    tts_url = f"http://{tts_host}:{settings.TTS_PORT}/speak"
+    try:
+        with tracing.span("tts_request"):
+            async with _http_session.get(
+                tts_url,
+                params={"text": answer},
+                headers=tracing.outgoing_headers(),
+                timeout=aiohttp.ClientTimeout(total=60),
+            ) as r:
+                r.raise_for_status()
+                audio_path = (await r.json()).get("audio_path")
+            logger.info(f"TTS audio generated: {audio_path}")
+            return audio_path
+    except aiohttp.ClientResponseError as e:
+        logger.warning(f"TTS service returned error: {e.status}")
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        logger.warning(f"TTS service connection error: {e}")
+    except Exception as e:
+        logger.error(f"TTS service call failed: {e}", exc_info=True)
+    return None
+
+
+async def _iterate_in_thread(sync_iter_factory) -> AsyncIterator[str]:
+    """
+    Run a blocking generator on the RAG pool and yield its items on the event loop.
+    If the consumer stops early (client gone, barge-in), the generator is closed
+    at its next item instead of running to the end.
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    done = object()
+    stop = threading.Event()
+
+    def run():
+        try:
+            for item in sync_iter_factory():
+                if stop.is_set():
+                    break
+                loop.call_soon_threadsafe(queue.put_nowait, item)
+        except Exception as e:
+            loop.call_soon_threadsafe(queue.put_nowait, e)
+        finally:
+            loop.call_soon_threadsafe(queue.put_nowait, done)
+
+    future = loop.run_in_executor(_rag_executor, tracing.bind(run))
+    try:
+        while True:
+            item = await queue.get()
+            if item is done:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stop.set()
+    await future
+
+
+async def _prefetch(session_id: str, text: str) -> bool:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_prefetch_executor, rag_engine.prefetch, session_id, text)
+
+
+async def _limited_answer_stream(question: str, session_id: Optional[str] = None) -> AsyncIterator[str]:
+    """Answer stream for WebSocket turns, admitted through the same limiter as HTTP."""
+    if not limiter.try_enter():
+        raise ServerBusy()
+    acquired = False
+    try:
+        await limiter.acquire()
+        acquired = True
+        async for text in _iterate_in_thread(lambda: rag_engine.stream_answer(question, session_id=session_id)):
+            yield text
+    finally:
+        limiter.release(acquired)
+
+
+async def _read_text(request: Request) -> tuple[Optional[dict], str]:
+    try:
+        data = await request.json()
+    except ValueError:
+        data = None
+    return data or {}, ((data or {}).get("text") or "").strip()
+
+
+@app.get("/")
+async def index():
+    return FileResponse(os.path.join(WEB_DIR, "templates", "index.html"))
+
+
+@app.get("/test")
+async def test():
+    """Test endpoint to verify server is running."""
+    return {"status": "ok", "message": "Server is running"}
+
+
+@app.get("/health")
+async def health():
+    """Readiness probe: 200 once the RAG engine has warmed up, 503 before (or if warm-up failed)."""
+    payload = rag_engine.health()
+    return JSONResponse(payload, status_code=200 if payload["status"] == "ready" else 503)
+
+
+@app.get("/api/test-rag")
+async def test_rag():
+    """Test endpoint to verify RAG engine is working."""
+    try:
+        test_question = "Xin chào"
+        loop = asyncio.get_running_loop()
+        answer = await loop.run_in_executor(_rag_executor, rag_engine.get_answer, test_question)
+        return {
+            "status": "ok",
+            "rag_engine": "connected",
+            "test_question": test_question,
+            "answer": answer[:100] if answer else "No answer",
+        }
+    except Exception as e:
+        logger.error(f"RAG test error: {e}", exc_info=True)
+        return JSONResponse({"status": "error", "rag_engine": "error", "error": str(e)}, status_code=500)
+
+
+@app.get("/api/llm/stats")
+async def llm_stats():
+    """Per-backend rolling latency, error rate and circuit state."""
+    return llm_manager.stats()
+
+
+@app.get("/api/cache/stats")
+async def cache_stats():
+    """Answer cache hit/miss counters and admission stats."""
+    return {**rag_engine.cache_stats(), "limiter": limiter.stats()}
+
+
+@app.get("/api/http/stats")
+async def http_pool_stats():
+    """Per-host HTTP pool usage and connection-wait metrics."""
+    return http_stats()
+
+
+@app.get("/metrics")
+async def metrics():
+    """Per-stage latency histograms in the Prometheus text format."""
+    return Response(tracing.render_metrics(), media_type=tracing.METRICS_CONTENT_TYPE)
+
+
+@app.post("/api/chat")
+async def api_chat(request: Request):
+    """
+    Main API:
+    - input: { "text": "..." }
+    - output: { "answer": "...", "audio_path": "audio_cache/xxx.mp3" }
+    """
+    data, user_text = await _read_text(request)
+    if not user_text:
+        return JSONResponse({"error": "text is required"}, status_code=400)
+
+    if not limiter.try_enter():
+        return _too_busy()
+    acquired = False
+    try:
+        await limiter.acquire()
+        acquired = True
+        logger.info(f"Web chat request: {user_text}")
+        loop = asyncio.get_running_loop()
+        answer = await loop.run_in_executor(
+            _rag_executor, tracing.bind(rag_engine.get_answer, user_text, session_id=data.get("session_id"))
+        )
+        audio_path = await _request_tts(answer)
+    finally:
+        limiter.release(acquired)
+
+    # Always return answer, even if TTS failed
+    return {"answer": answer, "audio_path": audio_path, "tts_available": audio_path is not None}
+
+
+@app.post("/api/prefetch")
+async def api_prefetch(request: Request):
+    """Speculative retrieval for an interim transcript (same contract as the Flask server)."""
+    try:
+        data = await request.json()
+    except ValueError:
+        data = None
+    data = data or {}
+    session_id = (data.get("session_id") or "").strip()
+    text = (data.get("text") or "").strip()
+    if not session_id or not text:
+        return JSONResponse({"error": "session_id and text are required"}, status_code=400)
+    return {"prefetched": await _prefetch(session_id, text)}
+
+
+@app.post("/api/chat/stream")
+async def api_chat_stream(request: Request):
+    """
+    Streaming variant of /api/chat (Server-Sent Events), same events as the Flask server:
+    `token`, `audio_chunk` (tts_mode=sentence) or `audio` (tts_mode=full), then `done`.
+    """
+    data, user_text = await _read_text(request)
+    if not user_text:
+        return JSONResponse({"error": "text is required"}, status_code=400)
+    want_tts = bool(data.get("tts", True))
+    pipelined = data.get("tts_mode", "sentence") != "full"
+    session_id = data.get("session_id")
+
+    # Từ chối ngay bằng 429; slot được trả khi body kết thúc hoặc khi response kết thúc
+    if not limiter.try_enter():
+        return _too_busy()
+    admission = Admission(limiter)
+
+    logger.info(f"Web chat stream request: {user_text}")
+
+    async def generate():
+        tts_semaphore = asyncio.Semaphore(max(1, settings.TTS_MAX_PARALLEL))
+        pending = []  # (sentence, task), in sentence order
+        sent = 0
+
+        async def tts_limited(sentence: str):
+            async with tts_semaphore:
+                return await _request_tts(sentence)
+
+        try:
+            await admission.acquire()
+            parts = []
+            sentences = SentenceBuffer(min_chars=settings.TTS_SENTENCE_MIN_CHARS)
+
+            async for text in _iterate_in_thread(lambda: rag_engine.stream_answer(user_text, session_id=session_id)):
+                parts.append(text)
+                yield _sse("token", {"text": text})
+                if want_tts and pipelined:
+                    for sentence in sentences.feed(text):
+                        pending.append((sentence, asyncio.create_task(tts_limited(sentence))))
+                    # Emit finished audio strictly in order
+                    while sent < len(pending) and pending[sent][1].done():
+                        sentence, task = pending[sent]
+                        yield _sse("audio_chunk", {"index": sent, "text": sentence, "audio_path": task.result()})
+                        sent += 1
+
+            answer = "".join(parts).strip()
+            if want_tts and pipelined:
+                for sentence in sentences.flush():
+                    pending.append((sentence, asyncio.create_task(tts_limited(sentence))))
+                while sent < len(pending):
+                    sentence, task = pending[sent]
+                    yield _sse("audio_chunk", {"index": sent, "text": sentence, "audio_path": await task})
+                    sent += 1
+            elif want_tts:
+                audio_path = await _request_tts(answer)
+                yield _sse("audio", {"audio_path": audio_path, "tts_available": audio_path is not None})
+            yield _sse("done", {"answer": answer})
+        finally:
+            for _, task in pending[sent:]:
+                task.cancel()
+            admission.release()
+
+    return AdmittedStreamingResponse(
+        generate(),
+        admission,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.websocket("/ws")
+async def websocket_voice(websocket: WebSocket):
+    """Voice loop: microphone PCM in, transcripts, answer tokens and TTS audio out."""
+    await VoiceSession(websocket, _http_session, _limited_answer_stream, prefetch=_prefetch).run()
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run(
+        "web.asgi_server:app",
+        host=settings.WEB_HOST,
+        port=settings.WEB_PORT,
+        reload=False,
+    )
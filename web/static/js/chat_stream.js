@@ -0,0 +1,123 @@
+// Text chat over /api/chat/stream (Server-Sent Events, Flask and ASGI servers):
+// answer tokens as they are generated, then one `audio_chunk` per sentence,
+// played strictly in `index` order.
+
+// Phát lần lượt các URL audio, bài sau chờ bài trước kết thúc;
+// onPlayingChange(true/false) khi bắt đầu phát / phát hết hoặc bị dừng
+export class AudioQueue {
+    constructor(onPlayingChange = null) {
+        this.onPlayingChange = onPlayingChange;
+        this.queue = [];     // [{ url, revoke }]
+        this.playing = null;
+    }
+
+    _setPlaying(audio) {
+        const was = this.playing !== null;
+        this.playing = audio;
+        if (this.onPlayingChange && was !== (audio !== null)) this.onPlayingChange(audio !== null);
+    }
+
+    // revoke: URL tạo bằng URL.createObjectURL, cần giải phóng sau khi phát
+    enqueue(url, revoke = false) {
+        this.queue.push({ url, revoke });
+        if (!this.playing) this._playNext();
+    }
+
+    _playNext() {
+        const item = this.queue.shift();
+        if (!item) { this._setPlaying(null); return; }
+        const audio = new Audio(item.url);
+        this._setPlaying(audio);
+        let finished = false;
+        const next = () => {
+            if (finished || this.playing !== audio) return;
+            finished = true;
+            if (item.revoke) URL.revokeObjectURL(item.url);
+            this._playNext();
+        };
+        audio.onended = audio.onerror = next;
+        audio.play().catch((e) => { console.log('Audio play failed:', e); next(); });
+    }
+
+    stop() {
+        if (this.playing) this.playing.pause();
+        this.queue.forEach((item) => { if (item.revoke) URL.revokeObjectURL(item.url); });
+        this.queue = [];
+        this._setPlaying(null);
+    }
+}
+
+// Tách luồng SSE thành các sự kiện { event, data }
+function parseEvent(block) {
+    let event = 'message';
+    const data = [];
+    for (const line of block.split('\n')) {
+        if (line.startsWith('event:')) event = line.slice(6).trim();
+        else if (line.startsWith('data:')) data.push(line.slice(5).trimStart());
+    }
+    return data.length ? { event, data: JSON.parse(data.join('\n')) } : null;
+}
+
+export class ChatStream {
+    constructor(onEvent) {
+        this.onEvent = onEvent;
+        this.player = new AudioQueue();
+        this.controller = null;
+    }
+
+    cancel() {
+        if (this.controller) this.controller.abort();
+        this.controller = null;
+        this.player.stop();
+    }
+
+    // Gửi câu hỏi và đọc luồng SSE; onEvent nhận { event, data } theo thứ tự server gửi
+    async send(text, options = {}) {
+        this.cancel();
+        const controller = new AbortController();
+        this.controller = controller;
+        const response = await fetch('/api/chat/stream', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ text, ...options }),
+            signal: controller.signal,
+        });
+        if (!response.ok || !response.body) {
+            throw new Error(`HTTP ${response.status}`);
+        }
+
+        const pending = new Map();  // index -> audio_path, chờ tới lượt phát
+        let nextIndex = 0;
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        try {
+            while (true) {
+                const { value, done } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true }).replace(/\r\n/g, '\n');
+                let end;
+                while ((end = buffer.indexOf('\n\n')) !== -1) {
+                    const message = parseEvent(buffer.slice(0, end));
+                    buffer = buffer.slice(end + 2);
+                    if (!message) continue;
+                    if (message.event === 'audio_chunk') {
+                        pending.set(message.data.index, message.data.audio_path);
+                        // Câu TTS lỗi có audio_path = null: bỏ qua nhưng vẫn giữ thứ tự
+                        while (pending.has(nextIndex)) {
+                            const path = pending.get(nextIndex);
+                            pending.delete(nextIndex);
+                            if (path) this.player.enqueue(`/static/${path}`);
+                            nextIndex++;
+                        }
+                    } else if (message.event === 'audio' && message.data.audio_path) {
+                        this.player.enqueue(`/static/${message.data.audio_path}`);
+                    }
+                    this.onEvent(message);
+                }
+            }
+        } finally {
+            if (this.controller === controller) this.controller = null;
+        }
+    }
+}
@@ -0,0 +1,109 @@
+// Voice loop client for the /ws endpoint (ASGI server, see web/voice_session.py).
+// Streams microphone PCM (16-bit mono) up, receives transcripts, answer tokens
+// and MP3 audio per sentence down, and plays the audio in order.
+
+import { AudioQueue } from '/static/js/chat_stream.js';
+
+export class VoiceLoop {
+    constructor(onEvent) {
+        this.onEvent = onEvent;
+        this.ws = null;
+        this.sampleRate = 16000;
+        this.audioHeader = null;   // header của frame MP3 sắp tới
+        // Báo server khi audio còn đang phát: khách nói lúc này cũng là ngắt lời (barge-in)
+        this.player = new AudioQueue((playing) => this._send({ type: 'playback', playing }));
+        this.mic = null;
+    }
+
+    // Mở WebSocket; trả về false nếu server không hỗ trợ (ví dụ server Flask)
+    connect() {
+        return new Promise((resolve) => {
+            const proto = location.protocol === 'https:' ? 'wss' : 'ws';
+            const ws = new WebSocket(`${proto}://${location.host}/ws`);
+            ws.binaryType = 'arraybuffer';
+            let opened = false;
+            ws.onmessage = (event) => this._onMessage(event, () => { opened = true; resolve(true); });
+            ws.onerror = () => { if (!opened) resolve(false); };
+            ws.onclose = () => { this.ws = null; if (!opened) resolve(false); };
+            this.ws = ws;
+        });
+    }
+
+    get connected() {
+        return this.ws !== null && this.ws.readyState === WebSocket.OPEN;
+    }
+
+    _send(payload) {
+        if (this.connected) this.ws.send(JSON.stringify(payload));
+    }
+
+    sendText(text) {
+        this._send({ type: 'text', text });
+    }
+
+    cancel() {
+        this._send({ type: 'cancel' });
+        this._stopPlayback();
+    }
+
+    async startMic() {
+        const stream = await navigator.mediaDevices.getUserMedia({
+            audio: { channelCount: 1, echoCancellation: true, noiseSuppression: true },
+        });
+        // Trình duyệt tự resample về sampleRate của AudioContext
+        const ctx = new AudioContext({ sampleRate: this.sampleRate });
+        const source = ctx.createMediaStreamSource(stream);
+        const processor = ctx.createScriptProcessor(1024, 1, 1);
+        processor.onaudioprocess = (event) => {
+            if (!this.connected) return;
+            const input = event.inputBuffer.getChannelData(0);
+            const pcm = new Int16Array(input.length);
+            for (let i = 0; i < input.length; i++) {
+                const s = Math.max(-1, Math.min(1, input[i]));
+                pcm[i] = s < 0 ? s * 0x8000 : s * 0x7fff;
+            }
+            this.ws.send(pcm.buffer);
+        };
+        source.connect(processor);
+        processor.connect(ctx.destination);
+        this.mic = { stream, ctx, source, processor };
+    }
+
+    stopMic() {
+        if (!this.mic) return;
+        const { stream, ctx, source, processor } = this.mic;
+        processor.disconnect();
+        source.disconnect();
+        stream.getTracks().forEach((track) => track.stop());
+        ctx.close();
+        this.mic = null;
+        this._send({ type: 'end_utterance' });
+    }
+
+    _onMessage(event, onReady) {
+        if (event.data instanceof ArrayBuffer) {
+            const header = this.audioHeader;
+            this.audioHeader = null;
+            if (header) this._enqueueAudio(new Blob([event.data], { type: 'audio/mpeg' }));
+            return;
+        }
+        const message = JSON.parse(event.data);
+        if (message.type === 'ready') {
+            this.sampleRate = message.sample_rate || this.sampleRate;
+            onReady();
+        } else if (message.type === 'audio' && message.bytes > 0) {
+            this.audioHeader = message;
+        } else if (message.type === 'interrupted' || message.type === 'cancelled') {
+            this._stopPlayback();
+        }
+        this.onEvent(message);
+    }
+
+    _enqueueAudio(blob) {
+        this.player.enqueue(URL.createObjectURL(blob), true);
+    }
+
+    _stopPlayback() {
+        this.player.stop();
+    }
+}
@@ -0,0 +1,420 @@
+"""
+Full-duplex voice session over one WebSocket (served by `web/asgi_server.py` at /ws).
+
+Client -> server:
+- binary frames: 16-bit little-endian mono PCM at VOICE_SAMPLE_RATE (microphone)
+- text frames (JSON):
+  {"type": "config", "tts": bool}      enable/disable spoken answers
+  {"type": "text", "text": "..."}      typed question (skips STT)
+  {"type": "end_utterance"}            push-to-talk released: endpoint now
+  {"type": "cancel"}                   stop the current answer
+  {"type": "playback", "playing": bool} answer audio started / finished playing
+
+Server -> client (JSON text frames unless noted):
+  ready, vad {state: speech|silence}, partial {text}, final {text},
+  token {text}, audio {index, text, bytes} followed by one binary MP3 frame
+  when bytes > 0, done {answer}, interrupted, cancelled, error {message}
+
+Endpointing is done here with an energy VAD. While the visitor speaks, the
+new audio is forwarded every VOICE_PARTIAL_INTERVAL_MS to the STT service's
+/ws/transcribe (`SttStream`), which keeps the committed prefix of the
+transcript and decodes only the uncommitted tail for interim captions; when
+the VAD closes the utterance, only what is left is decoded for the final
+transcript (the whole utterance is decoded in one request if the stream is
+unavailable or interim captions are off). Interim captions also trigger
+speculative retrieval for this session (see `src/core/prefetch.py`), so the
+final question often only waits for the LLM.
+Speech starting while an answer is being sent, or while the client is still
+playing its audio (as reported by "playback" messages), interrupts that
+answer (barge-in).
+Each turn is traced under its own request ID, sent along to STT and TTS.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import time
+import uuid
+from typing import AsyncIterator, Awaitable, Callable, Optional
+
+import aiohttp
+from fastapi import WebSocket, WebSocketDisconnect
+
+from src.utils.sentence_splitter import SentenceBuffer
+from src.utils import tracing
+from src.utils.vad import SPEECH_START, Endpointer
+from config import settings
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class ServerBusy(Exception):
+    """Raised by the answer stream when the server refuses more work."""
+
+
+# Kết nối tới STT chậm hơn mức này thì bỏ phụ đề tạm cho câu này
+_STT_CONNECT_TIMEOUT_S = 2.0
+
+
+def _service_url(host: str, port: int, path: str) -> str:
+    # Sử dụng localhost thay vì 0.0.0.0 để tránh lỗi proxy
+    host = "localhost" if host == "0.0.0.0" else host
+    return f"http://{host}:{port}{path}"
+
+
+class SttStream:
+    """
+    One utterance streamed to the STT service's /ws/transcribe (see
+    `servers/stt_streaming.py`): interim hypotheses go to `on_partial`, and
+    `finish` sends the rest of the audio and returns the final transcript
+    (None if the stream broke).
+    """
+
+    def __init__(self, http: aiohttp.ClientSession, on_partial: Callable[["SttStream", str], Awaitable[None]]):
+        self.http = http
+        self.on_partial = on_partial
+        self.sent = 0  # bytes of the utterance already sent
+        self._ws: Optional[aiohttp.ClientWebSocketResponse] = None
+        self._reader: Optional[asyncio.Task] = None
+        self._final: Optional[asyncio.Future] = None
+
+    async def open(self) -> None:
+        url = _service_url(settings.STT_HOST, settings.STT_PORT, "/ws/transcribe")
+        self._ws = await self.http.ws_connect(
+            url, params={"sample_rate": str(settings.VOICE_SAMPLE_RATE)}, headers=tracing.outgoing_headers()
+        )
+        self._final = asyncio.get_running_loop().create_future()
+        self._reader = asyncio.create_task(self._read())
+
+    async def send(self, pcm: bytes) -> None:
+        if pcm:
+            await self._ws.send_bytes(pcm)
+            self.sent += len(pcm)
+
+    async def finish(self, pcm: bytes) -> Optional[str]:
+        await self.send(pcm)
+        await self._ws.send_str(json.dumps({"type": "end"}))
+        return await self._final
+
+    async def close(self) -> None:
+        if self._reader is not None:
+            self._reader.cancel()
+        if self._ws is not None and not self._ws.closed:
+            await self._ws.close()
+
+    def _resolve(self, text: Optional[str]) -> None:
+        if self._final is not None and not self._final.done():
+            self._final.set_result(text)
+
+    async def _read(self) -> None:
+        try:
+            async for message in self._ws:
+                if message.type != aiohttp.WSMsgType.TEXT:
+                    continue
+                data = json.loads(message.data)
+                kind = data.get("type")
+                if kind == "partial":
+                    text = f"{data.get('stable', '')} {data.get('unstable', '')}".strip()
+                    if text:
+                        await self.on_partial(self, text)
+                elif kind == "final":
+                    self._resolve(data.get("text") or "")
+                elif kind == "error":
+                    logger.warning(f"STT stream error: {data.get('message')}")
+                    self._resolve(None)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.debug(f"STT stream failed: {e}")
+        finally:
+            self._resolve(None)
+
+
+class VoiceSession:
+    def __init__(
+        self,
+        websocket: WebSocket,
+        http: aiohttp.ClientSession,
+        answer_stream: Callable[[str, Optional[str]], AsyncIterator[str]],
+        prefetch: Optional[Callable[[str, str], Awaitable[bool]]] = None,
+    ):
+        """
+        answer_stream(question, session_id) yields answer text;
+        prefetch(session_id, partial_text) warms retrieval for an interim transcript.
+        """
+        self.ws = websocket
+        self.http = http
+        self.answer_stream = answer_stream
+        self.prefetch = prefetch
+        self.session_id = uuid.uuid4().hex
+        self.want_tts = True
+        self.endpointer = Endpointer(
+            sample_rate=settings.VOICE_SAMPLE_RATE,
+            threshold=settings.VOICE_VAD_THRESHOLD,
+            min_rms=settings.VOICE_VAD_MIN_RMS,
+            silence_ms=settings.VOICE_ENDPOINT_SILENCE_MS,
+            max_utterance_s=settings.VOICE_MAX_UTTERANCE_S,
+        )
+
+        self._send_lock = asyncio.Lock()
+        self._turn: Optional[asyncio.Task] = None
+        self._answering = False
+        self._client_playing = False
+        self._stt: Optional[SttStream] = None  # stream of the utterance in progress
+        self._last_partial = 0.0
+        self._prefetching: Optional[asyncio.Task] = None
+
+    # --- Sending ---
+
+    async def _send(self, payload: dict, data: Optional[bytes] = None) -> None:
+        # Header JSON và frame nhị phân đi liền nhau, không bị task khác chen vào
+        async with self._send_lock:
+            await self.ws.send_text(json.dumps(payload, ensure_ascii=False))
+            if data:
+                await self.ws.send_bytes(data)
+
+    # --- Main loop ---
+
+    async def run(self) -> None:
+        await self.ws.accept()
+        await self._send({"type": "ready", "sample_rate": settings.VOICE_SAMPLE_RATE})
+        try:
+            while True:
+                message = await self.ws.receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+                if message.get("bytes"):
+                    await self._on_audio(message["bytes"])
+                elif message.get("text"):
+                    await self._on_control(message["text"])
+        except WebSocketDisconnect:
+            pass
+        finally:
+            await self._drop_stt()
+            self._cancel_turn()
+            if self._prefetching is not None:
+                self._prefetching.cancel()
+            logger.info("Voice session closed.")
+
+    async def _on_audio(self, pcm: bytes) -> None:
+        for event, utterance in self.endpointer.feed(pcm):
+            if event == SPEECH_START:
+                if self._answering or self._client_playing:
+                    self._cancel_turn()
+                    self._client_playing = False
+                    await self._send({"type": "interrupted"})
+                await self._send({"type": "vad", "state": "speech"})
+                await self._open_stt()
+            else:
+                await self._send({"type": "vad", "state": "silence"})
+                await self._end_utterance(utterance)
+
+        interval = settings.VOICE_PARTIAL_INTERVAL_MS / 1000
+        now = time.monotonic()
+        if self._stt is not None and self.endpointer.in_speech and now - self._last_partial >= interval:
+            self._last_partial = now
+            try:
+                await self._stt.send(self.endpointer.current(self._stt.sent))
+            except Exception as e:
+                logger.debug(f"STT stream send failed, interim captions off for this utterance: {e}")
+                await self._drop_stt()
+
+    async def _on_control(self, raw: str) -> None:
+        try:
+            message = json.loads(raw)
+        except ValueError:
+            await self._send({"type": "error", "message": "invalid JSON"})
+            return
+
+        kind = message.get("type")
+        if kind == "config":
+            self.want_tts = bool(message.get("tts", self.want_tts))
+        elif kind == "text":
+            question = (message.get("text") or "").strip()
+            if question:
+                self._start_turn(question=question)
+        elif kind == "end_utterance":
+            was_speaking = self.endpointer.in_speech
+            utterance = self.endpointer.flush()
+            if was_speaking:
+                await self._send({"type": "vad", "state": "silence"})
+            await self._end_utterance(utterance)
+        elif kind == "playback":
+            self._client_playing = bool(message.get("playing"))
+        elif kind == "cancel":
+            self._cancel_turn()
+            await self._send({"type": "cancelled"})
+        else:
+            await self._send({"type": "error", "message": f"unknown message type: {kind}"})
+
+    # --- Turns ---
+
+    async def _end_utterance(self, utterance: Optional[bytes]) -> None:
+        stream, self._stt = self._stt, None
+        if utterance:
+            self._start_turn(utterance=utterance, stream=stream)
+        elif stream is not None:
+            await stream.close()
+
+    def _start_turn(
+        self, utterance: Optional[bytes] = None, question: Optional[str] = None, stream: Optional[SttStream] = None
+    ) -> None:
+        self._cancel_turn()
+        self._turn = asyncio.create_task(self._run_turn(utterance, question, stream))
+        if stream is not None:
+            # Task bị hủy trước khi chạy thì finally trong _final_transcript không chạy
+            self._turn.add_done_callback(lambda _: asyncio.ensure_future(stream.close()))
+
+    def _cancel_turn(self) -> None:
+        if self._turn is not None and not self._turn.done():
+            self._turn.cancel()
+        self._answering = False
+
+    async def _open_stt(self) -> None:
+        await self._drop_stt()
+        if settings.VOICE_PARTIAL_INTERVAL_MS <= 0:
+            return
+        stream = SttStream(self.http, self._on_partial)
+        try:
+            await asyncio.wait_for(stream.open(), _STT_CONNECT_TIMEOUT_S)
+        except Exception as e:
+            logger.debug(f"Could not open STT stream, no interim captions for this utterance: {e}")
+            await stream.close()
+            return
+        self._stt = stream
+        self._last_partial = time.monotonic()
+
+    async def _drop_stt(self) -> None:
+        stream, self._stt = self._stt, None
+        if stream is not None:
+            await stream.close()
+
+    async def _run_turn(self, utterance: Optional[bytes], question: Optional[str], stream: Optional[SttStream]) -> None:
+        try:
+            with tracing.trace(name="voice turn"):
+                if question is None:
+                    question = await self._final_transcript(utterance, stream)
+                    await self._send({"type": "final", "text": question})
+                    if not question:
+                        return
+                logger.info(f"Voice question: {question}")
+                self._answering = True
+                await self._answer(question)
+        except asyncio.CancelledError:
+            raise
+        except ServerBusy:
+            await self._send({"type": "error", "message": "server is busy, please retry"})
+        except Exception as e:
+            logger.error(f"Voice turn failed: {e}", exc_info=True)
+            await self._send({"type": "error", "message": str(e)})
+        finally:
+            if self._turn is asyncio.current_task():
+                self._answering = False
+
+    async def _final_transcript(self, utterance: bytes, stream: Optional[SttStream]) -> str:
+        """Finish the utterance's STT stream (only the uncommitted tail is decoded), else decode it whole."""
+        if stream is not None:
+            try:
+                with tracing.span("stt_request"):
+                    text = await stream.finish(utterance[stream.sent:])
+                if text is not None:
+                    return text.strip()
+                logger.warning("STT stream gave no transcript, decoding the whole utterance.")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"STT stream failed ({e}), decoding the whole utterance.")
+            finally:
+                await stream.close()
+        return await self._transcribe(utterance)
+
+    async def _on_partial(self, stream: SttStream, text: str) -> None:
+        # Chỉ phụ đề của câu đang nói; câu đã kết thúc thì bỏ qua
+        if stream is not self._stt or not self.endpointer.in_speech:
+            return
+        await self._send({"type": "partial", "text": text})
+        self._start_prefetch(text)
+
+    def _start_prefetch(self, text: str) -> None:
+        # Một lần prefetch mỗi phiên tại một thời điểm; phụ đề đến khi đang bận thì bỏ qua
+        if self.prefetch is None or (self._prefetching is not None and not self._prefetching.done()):
+            return
+
+        async def run() -> None:
+            try:
+                await self.prefetch(self.session_id, text)
+            except Exception as e:
+                logger.debug(f"Prefetch failed: {e}")
+
+        self._prefetching = asyncio.create_task(run())
+
+    async def _answer(self, question: str) -> None:
+        tts_semaphore = asyncio.Semaphore(max(1, settings.TTS_MAX_PARALLEL))
+        pending = []  # (sentence, task), in sentence order
+        sent = 0
+
+        async def tts_limited(sentence: str) -> Optional[bytes]:
+            async with tts_semaphore:
+                return await self._tts(sentence)
+
+        async def emit_audio(wait: bool) -> None:
+            # Gửi audio đúng thứ tự câu
+            nonlocal sent
+            while sent < len(pending) and (wait or pending[sent][1].done()):
+                sentence, task = pending[sent]
+                audio = await task
+                await self._send(
+                    {"type": "audio", "index": sent, "text": sentence, "bytes": len(audio or b"")},
+                    audio,
+                )
+                sent += 1
+
+        try:
+            parts = []
+            sentences = SentenceBuffer(min_chars=settings.TTS_SENTENCE_MIN_CHARS)
+            async for text in self.answer_stream(question, self.session_id):
+                parts.append(text)
+                await self._send({"type": "token", "text": text})
+                if self.want_tts:
+                    for sentence in sentences.feed(text):
+                        pending.append((sentence, asyncio.create_task(tts_limited(sentence))))
+                    await emit_audio(wait=False)
+
+            answer = "".join(parts).strip()
+            if self.want_tts:
+                for sentence in sentences.flush():
+                    pending.append((sentence, asyncio.create_task(tts_limited(sentence))))
+                await emit_audio(wait=True)
+            await self._send({"type": "done", "answer": answer})
+        finally:
+            for _, task in pending[sent:]:
+                task.cancel()
+
+    # --- STT / TTS services ---
+
+    async def _transcribe(self, pcm: bytes) -> str:
+        url = _service_url(settings.STT_HOST, settings.STT_PORT, "/transcribe/pcm")
+        with tracing.span("stt_request"):
+            async with self.http.post(
+                url,
+                data=pcm,
+                params={"sample_rate": str(settings.VOICE_SAMPLE_RATE)},
+                headers={"Content-Type": "application/octet-stream", **tracing.outgoing_headers()},
+            ) as r:
+                r.raise_for_status()
+                return ((await r.json()).get("text") or "").strip()
+
+    async def _tts(self, sentence: str) -> Optional[bytes]:
+        url = _service_url(settings.TTS_HOST, settings.TTS_PORT, "/speak/stream")
+        try:
+            with tracing.span("tts_request"):
+                async with self.http.get(url, params={"text": sentence}, headers=tracing.outgoing_headers()) as r:
+                    r.raise_for_status()
+                    return await r.read()
+        except aiohttp.ClientResponseError as e:
+            logger.warning(f"TTS service returned error: {e.status}")
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.warning(f"TTS service connection error: {e}")
+        return None